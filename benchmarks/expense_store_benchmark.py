@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式费用记录存储基准测试 - 比较dict列表与 ExpenseStore 的内存占用和汇总耗时
+
+用法（在项目根目录下运行）:
+    python benchmarks/expense_store_benchmark.py [--expenses 100000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.expense_stats import StatsAggregator
+from modules.expense_store import ExpenseStore
+from modules.optional_deps import numpy
+from project_format_benchmark import make_project
+
+
+def measure_memory(build):
+    """构建对象并返回 (对象, 占用的字节数)"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def timed(func) -> float:
+    """运行一次，返回耗时（毫秒）"""
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(expense_count: int):
+    # 与从项目文件读入时一样，每条记录的字符串都是独立的对象
+    text = json.dumps(make_project(expense_count)['expenses'], ensure_ascii=False)
+
+    rows, list_bytes = measure_memory(lambda: json.loads(text))
+    store, store_bytes = measure_memory(lambda: ExpenseStore(json.loads(text)))
+
+    print(f"费用记录数: {expense_count}（numpy: {'已安装' if numpy() is not None else '未安装'}）")
+    print(f"{'':<16}{'内存(MB)':>10}{'每条(字节)':>12}{'统计(ms)':>10}{'ID列(ms)':>10}")
+    for name, expenses, size in (('dict列表', rows, list_bytes), ('ExpenseStore', store, store_bytes)):
+        stats_ms = timed(lambda: StatsAggregator().rebuild(expenses))
+        if isinstance(expenses, ExpenseStore):
+            id_ms = timed(lambda: expenses.column('id'))
+        else:
+            id_ms = timed(lambda: [exp.get('id') for exp in expenses])
+        print(f"{name:<16}{size / 1024 / 1024:>10.1f}{size / expense_count:>12.0f}{stats_ms:>10.1f}{id_ms:>10.1f}")
+
+    print(f"内存减少 {list_bytes / store_bytes:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较dict列表与列式存储的内存占用")
+    parser.add_argument('--expenses', type=int, default=100000, help="费用记录数（默认100000）")
+    args = parser.parse_args()
+    run(args.expenses)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+费用导入基准测试 - 比较逐条 add_expense（每条保存一次）与从CSV批量导入的每秒行数
+
+生成的CSV混合了按公式计算、按 数量×单价 计算和直接给出总金额的记录，以及少量错误行。
+
+用法（在项目根目录下运行）:
+    python benchmarks/import_benchmark.py [--rows 50000] [--baseline 500]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.file_manager import FileManager
+from modules.expense_importer import ExpenseImporter, iter_csv_expenses
+
+
+def write_csv(path: str, row_count: int):
+    """生成测试用的导入文件（约1%的行缺少名称）"""
+    rng = random.Random(42)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['日期', '类型', '名称', '数量', '单价', '总金额', '备注', '公式', '参数:hours', '参数:hourly_rate'])
+        for i in range(row_count):
+            day = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            name = '' if i % 100 == 99 else f"费用{i}"
+            kind = i % 3
+            if kind == 0:
+                writer.writerow([day, '人力成本', name, '', '', '', '', 'labor_cost',
+                                 rng.randint(1, 40), rng.choice([80, 120, 200])])
+            elif kind == 1:
+                writer.writerow([day, '材料费', name, rng.randint(1, 100), round(rng.uniform(1, 500), 2),
+                                 '', '采购', '', '', ''])
+            else:
+                writer.writerow([day, '其他费用', name, '', '', round(rng.uniform(10, 5000), 2), '', '', '', ''])
+
+
+def run(row_count: int, baseline_count: int):
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        csv_path = os.path.join(work_dir, 'expenses.csv')
+        write_csv(csv_path, max(row_count, baseline_count))
+        fm = FileManager()
+
+        # 逐条添加，每条之后保存项目文件
+        fm.create_project('逐条添加')
+        fm.open_project('逐条添加')
+        fm.autosave_delay = 0
+        rows = []
+        for expense in iter_csv_expenses(csv_path):
+            if len(rows) >= baseline_count:
+                break
+            if expense.get('name'):
+                rows.append(expense)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for expense in rows:
+                params = {key: float(value) for key, value in expense.pop('params', {}).items()}
+                if params:
+                    expense.update(params=params, total_amount=params['hours'] * params['hourly_rate'])
+                elif 'total_amount' not in expense:
+                    expense['total_amount'] = float(expense['quantity']) * float(expense['unit_price'])
+                fm.add_expense(expense)
+            one_by_one = time.perf_counter() - start
+        fm.close_project()
+        print(f"逐条 add_expense: {len(rows)} 行，{len(rows) / one_by_one:.0f} 行/秒")
+
+        # 批量导入，一次保存
+        fm.create_project('批量导入')
+        fm.open_project('批量导入')
+        writes = fm.get_write_stats()['total_writes']
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = ExpenseImporter(fm).import_file(csv_path)
+        fm.close_project()
+        print(f"批量导入: {result['rows']} 行（导入 {result['added']}，错误 {len(result['errors'])}），"
+              f"{result['seconds']:.2f} 秒，{result['rows_per_second']:.0f} 行/秒，"
+              f"写入项目文件 {fm.get_write_stats()['total_writes'] - writes} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="费用导入耗时")
+    parser.add_argument('--rows', type=int, default=50000, help="批量导入的行数（默认50000）")
+    parser.add_argument('--baseline', type=int, default=500, help="逐条添加的行数（默认500）")
+    args = parser.parse_args()
+    run(args.rows, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+组合统计基准测试 - 比较逐个读取与进程池并行读取全部项目文件的耗时，以及缓存命中时的耗时
+
+用法（在项目根目录下运行）:
+    python benchmarks/portfolio_benchmark.py [--projects 1000] [--expenses 500]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.portfolio import PortfolioCache, collect_portfolio_statistics
+from modules.project_format import dump_json_project
+from project_format_benchmark import make_project
+
+
+def run(project_count: int, expense_count: int):
+    with tempfile.TemporaryDirectory() as projects_dir:
+        project_data = make_project(expense_count)
+        for i in range(project_count):
+            project_data['project_info']['name'] = f"项目{i}"
+            with open(os.path.join(projects_dir, f"项目{i}.json"), 'w', encoding='utf-8') as f:
+                dump_json_project(project_data, f)
+
+        print(f"项目数: {project_count}，每个项目费用记录数: {expense_count}，CPU核数: {os.cpu_count()}")
+        for name, max_workers in (('逐个读取', 1), ('进程池并行', None)):
+            cache_path = os.path.join(projects_dir, f".portfolio_cache_{max_workers}")
+            cache = PortfolioCache(projects_dir, cache_path, max_workers=max_workers)
+
+            start = time.perf_counter()
+            collect_portfolio_statistics('.json', projects_dir, cache)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            collect_portfolio_statistics('.json', projects_dir, PortfolioCache(projects_dir, cache_path))
+            warm = time.perf_counter() - start
+
+            print(f"{name}: 首次 {cold * 1000:.0f} ms，缓存命中 {warm * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="组合统计扫描耗时")
+    parser.add_argument('--projects', type=int, default=1000, help="项目文件数（默认1000）")
+    parser.add_argument('--expenses', type=int, default=500, help="每个项目的费用记录数（默认500）")
+    args = parser.parse_args()
+    run(args.projects, args.expenses)
+
+
+if __name__ == "__main__":
+    main()
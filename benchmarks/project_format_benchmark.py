@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+项目文件格式基准测试 - 比较JSON与二进制格式的文件大小和读写耗时
+
+用法（在项目根目录下运行）:
+    python benchmarks/project_format_benchmark.py [--expenses 100000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.project_format import (
+    dump_json_project, dump_binary_project, load_project_file,
+    read_project_header, msgpack
+)
+
+
+def make_project(expense_count: int) -> dict:
+    """生成测试用的项目数据"""
+    expense_types = ['labor', 'material', 'equipment', 'travel', 'other']
+    expenses = []
+    for i in range(1, expense_count + 1):
+        quantity = i % 50 + 1
+        unit_price = round(10 + (i * 7919 % 1000) / 10, 2)
+        expenses.append({
+            'id': i,
+            'created_at': '2026-01-01 09:00:00',
+            'expense_type': expense_types[i % len(expense_types)],
+            'name': f"费用记录{i}",
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_amount': quantity * unit_price,
+            'date': f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            'notes': "基准测试数据" if i % 3 == 0 else '',
+            'formula_id': 'material_cost',
+            'params': {'quantity': quantity, 'unit_price': unit_price}
+        })
+
+    return {
+        'project_info': {'name': '基准测试项目', 'created_date': '2026-01-01 09:00:00',
+                         'last_modified': '2026-01-01 09:00:00', 'description': ''},
+        'custom_expense_types': [],
+        'formulas': [],
+        'expenses': expenses
+    }
+
+
+def best_of(repeat: int, func) -> float:
+    """多次运行取最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(expense_count: int, repeat: int):
+    project_data = make_project(expense_count)
+    codecs = ['json'] + (['msgpack'] if msgpack is not None else [])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, 'project.json')
+
+        def save_json():
+            with open(json_path, 'w', encoding='utf-8') as f:
+                dump_json_project(project_data, f)
+
+        results = [('JSON (indent=2)', json_path, best_of(repeat, save_json),
+                    best_of(repeat, lambda: load_project_file(json_path)), None)]
+
+        for codec in codecs:
+            binary_path = os.path.join(tmp_dir, f'project.{codec}.ptpj')
+
+            def save_binary():
+                with open(binary_path, 'wb') as f:
+                    dump_binary_project(project_data, f, codec=codec)
+
+            results.append((f"二进制 ({codec})", binary_path, best_of(repeat, save_binary),
+                            best_of(repeat, lambda: load_project_file(binary_path)),
+                            best_of(repeat, lambda: read_project_header(binary_path))))
+
+        print(f"费用记录数: {expense_count}，每项取 {repeat} 次中的最短耗时")
+        print(f"{'格式':<18}{'大小(MB)':>10}{'保存(ms)':>12}{'读取(ms)':>12}{'读摘要(ms)':>12}")
+        base_save, base_load = results[0][2], results[0][3]
+        for name, path, save_time, load_time, header_time in results:
+            header_text = f"{header_time * 1000:.2f}" if header_time is not None else '-'
+            print(f"{name:<18}{os.path.getsize(path) / 1024 / 1024:>10.2f}"
+                  f"{save_time * 1000:>12.1f}{load_time * 1000:>12.1f}{header_text:>12}")
+
+        for name, _, save_time, load_time, _ in results[1:]:
+            print(f"{name}: 保存加速 {base_save / save_time:.1f}x，读取加速 {base_load / load_time:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较JSON与二进制项目文件格式的性能")
+    parser.add_argument('--expenses', type=int, default=100000, help="费用记录数（默认100000）")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数（默认3）")
+    args = parser.parse_args()
+    run(args.expenses, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准测试 - 测量GUI模块的导入耗时（-X importtime）、第一次显示窗口的耗时和项目列表加载完成的耗时
+
+每次测量都在新的子进程中进行（冷启动），同时检查 numpy/pandas/openpyxl 等较重的库没有在启动时被导入。
+没有图形界面（如无DISPLAY的服务器）时只测量导入耗时。
+
+用法（在项目根目录下运行）:
+    python benchmarks/startup_benchmark.py [--projects 200] [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.project_format import dump_json_project
+from project_format_benchmark import make_project
+
+# 启动时不应导入的库
+HEAVY_MODULES = ('numpy', 'pandas', 'openpyxl', 'multiprocessing', 'sqlite3')
+
+# 在子进程中启动GUI，输出各阶段完成时的时间戳
+GUI_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import tkinter as tk
+from project_gui import ProjectExpenseTrackerGUI
+imported = time.time()
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    print(json.dumps({{'error': str(e)}}))
+    sys.exit(0)
+app = ProjectExpenseTrackerGUI(root)
+root.update()
+painted = time.time()
+cached_rows = len(app.projects_tree.get_children())
+deadline = painted + 60
+while app.io.pending and time.time() < deadline:
+    root.update()
+    time.sleep(0.002)
+populated = time.time()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+rows = len(app.projects_tree.get_children())
+app.io.shutdown()
+root.destroy()
+print(json.dumps({{'imported': imported, 'painted': painted, 'populated': populated,
+                  'cached_rows': cached_rows, 'rows': rows, 'heavy': heavy}}))
+"""
+
+IMPORT_SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+import project_gui
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def create_projects(projects_dir: str, project_count: int):
+    """生成测试项目文件"""
+    os.makedirs(projects_dir)
+    project_data = make_project(50)
+    for i in range(project_count):
+        project_data['project_info']['name'] = f"项目{i}"
+        with open(os.path.join(projects_dir, f"项目{i}.json"), 'w', encoding='utf-8') as f:
+            dump_json_project(project_data, f)
+
+
+def measure_imports(work_dir: str):
+    """-X importtime 测量导入耗时，返回 (总耗时ms, 自身耗时最多的模块, 启动时导入的重量级库)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             IMPORT_SCRIPT.format(root=ROOT, heavy=HEAVY_MODULES)],
+                            cwd=work_dir, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+
+    total = next(cumulative for _, cumulative, name in modules if name == 'project_gui')
+    slowest = sorted(modules, reverse=True)[:10]
+    return total / 1000, slowest, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_gui(work_dir: str):
+    """冷启动GUI，返回各阶段距进程启动的毫秒数；没有图形界面时返回错误信息"""
+    started = time.time()
+    result = subprocess.run([sys.executable, '-c', GUI_SCRIPT.format(root=ROOT, heavy=HEAVY_MODULES)],
+                            cwd=work_dir, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "启动失败"}
+    data = json.loads(lines[-1])
+    if 'error' in data:
+        return data
+    for key in ('imported', 'painted', 'populated'):
+        data[key] = (data[key] - started) * 1000
+    return data
+
+
+def run(project_count: int, runs: int):
+    with tempfile.TemporaryDirectory() as work_dir:
+        create_projects(os.path.join(work_dir, 'projects'), project_count)
+
+        total_ms, slowest, heavy = measure_imports(work_dir)
+        print(f"导入 project_gui: {total_ms:.1f} ms")
+        print(f"{'模块':<40}{'自身(ms)':>10}{'累计(ms)':>10}")
+        for self_us, cumulative_us, name in slowest:
+            print(f"{name:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+        print(f"启动时导入的重量级库: {', '.join(heavy) if heavy else '无'}")
+
+        results = []
+        for _ in range(runs):
+            data = measure_gui(work_dir)
+            if 'error' in data:
+                print(f"\n无法启动图形界面，跳过窗口耗时测量: {data['error']}")
+                return
+            results.append(data)
+
+        print(f"\n项目数: {project_count}，冷启动 {runs} 次（中位数，距进程启动）")
+        for key, title in (('imported', '导入完成'), ('painted', '窗口首次显示'), ('populated', '项目列表加载完成')):
+            print(f"  {title}: {statistics.median(r[key] for r in results):.0f} ms")
+        print(f"  项目列表行数: 首次显示时 {results[-1]['cached_rows']}（快照），加载完成后 {results[-1]['rows']}")
+        heavy = results[-1]['heavy']
+        print(f"  加载项目列表后导入的重量级库: {', '.join(heavy) if heavy else '无'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量GUI冷启动耗时")
+    parser.add_argument('--projects', type=int, default=200, help="项目文件数（默认200）")
+    parser.add_argument('--runs', type=int, default=3, help="冷启动次数（默认3）")
+    args = parser.parse_args()
+    run(args.projects, args.runs)
+
+
+if __name__ == "__main__":
+    main()
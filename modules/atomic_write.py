@@ -0,0 +1,107 @@
+"""
+原子写入模块 - 先写同目录下的临时文件并fsync，再用 os.replace 替换目标文件
+写入过程中崩溃或断电时，目标文件要么是旧内容，要么是完整的新内容
+"""
+import os
+import secrets
+import shutil
+import time
+from collections import deque
+from typing import Callable, Dict, Any, List, IO
+
+
+class WriteStats:
+    """记录最近若干次写入的耗时和大小"""
+
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)  # (耗时秒数, 字节数)
+        self.total_writes = 0
+
+    def record(self, seconds: float, size: int):
+        self.samples.append((seconds, size))
+        self.total_writes += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总最近的写入耗时（毫秒）"""
+        if not self.samples:
+            return {'count': 0, 'total_writes': self.total_writes}
+
+        durations = sorted(seconds for seconds, _ in self.samples)
+        last_seconds, last_size = self.samples[-1]
+        return {
+            'count': len(durations),
+            'total_writes': self.total_writes,
+            'last_ms': last_seconds * 1000,
+            'last_bytes': last_size,
+            'avg_ms': sum(durations) / len(durations) * 1000,
+            'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+            'max_ms': durations[-1] * 1000
+        }
+
+
+def backup_paths(path: str, backup_count: int) -> List[str]:
+    """备份文件路径：path.1.bak 最新，path.N.bak 最旧"""
+    return [f"{path}.{n}.bak" for n in range(1, backup_count + 1)]
+
+
+def _rotate_backups(path: str, backup_count: int):
+    """轮换备份，把当前文件保存为最新一代备份"""
+    backups = backup_paths(path, backup_count)
+    for older, newer in zip(reversed(backups), reversed(backups[:-1])):
+        if os.path.exists(newer):
+            os.replace(newer, older)
+
+    if os.path.exists(backups[0]):
+        os.remove(backups[0])
+    try:
+        # 硬链接不需要复制数据，替换目标文件后旧内容仍然保留在备份中
+        os.link(path, backups[0])
+    except OSError:
+        shutil.copy2(path, backups[0])
+
+
+def _fsync_dir(directory: str):
+    """fsync目录，确保rename本身已落盘（Windows不支持，跳过）"""
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, write_func: Callable[[IO], None], backup_count: int = 0,
+                 fsync: bool = True, stats: WriteStats = None, binary: bool = False) -> int:
+    """原子地写入文件（默认UTF-8文本，binary=True时为二进制），返回写入的字节数
+
+    write_func(f) 负责把内容写入打开的临时文件；失败时目标文件保持不变。
+    backup_count > 0 时在替换前轮换保留旧版本。
+    """
+    start = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(path))
+    # 临时文件以"."开头，不会被当成项目文件；用普通open创建，权限与直接写入时一致
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{secrets.token_hex(4)}.tmp")
+
+    try:
+        with (open(tmp_path, 'xb') if binary else open(tmp_path, 'x', encoding='utf-8')) as f:
+            write_func(f)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+
+        if backup_count > 0 and os.path.exists(path):
+            _rotate_backups(path, backup_count)
+
+        os.replace(tmp_path, path)
+        if fsync:
+            _fsync_dir(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if stats is not None:
+        stats.record(time.perf_counter() - start, size)
+    return size
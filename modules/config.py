@@ -2,9 +2,56 @@
 费用统计系统配置文件 - 新版（文件存储版）
 """
 
+# 存储后端："json"（项目文件，默认）或 "sqlite"（单个数据库文件）
+STORAGE_BACKEND = "json"
+SQLITE_DB_PATH = "data/projects.db"
+
 # 项目文件配置
 PROJECTS_DIR = "projects"
-PROJECT_FILE_EXTENSION = ".json"
+# 项目文件格式："json"（可读的JSON文本，默认）或 "binary"（紧凑的分段二进制容器，读写更快）
+PROJECT_FILE_FORMAT = "json"
+PROJECT_FILE_EXTENSIONS = {"json": ".json", "binary": ".ptpj"}
+PROJECT_FILE_EXTENSION = PROJECT_FILE_EXTENSIONS[PROJECT_FILE_FORMAT]
+# 二进制格式中各分段的编码："json"（紧凑JSON，无额外依赖）或 "msgpack"（需要安装msgpack）
+BINARY_SECTION_CODEC = "json"
+# 二进制格式中每个费用记录分段包含的记录数
+BINARY_EXPENSE_CHUNK_SIZE = 5000
+# 打开二进制项目时延迟加载费用记录（只读取查看到的分段），以及内存中缓存的分段数
+LAZY_LOAD_EXPENSES = True
+LAZY_CHUNK_CACHE_SIZE = 8
+
+# 内存中的费用记录按列保存（数值列 + 字典编码），大项目内存占用更小
+COLUMNAR_EXPENSE_STORE = True
+
+# 操作日志配置：费用记录变更先追加写入日志，累计到阈值后合并回项目文件
+JOURNAL_FILE_EXTENSION = ".journal"
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# 多个程序同时修改同一个项目：写入前对 <项目名>.lock 加进程间文件锁，等待超过该秒数时放弃本次写入
+LOCK_FILE_EXTENSION = ".lock"
+LOCK_TIMEOUT_SECONDS = 10.0
+
+# 自动保存：修改后等待多少秒再合并写入项目文件（0 表示每次修改立即保存）
+AUTOSAVE_DELAY_SECONDS = 5.0
+
+# 项目文件写入：每次保存前轮换保留的旧版本数（项目名.json.1.bak 为最新），0 表示不保留
+PROJECT_BACKUP_COUNT = 2
+# 写入后是否fsync（关闭可以加快保存，但断电时可能丢失最近一次保存）
+FSYNC_PROJECT_WRITES = True
+
+# 项目目录索引文件（缓存项目摘要，避免每次刷新列表都解析全部项目文件）
+CATALOG_FILE_NAME = ".project_catalog"
+
+# 组合统计（跨项目汇总）：每个项目的汇总结果缓存在该文件中，需要重新读取的文件较多时用进程池并行解析
+PORTFOLIO_CACHE_FILE_NAME = ".portfolio_cache"
+PORTFOLIO_MAX_WORKERS = None        # 进程数，None 表示使用CPU核数
+PORTFOLIO_PARALLEL_MIN_FILES = 8    # 需要读取的文件少于该数量时直接在当前进程中读取
+
+# 项目目录监视：发现其他程序修改了项目文件时更新项目列表和当前打开的项目
+WATCH_PROJECTS_DIR = True
+WATCH_POLL_INTERVAL_SECONDS = 2.0   # 未安装watchdog时扫描目录的间隔
+WATCH_DEBOUNCE_SECONDS = 0.5        # 最后一次变化后等待多久再处理（合并连续的变化）
+WATCH_MAX_DELAY_SECONDS = 3.0       # 持续变化时最多等待多久
 
 # 费用类型定义
 EXPENSE_TYPES = {
@@ -36,9 +83,18 @@ PREDEFINED_FORMULAS = {
     }
 }
 
+# 公式编译缓存容量（按表达式文本缓存编译结果）
+FORMULA_CACHE_SIZE = 256
+
+# 费用表格虚拟滚动：可见区域上下各多取的行数
+EXPENSE_TABLE_BUFFER_ROWS = 50
+
 # 导出配置
 EXPORT_FORMATS = ["excel", "csv"]
 EXPORT_DIR = "exports"
+EXPORT_CHUNK_ROWS = 10000  # 导出时每次从项目中读取并写入的记录数
+EXCEL_MAX_ROWS_PER_SHEET = 1048576  # Excel单个工作表的行数上限（含表头）
+IMPORT_BATCH_ROWS = 5000  # 导入费用记录时每批校验和计算总金额的行数
 
 # 默认项目结构模板
 DEFAULT_PROJECT_TEMPLATE = {
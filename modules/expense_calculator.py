@@ -2,40 +2,127 @@
 费用计算模块 - 从原有的expense_manager.py提取的计算功能
 """
 from typing import Dict, Any, List
-import math
+from collections import OrderedDict
+
+from .config import FORMULA_CACHE_SIZE
+from .optional_deps import numpy
+from .formula_compiler import compile_formula, CompiledFormula, FormulaError
 
 class ExpenseCalculator:
     """费用计算器"""
     
-    def __init__(self):
-        pass
+    def __init__(self, cache_size: int = FORMULA_CACHE_SIZE):
+        # 编译结果的LRU缓存：表达式文本 -> CompiledFormula
+        self.cache_size = cache_size
+        self._code_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # 批量计算统计：向量化完成的批次 / 回退为逐行计算的批次
+        self.batch_vectorized = 0
+        self.batch_fallbacks = 0
+    
+    def _get_compiled(self, formula_expression: str) -> CompiledFormula:
+        """获取表达式的编译结果，优先从缓存中读取"""
+        formula = self._code_cache.get(formula_expression)
+        if formula is not None:
+            self._code_cache.move_to_end(formula_expression)
+            self.cache_hits += 1
+            return formula
+        
+        self.cache_misses += 1
+        formula = compile_formula(formula_expression)
+        self._code_cache[formula_expression] = formula
+        if len(self._code_cache) > self.cache_size:
+            self._code_cache.popitem(last=False)
+        return formula
+    
+    def compile(self, formula_expression: str, params: List[str] = None) -> CompiledFormula:
+        """编译（或从缓存获取）公式；给出params时检查变量是否都已声明"""
+        formula = self._get_compiled(formula_expression)
+        if params is not None:
+            undeclared = [name for name in formula.param_names if name not in params]
+            if undeclared:
+                raise FormulaError(f"未声明的参数: {', '.join(undeclared)}")
+        return formula
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """获取公式缓存的命中统计"""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._code_cache),
+            'max_size': self.cache_size
+        }
+    
+    def clear_cache(self):
+        """清空公式缓存和命中统计"""
+        self._code_cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
     
     def calculate_expense(self, formula_expression: str, params: Dict[str, float]) -> float:
         """根据公式表达式和参数计算费用"""
         try:
-            # 安全地执行表达式
-            # 只允许使用数学函数和参数
-            safe_dict = {
-                '__builtins__': None,
-                'abs': abs,
-                'round': round,
-                'min': min,
-                'max': max,
-                'sum': sum,
-                'pow': pow,
-                'math': math
-            }
-            
-            # 添加参数到安全字典
-            safe_dict.update(params)
-            
-            # 计算表达式
-            result = eval(formula_expression, {"__builtins__": {}}, safe_dict)
-            return float(result)
+            formula = self._get_compiled(formula_expression)
+            return float(formula.evaluate(params))
             
         except Exception as e:
             raise ValueError(f"公式计算错误: {str(e)}")
     
+    def calculate_batch(self, formula_expression: str, columns) -> List[float]:
+        """对多行参数批量计算费用
+        
+        columns 为 {参数名: 一列取值} 的字典（列表或NumPy数组），也可以是pandas DataFrame。
+        安装了NumPy时整个表达式在数组上一次求值；表达式无法向量化
+        （例如只接受标量的 math.* 函数、min/max）时回退为逐行计算。
+        """
+        if hasattr(columns, 'columns'):
+            columns = {name: columns[name] for name in columns.columns}
+        
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("公式计算错误: 参数列长度不一致")
+        row_count = lengths.pop() if lengths else 0
+        if row_count == 0:
+            return []
+        
+        try:
+            formula = self._get_compiled(formula_expression)
+        except Exception as e:
+            raise ValueError(f"公式计算错误: {str(e)}")
+        
+        np = numpy()  # numpy为可选依赖，缺失时逐行计算
+        if np is not None:
+            try:
+                arrays = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+                # 除零等数值错误交给逐行计算，保证与calculate_expense行为一致
+                with np.errstate(divide='raise', invalid='raise', over='raise'):
+                    result = formula.evaluate(arrays)
+                result = np.asarray(result, dtype=float)
+                if result.shape != (row_count,):
+                    # 只有不引用任何参数的常量表达式可以广播；
+                    # 其余形状不符的情况（如 sum(a) 之类的聚合）按逐行语义处理
+                    if formula.param_names:
+                        raise ValueError("formula is not element-wise")
+                    result = np.broadcast_to(result, (row_count,))
+                self.batch_vectorized += 1
+                return result.tolist()
+            except Exception:
+                pass
+        
+        # 逐行计算（仍复用同一个编译结果）
+        self.batch_fallbacks += 1
+        try:
+            column_lists = [[float(v) for v in columns[name]] for name in formula.param_names]
+            func = formula.func
+            return [float(func(*row)) for row in zip(*column_lists)] if column_lists \
+                else [float(func())] * row_count
+        except KeyError as e:
+            raise ValueError(f"公式计算错误: 缺少参数: {e.args[0]}")
+        except Exception as e:
+            raise ValueError(f"公式计算错误: {str(e)}")
+    
     def calculate_total_amount(self, quantity: float = None, unit_price: float = None, 
                               formula_expression: str = None, params: Dict[str, float] = None) -> float:
         """计算总金额，支持多种计算方式"""
@@ -52,22 +139,14 @@ class ExpenseCalculator:
         return 0.0
     
     def validate_formula_expression(self, expression: str, params: List[str]) -> bool:
-        """验证公式表达式和参数的合法性"""
+        """验证公式表达式和参数的合法性
+        
+        表达式只能使用白名单中的语法和函数，且用到的变量都必须在参数列表中声明。
+        """
         try:
-            # 检查表达式是否包含非法内容
-            illegal_keywords = ['import', 'exec', 'eval', '__', 'open', 'file', 'os', 'sys']
-            for keyword in illegal_keywords:
-                if keyword in expression.lower():
-                    return False
-            
-            # 尝试编译表达式
-            compiled = compile(expression, '<string>', 'eval')
-            
-            # 检查使用的变量是否都在参数列表中
-            # 这里简化检查，实际应该更严格
+            self.compile(expression, params)
             return True
-            
-        except Exception:
+        except FormulaError:
             return False
 
 # 全局计算器实例
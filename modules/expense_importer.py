@@ -0,0 +1,272 @@
+"""
+费用导入模块 - 从CSV或Excel文件批量导入费用记录
+
+文件按行流式读取（Excel使用openpyxl的只读模式），每 IMPORT_BATCH_ROWS 行一批校验，
+按公式分组用 ExpenseCalculator.calculate_batch 一次算出整批的总金额；
+全部校验完成后由存储后端的 bulk_add_expenses 一次分配ID、只保存一次。
+表头与导出的列一致（ID、创建时间列会被忽略，导入时重新分配），导出的文件可以直接导入。
+"""
+import csv
+import itertools
+import os
+import time
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable
+
+from .config import EXPENSE_TYPES, IMPORT_BATCH_ROWS
+from .expense_calculator import get_calculator
+from .optional_deps import optional_module
+from .time_rollup import day_of
+
+# 表头 -> 费用记录字段（同时接受中文表头和字段名）
+IMPORT_FIELDS = {
+    '日期': 'date', '类型': 'expense_type', '名称': 'name', '数量': 'quantity', '单价': 'unit_price',
+    '总金额': 'total_amount', '备注': 'notes', '公式': 'formula_id', '自定义类型': 'custom_type_id',
+    'expense_date': 'date'
+}
+IMPORT_FIELDS.update({field: field for field in set(IMPORT_FIELDS.values())})
+IGNORED_COLUMNS = {'ID', 'id', '创建时间', 'created_at'}
+PARAM_PREFIXES = ('参数:', 'param:')  # 公式参数列，如 "参数:hours"
+NUMBER_FIELDS = ('quantity', 'unit_price', 'total_amount')
+IMPORT_FORMATS = {'.csv': 'csv', '.xlsx': 'excel', '.xlsm': 'excel'}
+
+_TYPE_CODES = {name: code for code, name in EXPENSE_TYPES.items()}
+_TYPE_CODES.update({code: code for code in EXPENSE_TYPES})
+
+
+def _to_number(value) -> float:
+    if isinstance(value, str):
+        value = value.strip().replace(',', '')
+    return float(value)
+
+
+def _normalize_expense(row: Dict[str, Any], formulas: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """校验并规范化一条待导入的记录（不计算总金额），有错误时抛出 ValueError"""
+    expense = {key: value for key, value in row.items()
+               if value is not None and not (isinstance(value, str) and not value.strip())}
+
+    name = str(expense.get('name', '')).strip()
+    if not name:
+        raise ValueError("缺少费用名称")
+    expense['name'] = name
+
+    expense_type = str(expense.get('expense_type', 'other')).strip()
+    if expense_type not in _TYPE_CODES:
+        raise ValueError(f"未知的费用类型: {expense_type}")
+    expense['expense_type'] = _TYPE_CODES[expense_type]
+
+    for field in NUMBER_FIELDS:
+        if field in expense:
+            try:
+                expense[field] = _to_number(expense[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} 不是数字: {expense[field]}")
+
+    value = expense.pop('date', None)
+    if value is not None:
+        if isinstance(value, (date, datetime)):
+            value = value.strftime('%Y-%m-%d')
+        day = day_of(str(value).strip())
+        if not day:
+            raise ValueError(f"日期格式错误: {value}")
+        expense['date'] = day
+
+    if 'custom_type_id' in expense:
+        try:
+            expense['custom_type_id'] = int(_to_number(expense['custom_type_id']))
+        except (TypeError, ValueError):
+            raise ValueError(f"自定义类型ID错误: {expense['custom_type_id']}")
+
+    if 'notes' in expense:
+        expense['notes'] = str(expense['notes']).strip()
+
+    formula_id = expense.get('formula_id')
+    if formula_id is not None:
+        formula = formulas.get(formula_id)
+        if formula is None:
+            raise ValueError(f"找不到公式: {formula_id}")
+        params = expense.get('params') or {}
+        missing = [name for name in formula.get('params', []) if name not in params]
+        if missing:
+            raise ValueError(f"缺少公式参数: {', '.join(missing)}")
+        try:
+            expense['params'] = {key: _to_number(value) for key, value in params.items()}
+        except (TypeError, ValueError):
+            raise ValueError("公式参数不是数字")
+    elif 'total_amount' not in expense and ('quantity' not in expense or 'unit_price' not in expense):
+        raise ValueError("缺少总金额（或数量和单价、公式和参数）")
+    return expense
+
+
+def _calculate_group(expression: str, rows: List[Tuple[int, Dict[str, Any]]],
+                     params: List[str], errors: List[Tuple[int, str]]) -> List[Tuple[int, float]]:
+    """用同一个表达式批量计算一组记录的总金额，整批失败时逐行计算以找出出错的记录"""
+    calculator = get_calculator()
+    columns = {name: [values[name] for _, values in rows] for name in params}
+    try:
+        totals = calculator.calculate_batch(expression, columns)
+    except ValueError:
+        totals = []
+        for number, values in rows:
+            try:
+                totals.append(calculator.calculate_expense(expression, values))
+            except ValueError as e:
+                totals.append(e)
+
+    calculated = []
+    for (number, values), total in zip(rows, totals):
+        if isinstance(total, Exception):
+            errors.append((number, str(total)))
+        else:
+            calculated.append((number, total))
+    return calculated
+
+
+def prepare_expense_batch(rows: List[Dict[str, Any]], formulas: Dict[str, Dict[str, Any]],
+                          first_number: int = 1) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """校验一批待导入的记录并计算总金额
+
+    没有总金额的记录按公式和参数（或 数量×单价）计算，同一个公式的记录一次批量计算。
+    返回 (通过校验的记录（保持原顺序）, [(记录序号, 错误原因)])，记录序号从 first_number 开始。
+    """
+    errors = []
+    expenses = {}
+    by_formula = {}  # 公式ID -> [(记录序号, 参数)]
+    by_quantity = []  # [(记录序号, {'quantity', 'unit_price'})]
+
+    for number, row in enumerate(rows, first_number):
+        try:
+            expense = _normalize_expense(row, formulas)
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+        expenses[number] = expense
+        if 'total_amount' in expense:
+            continue
+        if 'formula_id' in expense:
+            by_formula.setdefault(expense['formula_id'], []).append((number, expense['params']))
+        else:
+            by_quantity.append((number, {'quantity': expense['quantity'], 'unit_price': expense['unit_price']}))
+
+    groups = [(formulas[formula_id]['expression'], group, formulas[formula_id].get('params', []))
+              for formula_id, group in by_formula.items()]
+    if by_quantity:
+        groups.append(('quantity * unit_price', by_quantity, ['quantity', 'unit_price']))
+    for expression, group, params in groups:
+        for number, total in _calculate_group(expression, group, params, errors):
+            expenses[number]['total_amount'] = total
+
+    failed = {number for number, _ in errors}
+    valid = [expense for number, expense in expenses.items() if number not in failed]
+    errors.sort()
+    return valid, errors
+
+
+def iter_batches(rows: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """把逐行生成的记录按 batch_size 条分批（不预先读入全部记录）"""
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _row_to_expense(headers: List[Optional[str]], values: Iterable[Any]) -> Dict[str, Any]:
+    """按表头把一行数据转换为费用记录字段"""
+    expense = {}
+    for header, value in zip(headers, values):
+        if header is None or value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if header.startswith(PARAM_PREFIXES):
+            expense.setdefault('params', {})[header.split(':', 1)[1].strip()] = value
+        else:
+            expense[header] = value
+    return expense
+
+
+def _map_headers(header_row: Iterable[Any]) -> List[Optional[str]]:
+    """把文件中的表头映射为字段名，无法识别的列返回None（忽略）"""
+    headers = []
+    for cell in header_row:
+        title = str(cell).strip() if cell is not None else ''
+        if title.startswith(PARAM_PREFIXES):
+            headers.append(title)
+        elif title in IMPORT_FIELDS:
+            headers.append(IMPORT_FIELDS[title])
+        else:
+            if title and title not in IGNORED_COLUMNS:
+                print(f"[WARNING] Ignored unknown import column: {title}")
+            headers.append(None)
+    return headers
+
+
+def iter_csv_expenses(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取CSV文件（第一行为表头，兼容带BOM的UTF-8）"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        headers = _map_headers(next(reader, []))
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield _row_to_expense(headers, values)
+
+
+def iter_excel_expenses(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取Excel文件（只读模式，不把整个工作簿载入内存）
+
+    导出时拆分成的多个“费用记录”工作表依次读取；没有这样的工作表时读取第一个工作表。
+    """
+    openpyxl = optional_module('openpyxl')
+    if openpyxl is None:
+        raise ImportError("导入Excel需要安装openpyxl: pip install openpyxl")
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = [ws for ws in workbook.worksheets if ws.title.startswith('费用记录')] or workbook.worksheets[:1]
+        for ws in sheets:
+            rows = ws.iter_rows(values_only=True)
+            headers = _map_headers(next(rows, ()))
+            for values in rows:
+                if any(value is not None and str(value).strip() for value in values):
+                    yield _row_to_expense(headers, values)
+    finally:
+        workbook.close()
+
+
+class ExpenseImporter:
+    """把CSV或Excel文件中的费用记录批量导入当前项目"""
+
+    def __init__(self, file_manager):
+        self.file_manager = file_manager
+
+    def iter_file_expenses(self, path: str) -> Iterator[Dict[str, Any]]:
+        """按扩展名选择读取方式，逐行生成待导入的记录"""
+        file_format = IMPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise ValueError(f"不支持的导入文件格式: {path}（支持 {', '.join(IMPORT_FORMATS)}）")
+        return iter_csv_expenses(path) if file_format == 'csv' else iter_excel_expenses(path)
+
+    def import_file(self, path: str, batch_size: int = IMPORT_BATCH_ROWS,
+                    progress: Optional[Callable[[int], None]] = None) -> Optional[Dict[str, Any]]:
+        """导入文件中的费用记录，返回导入结果（含每秒处理的行数），失败时返回None
+
+        结果: {'rows': 读取的行数, 'added': 导入的记录数, 'errors': [(记录序号, 原因)],
+               'first_id', 'last_id', 'seconds': 总耗时, 'rows_per_second'}；
+        记录序号不含表头，从1开始。有错误的行被跳过，其余记录一次提交。
+        """
+        try:
+            started = time.perf_counter()
+            result = self.file_manager.bulk_add_expenses(self.iter_file_expenses(path), batch_size, progress)
+            if result is None:
+                return None
+
+            # 耗时包括读取文件
+            result['seconds'] = time.perf_counter() - started
+            result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+            print(f"[SUCCESS] Imported {result['added']}/{result['rows']} expenses from {path} "
+                  f"({result['rows_per_second']:.0f} rows/s, {len(result['errors'])} rejected)")
+            return result
+
+        except Exception as e:
+            print(f"[ERROR] Failed to import expenses: {str(e)}")
+            return None
@@ -0,0 +1,195 @@
+"""
+费用统计聚合模块 - 随费用记录增删改增量维护的统计数据
+总数、总金额、按类型/自定义类型的分组以及最大最小值都可以在常数时间内读取，
+聚合结果随项目一起保存，打开项目时无需重新遍历全部费用记录
+"""
+from typing import List, Dict, Any, Optional, Iterable
+
+from .config import EXPENSE_TYPES
+from .expense_store import ExpenseStore
+
+STATS_VERSION = 1
+
+
+class StatsAggregator:
+    """费用统计聚合器"""
+
+    def __init__(self):
+        self.count = 0
+        self.grand_total = 0
+        self.by_type = {}         # 费用类型代码 -> [记录数, 金额合计]
+        self.by_custom_type = {}  # 自定义类型ID -> [记录数, 金额合计]
+        self.min_amount = None
+        self.max_amount = None
+        self._extremes_stale = False  # 删除了最大/最小值的记录后需要重新计算
+
+    # ===== 增量维护 =====
+
+    def add(self, expense: Dict[str, Any]):
+        """计入一条费用记录"""
+        amount = expense.get('total_amount', 0)
+        self.count += 1
+        self.grand_total += amount
+
+        bucket = self.by_type.setdefault(expense.get('expense_type', 'other'), [0, 0])
+        bucket[0] += 1
+        bucket[1] += amount
+
+        custom_type_id = expense.get('custom_type_id')
+        if custom_type_id:
+            bucket = self.by_custom_type.setdefault(custom_type_id, [0, 0])
+            bucket[0] += 1
+            bucket[1] += amount
+
+        if not self._extremes_stale:
+            if self.min_amount is None or amount < self.min_amount:
+                self.min_amount = amount
+            if self.max_amount is None or amount > self.max_amount:
+                self.max_amount = amount
+
+    def remove(self, expense: Dict[str, Any]):
+        """移除一条费用记录"""
+        amount = expense.get('total_amount', 0)
+        self.count -= 1
+        self.grand_total -= amount
+
+        self._remove_from_bucket(self.by_type, expense.get('expense_type', 'other'), amount)
+        custom_type_id = expense.get('custom_type_id')
+        if custom_type_id:
+            self._remove_from_bucket(self.by_custom_type, custom_type_id, amount)
+
+        if self.count == 0:
+            self.grand_total = 0
+            self.min_amount = None
+            self.max_amount = None
+            self._extremes_stale = False
+        elif amount == self.min_amount or amount == self.max_amount:
+            self._extremes_stale = True
+
+    def _remove_from_bucket(self, buckets: Dict[Any, List], key, amount):
+        bucket = buckets.get(key)
+        if bucket is None:
+            return
+        bucket[0] -= 1
+        bucket[1] -= amount
+        if bucket[0] <= 0:
+            del buckets[key]
+
+    def rebuild(self, expenses: Iterable[Dict[str, Any]]):
+        """从费用记录重新计算全部聚合"""
+        self.__init__()
+        if isinstance(expenses, ExpenseStore):
+            self._rebuild_from_columns(expenses)
+            return
+        for expense in expenses:
+            self.add(expense)
+
+    def _rebuild_from_columns(self, expenses: ExpenseStore):
+        """列式存储直接按列求和、分组，不需要逐条组装记录"""
+        self.count = len(expenses)
+        self.grand_total = expenses.sum('total_amount')
+        self.by_type = expenses.group_totals('expense_type', 'total_amount', default='other')
+        self.by_custom_type = {key: bucket for key, bucket
+                               in expenses.group_totals('custom_type_id', 'total_amount').items() if key}
+        self.min_amount, self.max_amount = expenses.min_max('total_amount')
+
+    def refresh_extremes(self, expenses: Iterable[Dict[str, Any]]):
+        """最大/最小值失效时重新计算（只在删除了极值记录后才需要遍历）"""
+        if not self._extremes_stale:
+            return
+        if isinstance(expenses, ExpenseStore):
+            self.min_amount, self.max_amount = expenses.min_max('total_amount')
+        else:
+            amounts = [expense.get('total_amount', 0) for expense in expenses]
+            self.min_amount = min(amounts) if amounts else None
+            self.max_amount = max(amounts) if amounts else None
+        self._extremes_stale = False
+
+    def adopt_extremes(self, other: 'StatsAggregator'):
+        """使用另一个内容相同的聚合（如快照上的副本）已经重新计算的最大/最小值"""
+        if not other._extremes_stale:
+            self.min_amount, self.max_amount = other.min_amount, other.max_amount
+            self._extremes_stale = False
+
+    @property
+    def extremes_stale(self) -> bool:
+        return self._extremes_stale
+
+    # ===== 查询 =====
+
+    def to_statistics(self, custom_types: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """生成与 get_expense_statistics 相同结构的统计结果"""
+        type_stats = {}
+        for expense_type, (count, total) in self.by_type.items():
+            type_name = EXPENSE_TYPES.get(expense_type, expense_type)
+            stats = type_stats.setdefault(type_name, {'count': 0, 'total_amount': 0})
+            stats['count'] += count
+            stats['total_amount'] += total
+
+        by_type = [{
+            'expense_type': type_name,
+            'count': stats['count'],
+            'total_amount': stats['total_amount']
+        } for type_name, stats in type_stats.items()]
+
+        # 只统计仍然存在的自定义类型
+        custom_type_names = {t.get('id'): t.get('name', f"自定义类型{t.get('id')}") for t in custom_types}
+        custom_type_stats = {}
+        for custom_type_id, (count, total) in self.by_custom_type.items():
+            if custom_type_id not in custom_type_names:
+                continue
+            stats = custom_type_stats.setdefault(custom_type_names[custom_type_id], {'count': 0, 'total_amount': 0})
+            stats['count'] += count
+            stats['total_amount'] += total
+
+        by_custom_type = [{
+            'type_name': type_name,
+            'count': stats['count'],
+            'total_amount': stats['total_amount']
+        } for type_name, stats in custom_type_stats.items()]
+
+        return {
+            'overall': {
+                'total_count': self.count,
+                'grand_total': self.grand_total,
+                'avg_amount': self.grand_total / self.count if self.count > 0 else 0,
+                'min_amount': self.min_amount if self.min_amount is not None else 0,
+                'max_amount': self.max_amount if self.max_amount is not None else 0
+            },
+            'by_type': by_type,
+            'by_custom_type': by_custom_type
+        }
+
+    # ===== 持久化 =====
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可写入项目文件的结构"""
+        return {
+            'version': STATS_VERSION,
+            'count': self.count,
+            'grand_total': self.grand_total,
+            'by_type': [[key, count, total] for key, (count, total) in self.by_type.items()],
+            'by_custom_type': [[key, count, total] for key, (count, total) in self.by_custom_type.items()],
+            'min_amount': None if self._extremes_stale else self.min_amount,
+            'max_amount': None if self._extremes_stale else self.max_amount,
+            'extremes_stale': self._extremes_stale
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional['StatsAggregator']:
+        """从项目文件中读取聚合结果，格式不符时返回None"""
+        if not isinstance(data, dict) or data.get('version') != STATS_VERSION:
+            return None
+
+        try:
+            stats = cls()
+            stats.count = data['count']
+            stats.grand_total = data['grand_total']
+            stats.by_type = {key: [count, total] for key, count, total in data.get('by_type', [])}
+            stats.by_custom_type = {key: [count, total] for key, count, total in data.get('by_custom_type', [])}
+            stats.min_amount = data.get('min_amount')
+            stats.max_amount = data.get('max_amount')
+            stats._extremes_stale = bool(data.get('extremes_stale', False))
+            return stats
+        except (KeyError, TypeError, ValueError):
+            return None
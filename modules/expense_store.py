@@ -0,0 +1,476 @@
+"""
+列式费用记录存储 - 按字段分列保存费用记录，降低大项目的内存占用
+
+数值字段保存在 array('d') 中，费用类型、日期等重复出现的值按字典编码为整数；
+按下标读取时重新组装成普通dict，界面和其他模块的访问方式不变。
+求和、分组汇总直接在列上进行（安装numpy时向量化计算，numpy在第一次汇总时才导入）。
+删除记录时只记下被删除的行，累计到一定数量（或需要整列读取）时再一次性压缩各列。
+每列按固定行数分块保存，snapshot() 返回共享全部分块的只读快照，
+之后原存储修改某一行时只复制该行所在的分块（写时复制）。
+"""
+import copy
+from array import array
+from bisect import bisect_right, insort
+from collections.abc import MutableSequence
+from itertools import chain
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+from .optional_deps import numpy
+
+NUMERIC_FIELDS = ('quantity', 'unit_price', 'total_amount')
+ENCODED_FIELDS = ('created_at', 'expense_type', 'custom_type_id', 'date', 'formula_id')
+TEXT_FIELDS = ('name', 'notes')
+
+# 组装记录时的字段顺序
+FIELD_ORDER = ('id', 'created_at', 'expense_type', 'custom_type_id', 'name', 'quantity', 'unit_price',
+               'total_amount', 'date', 'notes', 'formula_id', 'params')
+_COLUMN_FIELDS = frozenset(FIELD_ORDER)
+
+_MISSING = object()
+_ABSENT = -1                 # 编码列中表示该行没有此字段
+_ABSENT_ID = -2 ** 63        # ID列中表示该行没有ID
+_ABSENT_TEXT = None          # 文本列中表示该行没有此字段
+_NUMBER_ABSENT, _NUMBER_FLOAT, _NUMBER_INT = 0, 1, 2
+_MAX_EXACT_INT = 2 ** 53     # 超出范围的整数转成浮点数会丢失精度，改为整行额外保存
+_EXTEND_BATCH = 10000        # 批量添加时每批按列编码的记录数
+_COMPACT_THRESHOLD = 256     # 删除的行累计到这个数量后压缩各列
+_CHUNK_ROWS = 4096           # 每个分块的行数（写时复制的单位）
+
+
+class _ValuePool:
+    """字典编码：相同的值只保存一份，列中保存整数编号"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode_many(self, values: List[Any]) -> List[int]:
+        """批量取编号，没有该字段（_MISSING）或不可哈希的值编号为 _ABSENT"""
+        codes = self._codes
+        # 已经出现过的字符串直接命中，其余的逐个处理
+        result = [codes.get(value) if value.__class__ is str else _ABSENT if value is _MISSING else None
+                  for value in values]
+        for i in [i for i, code in enumerate(result) if code is None]:
+            try:
+                result[i] = self.encode(values[i])
+            except TypeError:
+                result[i] = _ABSENT
+        return result
+
+    def encode(self, value) -> int:
+        """取值的编号，不可哈希的值抛出TypeError"""
+        # 非字符串的值连同类型一起作为键，区分 1 与 1.0、True
+        key = value if value.__class__ is str else (value.__class__, value)
+        code = self._codes.get(key)
+        if code is None:
+            code = len(self.values)
+            self._codes[key] = code
+            self.values.append(value)
+        return code
+
+
+class ExpenseStore(MutableSequence):
+    """列式保存的费用记录序列
+
+    支持 len()、下标、切片、迭代、append/insert/del 等列表操作，读取时返回新组装的dict，
+    修改返回的dict不会写回存储，需要通过下标赋值替换整条记录。
+    没有对应列的字段（以及无法按列保存的值）按行保存在额外字段中。
+    del 不移动后面的行，被删除的行留在列中直到压缩，按下标访问时用二分法跳过这些行。
+    每列是分块的列表，除最后一块外每块都是 _CHUNK_ROWS 行，第i行位于第 i // _CHUNK_ROWS 块。
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = ()):
+        self._pools = {field: _ValuePool() for field in ENCODED_FIELDS}
+        self._param_name_pool = _ValuePool()
+        self._deleted = []                 # 已删除但尚未压缩的行（列中的实际位置，有序）
+        self._deleted_shifts = []          # 第j个已删除行之后的记录从哪个下标开始需要跳过 j+1 行
+        self._size = 0                     # 列中的行数（包括尚未压缩的已删除行）
+        self._owned = []                   # 各分块是否为本存储独有（False表示与快照共享，修改前需要先复制）
+
+        # 各列分块的空白样板（新分块从样板复制）
+        self._empty = [array('q')]
+        for field in NUMERIC_FIELDS:
+            self._empty += [array('d'), array('b')]
+        self._empty += [array('i') for field in ENCODED_FIELDS]
+        self._empty += [[] for field in TEXT_FIELDS]
+        self._empty += [array('i'), [], []]
+        self._bind_columns([[] for _ in self._empty])
+
+        self.extend(rows)
+
+    def _bind_columns(self, columns: List[List[Any]]):
+        """使用给定的各列分块（顺序与 _encode 的返回值一致）"""
+        # 与 _encode 返回值一一对应的全部列
+        self._columns = columns
+        values = iter(columns)
+        self._ids = next(values)
+        self._numbers, self._number_kinds = {}, {}
+        for field in NUMERIC_FIELDS:
+            self._numbers[field] = next(values)
+            self._number_kinds[field] = next(values)
+        self._codes = {field: next(values) for field in ENCODED_FIELDS}
+        self._texts = {field: next(values) for field in TEXT_FIELDS}
+        self._param_names = next(values)     # 公式参数名元组的编号
+        self._param_values = next(values)    # 公式参数值元组
+        self._extras = next(values)          # 其余字段，没有时为None
+
+        # 组装记录时按 FIELD_ORDER 依次读取的列
+        self._decode_plan = []
+        for field in FIELD_ORDER[1:-1]:
+            if field in self._codes:
+                self._decode_plan.append((field, 'code', self._codes[field], self._pools[field].values))
+            elif field in self._numbers:
+                self._decode_plan.append((field, 'number', self._numbers[field], self._number_kinds[field]))
+            else:
+                self._decode_plan.append((field, 'text', self._texts[field], None))
+
+    def snapshot(self) -> 'ExpenseStore':
+        """返回当前内容的只读快照（只复制分块列表，之后原存储修改某个分块时再复制该分块）
+
+        值的编码表只会追加，快照和原存储可以继续共享。尚未压缩的已删除行随快照一起复制
+        （不超过 _COMPACT_THRESHOLD 行），不需要先压缩。快照本身不应再修改。
+        """
+        view = copy.copy(self)
+        view._bind_columns([list(chunks) for chunks in self._columns])
+        view._deleted, view._deleted_shifts = list(self._deleted), list(self._deleted_shifts)
+        self._owned = [False] * len(self._owned)
+        view._owned = list(self._owned)
+        return view
+
+    def _own_chunk(self, chunk: int):
+        """分块与快照共享时，修改前先复制该分块"""
+        if not self._owned[chunk]:
+            for chunks in self._columns:
+                chunks[chunk] = chunks[chunk][:]
+            self._owned[chunk] = True
+
+    def _set_columns(self, flat_columns: List[Any]):
+        """用整列数据重新分块（压缩、中间插入后使用，新分块都为本存储独有）"""
+        self._bind_columns([[column[start:start + _CHUNK_ROWS] for start in range(0, len(column), _CHUNK_ROWS)]
+                            for column in flat_columns])
+        self._size = len(flat_columns[0])
+        self._owned = [True] * len(self._ids)
+        self._deleted = []
+        self._deleted_shifts = []
+
+
+    # ===== 编码 =====
+
+    def _encode_rows(self, rows: List[Dict[str, Any]]) -> List[List[Any]]:
+        """把一批记录按列拆开，返回各列的值列表（顺序与 self._columns 一致）
+
+        按列用列表推导处理整批记录，比逐行拆分快得多；
+        无法按列保存的值（类型不符、不可哈希）放进该行的额外字段。
+        """
+        extra_keys = [row.keys() - _COLUMN_FIELDS for row in rows]
+        extras = [{key: row[key] for key in keys} if keys else None for row, keys in zip(rows, extra_keys)]
+
+        def add_extra(i, field, value):
+            if extras[i] is None:
+                extras[i] = {}
+            extras[i][field] = value
+
+        raw = [row.get('id', _MISSING) for row in rows]
+        ids = [value if value.__class__ is int and _ABSENT_ID < value < 2 ** 63 else _ABSENT_ID for value in raw]
+        if _ABSENT_ID in ids:
+            for i in [i for i, value in enumerate(ids) if value == _ABSENT_ID]:
+                if raw[i] is not _MISSING:
+                    add_extra(i, 'id', raw[i])
+        columns = [ids]
+
+        for field in NUMERIC_FIELDS:
+            raw = [row.get(field, _MISSING) for row in rows]
+            kinds = [_NUMBER_FLOAT if value.__class__ is float else
+                     _NUMBER_INT if value.__class__ is int and -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT else
+                     _NUMBER_ABSENT for value in raw]
+            if _NUMBER_ABSENT in kinds:
+                for i in [i for i, kind in enumerate(kinds) if kind == _NUMBER_ABSENT]:
+                    if raw[i] is not _MISSING:
+                        add_extra(i, field, raw[i])
+            columns += [[float(value) if kind else 0.0 for value, kind in zip(raw, kinds)], kinds]
+
+        for field in ENCODED_FIELDS:
+            raw = [row.get(field, _MISSING) for row in rows]
+            codes = self._pools[field].encode_many(raw)
+            if _ABSENT in codes:
+                for i in [i for i, code in enumerate(codes) if code == _ABSENT]:
+                    if raw[i] is not _MISSING:
+                        add_extra(i, field, raw[i])
+            columns.append(codes)
+
+        for field in TEXT_FIELDS:
+            raw = [row.get(field, _MISSING) for row in rows]
+            texts = [value if value.__class__ is str else _ABSENT_TEXT for value in raw]
+            if _ABSENT_TEXT in texts:
+                for i in [i for i, value in enumerate(texts) if value is _ABSENT_TEXT]:
+                    if raw[i] is not _MISSING:
+                        add_extra(i, field, raw[i])
+            columns.append(texts)
+
+        # 公式参数：参数名元组字典编码，参数值保存为元组
+        name_codes = []
+        value_tuples = []
+        encode_names = self._param_name_pool.encode
+        last_names = last_code = None  # 相邻记录通常使用同一个公式
+        for i, row in enumerate(rows):
+            params = row.get('params', _MISSING)
+            if params.__class__ is dict:
+                names = tuple(params)
+                if names != last_names:
+                    last_names, last_code = names, encode_names(names)
+                name_codes.append(last_code)
+                value_tuples.append(tuple(params.values()))
+            else:
+                if params is not _MISSING:
+                    add_extra(i, 'params', params)
+                name_codes.append(_ABSENT)
+                value_tuples.append(None)
+        columns += [name_codes, value_tuples, extras]
+        return columns
+
+    def _encode(self, row: Dict[str, Any]) -> List[Any]:
+        """把一条记录拆成各列的值"""
+        return [values[0] for values in self._encode_rows([row])]
+
+    def _decode(self, index: int) -> Dict[str, Any]:
+        """把列中第index行组装成dict"""
+        row = {}
+        chunk, index = divmod(index, _CHUNK_ROWS)
+        row_id = self._ids[chunk][index]
+        if row_id != _ABSENT_ID:
+            row['id'] = row_id
+
+        for field, kind, column, aux in self._decode_plan:
+            value = column[chunk][index]
+            if kind == 'code':
+                if value != _ABSENT:
+                    row[field] = aux[value]
+            elif kind == 'number':
+                number_kind = aux[chunk][index]
+                if number_kind == _NUMBER_FLOAT:
+                    row[field] = value
+                elif number_kind == _NUMBER_INT:
+                    row[field] = int(value)
+            elif value is not _ABSENT_TEXT:
+                row[field] = value
+
+        code = self._param_names[chunk][index]
+        if code != _ABSENT:
+            row['params'] = dict(zip(self._param_name_pool.values[code], self._param_values[chunk][index]))
+
+        extras = self._extras[chunk][index]
+        if extras:
+            row.update(extras)
+        return row
+
+    # ===== 序列操作 =====
+
+    def __len__(self) -> int:
+        return self._size - len(self._deleted)
+
+    def _normalize_index(self, index: int) -> int:
+        """把记录下标转换为列中的实际位置（跳过已删除的行）"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("费用记录下标超出范围")
+        if self._deleted:
+            index += bisect_right(self._deleted_shifts, index)
+        return index
+
+    def compact(self):
+        """把已删除的行从各列中移除（按未删除的区间整段复制）"""
+        if not self._deleted:
+            return
+        bounds = [-1] + self._deleted + [self._size]
+        segments = [(start + 1, end) for start, end in zip(bounds, bounds[1:]) if end > start + 1]
+        columns = []
+        for k in range(len(self._columns)):
+            column = _join_chunks(self._columns[k], self._empty[k])
+            kept = column[:0]
+            for start, end in segments:
+                kept += column[start:end]
+            columns.append(kept)
+        # 换成新的分块，不修改可能与快照共享的旧分块
+        self._set_columns(columns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(self._normalize_index(i)) for i in range(*index.indices(len(self)))]
+        return self._decode(self._normalize_index(index))
+
+    def __setitem__(self, index, row: Dict[str, Any]):
+        if isinstance(index, slice):
+            raise TypeError("ExpenseStore 不支持切片赋值")
+        chunk, index = divmod(self._normalize_index(index), _CHUNK_ROWS)
+        self._own_chunk(chunk)
+        for chunks, value in zip(self._columns, self._encode(row)):
+            chunks[chunk][index] = value
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for i in sorted(range(*index.indices(len(self))), reverse=True):
+                del self[i]
+            return
+        insort(self._deleted, self._normalize_index(index))
+        self._deleted_shifts = [position - j for j, position in enumerate(self._deleted)]
+        if len(self._deleted) >= _COMPACT_THRESHOLD:
+            self.compact()
+
+    def insert(self, index: int, row: Dict[str, Any]):
+        self.compact()
+        if index >= self._size:
+            self.append(row)
+            return
+        # 中间插入会移动后面所有的行，整列重新分块
+        columns = []
+        for k, value in enumerate(self._encode(row)):
+            column = _join_chunks(self._columns[k], self._empty[k])
+            column.insert(index, value)
+            columns.append(column)
+        self._set_columns(columns)
+
+    def append(self, row: Dict[str, Any]):
+        self._extend_batch([row])
+
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        """批量添加：每批记录按列编码后整列追加"""
+        if rows is self:
+            rows = list(rows)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= _EXTEND_BATCH:
+                self._extend_batch(batch)
+                batch = []
+        if batch:
+            self._extend_batch(batch)
+
+    def _extend_batch(self, rows: List[Dict[str, Any]]):
+        encoded = self._encode_rows(rows)
+        start = 0
+        while start < len(rows):
+            chunk, offset = divmod(self._size, _CHUNK_ROWS)
+            if offset:
+                self._own_chunk(chunk)
+            else:
+                for chunks, empty in zip(self._columns, self._empty):
+                    chunks.append(empty[:0])
+                self._owned.append(True)
+            stop = min(len(rows), start + _CHUNK_ROWS - offset)
+            for chunks, values in zip(self._columns, encoded):
+                chunks[chunk].extend(values[start:stop])
+            self._size += stop - start
+            start = stop
+
+    def __iter__(self):
+        self.compact()
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    def __repr__(self) -> str:
+        return f"<ExpenseStore {len(self)} expenses>"
+
+    # ===== 列操作 =====
+
+    def column(self, field: str) -> List[Any]:
+        """取某个字段的全部值（没有该字段的行为None），不需要组装整行"""
+        self.compact()
+        flat = chain.from_iterable
+        if field == 'id':
+            values = [None if value == _ABSENT_ID else value for value in flat(self._ids)]
+        elif field in self._numbers:
+            values = [(int(value) if kind == _NUMBER_INT else value) if kind else None
+                      for value, kind in zip(flat(self._numbers[field]), flat(self._number_kinds[field]))]
+        elif field in self._codes:
+            pool = self._pools[field].values
+            values = [pool[code] if code != _ABSENT else None for code in flat(self._codes[field])]
+        elif field in self._texts:
+            values = list(flat(self._texts[field]))
+        elif field == 'params':
+            pool = self._param_name_pool.values
+            values = [dict(zip(pool[code], params)) if code != _ABSENT else None
+                      for code, params in zip(flat(self._param_names), flat(self._param_values))]
+        else:
+            values = [None] * len(self)
+
+        for i, extras in enumerate(flat(self._extras)):
+            if extras and field in extras:
+                values[i] = extras[field]
+        return values
+
+    def _number_array(self, field: str):
+        """数值列（没有该字段或不是数字的行按0计）"""
+        self.compact()
+        if field not in self._numbers:
+            raise ValueError(f"不是数值字段: {field}")
+        values = _join_chunks(self._numbers[field], array('d'))
+        np = numpy()
+        return np.frombuffer(values, dtype=float) if np is not None and len(values) else values
+
+    def sum(self, field: str) -> float:
+        """数值列求和"""
+        values = self._number_array(field)
+        return float(values.sum()) if numpy() is not None and len(values) else sum(values)
+
+    def min_max(self, field: str) -> Tuple[Optional[float], Optional[float]]:
+        """数值列的最小值和最大值，没有记录时为 (None, None)"""
+        if not len(self):
+            return None, None
+        values = self._number_array(field)
+        if numpy() is not None:
+            return float(values.min()), float(values.max())
+        return min(values), max(values)
+
+    def group_totals(self, key_field: str, value_field: str, default: Any = None) -> Dict[Any, List]:
+        """按字典编码的字段分组，返回 {分组值: [记录数, 数值列合计]}
+
+        没有该字段的记录归入 default 分组。
+        """
+        if key_field not in self._codes:
+            raise ValueError(f"不支持按该字段分组: {key_field}")
+        self.compact()
+        codes = _join_chunks(self._codes[key_field], array('i'))
+        pool = self._pools[key_field].values
+
+        np = numpy()  # numpy为可选依赖，缺失时逐项分组
+        if np is not None and len(codes):
+            # 编号整体加1，让没有该字段的记录（-1）落在第0组
+            shifted = np.frombuffer(codes, dtype=np.intc) + 1
+            counts = np.bincount(shifted, minlength=len(pool) + 1)
+            totals = np.bincount(shifted, weights=self._number_array(value_field), minlength=len(pool) + 1)
+            buckets = {code - 1: (int(counts[code]), float(totals[code]))
+                       for code in np.flatnonzero(counts).tolist()}
+        else:
+            buckets = {}
+            for code, value in zip(codes, self._number_array(value_field)):
+                bucket = buckets.get(code)
+                if bucket is None:
+                    buckets[code] = [1, value]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += value
+
+        result = {}
+        for code, (count, total) in buckets.items():
+            key = pool[code] if code != _ABSENT else default
+            bucket = result.setdefault(key, [0, 0])
+            bucket[0] += count
+            bucket[1] += total
+        return result
+
+
+def _join_chunks(chunks: List[Any], empty):
+    """把一列的分块拼接成一整列（新对象，empty 为该列的空白样板）"""
+    flat = empty[:0]
+    for chunk in chunks:
+        flat += chunk
+    return flat
+
+
+def column_values(rows, field: str) -> List[Any]:
+    """取费用记录某个字段的全部值，普通列表、ExpenseStore 和延迟加载的序列都适用"""
+    column = getattr(rows, 'column', None)
+    if column is not None:
+        return column(field)
+    return [row.get(field) for row in rows]
@@ -1,239 +1,332 @@
 """
-导出管理模块
+导出管理模块 - 把当前项目的费用记录导出为CSV文件（附统计摘要）或Excel文件
+
+费用记录按 EXPORT_CHUNK_ROWS 分页从文件管理器读取并逐块写入，不在内存中组装整张表，
+导出的记录数再多内存占用也保持不变；统计摘要在写入的同一次遍历中累计。
+Excel使用openpyxl的只写模式，每行写入后即转存到临时文件。
 """
+import csv
 import os
-import pandas as pd
 from datetime import datetime
-from config import EXPENSE_TYPES, EXPORT_DIR, EXPORT_FORMATS
-from database import get_db
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+
+from .config import EXPENSE_TYPES, EXPORT_DIR, EXPORT_FORMATS, EXPORT_CHUNK_ROWS, EXCEL_MAX_ROWS_PER_SHEET
+from .file_manager import get_file_manager
+from .optional_deps import optional_module
+from .time_rollup import day_of, expense_date
+
+# 导出的列：(表头, 取值函数)
+EXPORT_COLUMNS = [
+    ('ID', lambda exp: exp.get('id')),
+    ('日期', expense_date),
+    ('类型', lambda exp: EXPENSE_TYPES.get(exp.get('expense_type', 'other'), exp.get('expense_type'))),
+    ('名称', lambda exp: exp.get('name')),
+    ('数量', lambda exp: exp.get('quantity')),
+    ('单价', lambda exp: exp.get('unit_price')),
+    ('总金额', lambda exp: exp.get('total_amount')),
+    ('备注', lambda exp: exp.get('notes')),
+    ('创建时间', lambda exp: exp.get('created_at'))
+]
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+_AMOUNT_COLUMN = EXPORT_HEADERS.index('总金额')
+_DATE_COLUMN = EXPORT_HEADERS.index('日期')
+_TYPE_COLUMN = EXPORT_HEADERS.index('类型')
+
+
+class ExportSummary:
+    """导出过程中逐行累计的统计摘要"""
 
-class ExportManager:
     def __init__(self):
-        self.db = get_db()
-        # 确保导出目录存在
-        os.makedirs(EXPORT_DIR, exist_ok=True)
-    
-    def get_export_data(self, expense_type=None, start_date=None, end_date=None):
-        """获取要导出的数据"""
-        if expense_type:
-            expenses = self.db.get_expenses_by_type(expense_type)
-        else:
-            expenses = self.db.get_all_expenses()
-        
-        # 转换为DataFrame
-        data = []
-        for expense in expenses:
-            exp_dict = dict(expense)
-            expense_type_name = EXPENSE_TYPES.get(
-                exp_dict['expense_type'], 
-                exp_dict['expense_type']
-            )
-            
-            data.append({
-                'ID': exp_dict['id'],
-                '日期': exp_dict['expense_date'],
-                '类型': expense_type_name,
-                '名称': exp_dict['name'],
-                '数量': exp_dict['quantity'],
-                '单价': exp_dict['unit_price'],
-                '总金额': exp_dict['total_amount'],
-                '备注': exp_dict['notes'],
-                '创建时间': exp_dict['created_at']
-            })
-        
-        # 创建DataFrame
-        df = pd.DataFrame(data)
-        
-        # 如果有日期筛选条件
-        if start_date or end_date:
-            if '日期' in df.columns and not df.empty:
-                df['日期'] = pd.to_datetime(df['日期'])
-                
-                if start_date:
-                    start_dt = pd.to_datetime(start_date)
-                    df = df[df['日期'] >= start_dt]
-                
-                if end_date:
-                    end_dt = pd.to_datetime(end_date)
-                    df = df[df['日期'] <= end_dt]
-        
-        return df
-    
-    def get_statistics_summary(self, df):
-        """获取统计摘要"""
-        if df.empty:
+        self.count = 0
+        self.total = 0
+        self.min_amount = None
+        self.max_amount = None
+        self.first_date = None
+        self.last_date = None
+        self.by_type = {}  # 类型显示名称 -> [记录数, 金额合计]
+
+    def add(self, row: List[Any]):
+        """计入一行导出数据"""
+        amount = row[_AMOUNT_COLUMN] or 0
+        self.count += 1
+        self.total += amount
+        if self.min_amount is None or amount < self.min_amount:
+            self.min_amount = amount
+        if self.max_amount is None or amount > self.max_amount:
+            self.max_amount = amount
+
+        day = day_of(row[_DATE_COLUMN])
+        if day:
+            if self.first_date is None or day < self.first_date:
+                self.first_date = day
+            if self.last_date is None or day > self.last_date:
+                self.last_date = day
+
+        bucket = self.by_type.setdefault(row[_TYPE_COLUMN], [0, 0])
+        bucket[0] += 1
+        bucket[1] += amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        """统计摘要（没有记录时返回空字典）"""
+        if not self.count:
             return {}
-        
-        # 确保日期列是datetime类型
-        if '日期' in df.columns and not df.empty:
-            try:
-                # 尝试将日期列转换为datetime
-                df['日期'] = pd.to_datetime(df['日期'])
-            except:
-                # 如果转换失败，使用当前时间
-                pass
-        
+
         summary = {
-            '记录总数': len(df),
-            '总金额': df['总金额'].sum(),
-            '平均金额': df['总金额'].mean(),
-            '最大金额': df['总金额'].max(),
-            '最小金额': df['总金额'].min(),
+            '记录总数': self.count,
+            '总金额': self.total,
+            '平均金额': self.total / self.count,
+            '最大金额': self.max_amount,
+            '最小金额': self.min_amount,
         }
-        
-        # 添加时间范围（如果日期列可用）
-        if '日期' in df.columns and not df.empty and pd.api.types.is_datetime64_any_dtype(df['日期']):
-            try:
-                time_range = f"{df['日期'].min().strftime('%Y-%m-%d')} 到 {df['日期'].max().strftime('%Y-%m-%d')}"
-                summary['时间范围'] = time_range
-            except:
-                summary['时间范围'] = "日期格式错误"
-        
-        # 按类型统计
-        if '类型' in df.columns:
-            type_stats = df.groupby('类型').agg({
-                'ID': 'count',
-                '总金额': 'sum'
-            }).rename(columns={'ID': '记录数'})
-            summary['按类型统计'] = type_stats
-        
+        if self.first_date:
+            summary['时间范围'] = f"{self.first_date} 到 {self.last_date}"
+        summary['按类型统计'] = self.by_type
         return summary
-    
-    def export_to_excel(self, df, filename=None):
-        """导出为Excel文件"""
-        if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"expenses_export_{timestamp}.xlsx"
-        
-        filepath = os.path.join(EXPORT_DIR, filename)
-        
+
+
+class ExportManager:
+    def __init__(self, file_manager=None):
+        self.file_manager = file_manager or get_file_manager()
+        # 确保导出目录存在
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    def iter_export_chunks(self, expense_type: Optional[str] = None, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None,
+                           progress: Optional[Callable[[int, int], None]] = None) -> Iterator[List[List[Any]]]:
+        """按块生成要导出的数据（按类型和日期范围筛选）
+
+        每次从文件管理器读取 EXPORT_CHUNK_ROWS 条记录，读取期间只短暂持有项目锁；
+        每读完一块调用 progress(已读取记录数, 记录总数)。
+        """
+        start = day_of(start_date) if start_date else None
+        end = day_of(end_date) if end_date else None
+        total = self.file_manager.get_expense_count()
+
+        offset = 0
+        while True:
+            page = self.file_manager.get_expenses_page(offset, EXPORT_CHUNK_ROWS)
+            if not page:
+                break
+            offset += len(page)
+
+            chunk = []
+            for expense in page:
+                if expense_type and expense.get('expense_type', 'other') != expense_type:
+                    continue
+                if start or end:
+                    day = day_of(expense_date(expense))
+                    if not day or (start and day < start) or (end and day > end):
+                        continue
+                chunk.append([value(expense) for _, value in EXPORT_COLUMNS])
+            if chunk:
+                yield chunk
+            if progress:
+                progress(offset, max(total, offset))
+
+    def iter_export_rows(self, expense_type: Optional[str] = None, start_date: Optional[str] = None,
+                         end_date: Optional[str] = None) -> Iterator[List[Any]]:
+        """逐行生成要导出的数据（按类型和日期范围筛选）"""
+        for chunk in self.iter_export_chunks(expense_type, start_date, end_date):
+            yield from chunk
+
+    def get_statistics_summary(self, rows) -> Dict[str, Any]:
+        """获取统计摘要（遍历一次导出数据）"""
+        summary = ExportSummary()
+        for row in rows:
+            summary.add(row)
+        return summary.to_dict()
+
+    def _export_path(self, filename: Optional[str], extension: str, timestamp: str) -> str:
+        """导出文件路径：默认带时间戳，文件名可以是绝对路径"""
+        if not filename:
+            filename = f"expenses_export_{timestamp}{extension}"
+        elif not filename.lower().endswith(extension):
+            filename += extension
+        return os.path.join(EXPORT_DIR, filename)
+
+    def export_to_excel(self, filename: Optional[str] = None, expense_type: Optional[str] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Tuple[Optional[str], bool]:
+        """导出为Excel文件（费用记录、统计摘要、类型统计三个工作表）
+
+        使用openpyxl只写模式逐行写入，内存占用与记录数无关；
+        单个工作表超过 EXCEL_MAX_ROWS_PER_SHEET 行时续写到“费用记录 (2)”等工作表。
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filepath = self._export_path(filename, '.xlsx', timestamp)
+
+        # openpyxl只在导出Excel时导入
+        openpyxl = optional_module('openpyxl')
+        if openpyxl is None:
+            print("[ERROR] Failed to export Excel: openpyxl is not installed (pip install openpyxl)")
+            return None, False
+
         try:
-            # 创建Excel写入器
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # 写入主数据
-                df.to_excel(writer, sheet_name='费用记录', index=False)
-                
-                # 获取统计摘要
-                summary = self.get_statistics_summary(df)
-                
-                # 创建统计工作表
-                summary_data = []
-                for key, value in summary.items():
-                    if key != '按类型统计':
-                        if isinstance(value, float):
-                            value = f"{value:.2f}"
-                        summary_data.append([key, value])
-                
-                summary_df = pd.DataFrame(summary_data, columns=['项目', '值'])
-                summary_df.to_excel(writer, sheet_name='统计摘要', index=False)
-                
-                # 如果有类型统计，写入单独的工作表
-                if '按类型统计' in summary and not summary['按类型统计'].empty:
-                    type_stats_df = summary['按类型统计'].reset_index()
-                    type_stats_df['总金额'] = type_stats_df['总金额'].apply(lambda x: f"{x:.2f}")
-                    type_stats_df.to_excel(writer, sheet_name='类型统计', index=False)
-            
+            workbook = openpyxl.Workbook(write_only=True)
+            summary = ExportSummary()
+
+            # 写入主数据（只写模式下工作表按创建顺序排列）
+            sheet_number = 1
+            sheet = workbook.create_sheet('费用记录')
+            sheet.append(EXPORT_HEADERS)
+            sheet_rows = 1
+            for chunk in self.iter_export_chunks(expense_type, start_date, end_date, progress):
+                for row in chunk:
+                    if sheet_rows >= EXCEL_MAX_ROWS_PER_SHEET:
+                        sheet_number += 1
+                        sheet = workbook.create_sheet(f'费用记录 ({sheet_number})')
+                        sheet.append(EXPORT_HEADERS)
+                        sheet_rows = 1
+                    summary.add(row)
+                    sheet.append(row)
+                    sheet_rows += 1
+
+            # 统计摘要在同一次遍历中已经累计好
+            stats = summary.to_dict()
+            summary_sheet = workbook.create_sheet('统计摘要')
+            summary_sheet.append(['项目', '值'])
+            for key, value in stats.items():
+                if key != '按类型统计':
+                    summary_sheet.append([key, round(value, 2) if isinstance(value, float) else value])
+            summary_sheet.append(['导出时间', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+
+            if stats.get('按类型统计'):
+                type_sheet = workbook.create_sheet('类型统计')
+                type_sheet.append(['类型', '记录数', '总金额'])
+                for type_name, (count, total) in stats['按类型统计'].items():
+                    type_sheet.append([type_name, count, round(total, 2)])
+
+            workbook.save(filepath)
+
+            print(f"[SUCCESS] Exported {summary.count} expenses to Excel: {filepath}")
             return filepath, True
         except Exception as e:
-            print(f"导出Excel失败: {str(e)}")
+            print(f"[ERROR] Failed to export Excel: {str(e)}")
+            if os.path.exists(filepath):
+                os.remove(filepath)
             return None, False
-    
-    def export_to_csv(self, df, filename=None):
-        """导出为CSV文件"""
+
+    def export_to_csv(self, filename: Optional[str] = None, expense_type: Optional[str] = None,
+                      start_date: Optional[str] = None, end_date: Optional[str] = None,
+                      progress: Optional[Callable[[int, int], None]] = None) -> Tuple[Optional[str], bool]:
+        """导出为CSV文件，同时生成统计摘要文件（<文件名>_stats.txt）"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filepath = self._export_path(filename, '.csv', timestamp)
+
         try:
-            # 始终生成时间戳，用于统计文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            if filename is None:
-                filename = f"expenses_export_{timestamp}.csv"
-            
-            filepath = os.path.join(EXPORT_DIR, filename)
-            
-            # 导出主数据
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
-            
-            # 创建统计摘要文件
-            stats_filename = f"expenses_stats_{timestamp}.txt"
-            stats_filepath = os.path.join(EXPORT_DIR, stats_filename)
-            self._create_stats_file(df, stats_filepath, timestamp)
-            
+            summary = ExportSummary()
+
+            # utf-8-sig 让Excel能正确识别中文
+            with open(filepath, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(EXPORT_HEADERS)
+                for chunk in self.iter_export_chunks(expense_type, start_date, end_date, progress):
+                    for row in chunk:
+                        summary.add(row)
+                    writer.writerows(chunk)
+
+            self._create_stats_file(summary.to_dict(), self._stats_path(filepath), timestamp)
+
+            print(f"[SUCCESS] Exported {summary.count} expenses to CSV: {filepath}")
             return filepath, True
         except Exception as e:
-            print(f"导出CSV失败: {str(e)}")
+            print(f"[ERROR] Failed to export CSV: {str(e)}")
+            if os.path.exists(filepath):
+                os.remove(filepath)
             return None, False
-    
-    def _create_stats_file(self, df, filepath, timestamp=None):
+
+    def _stats_path(self, filepath: str) -> str:
+        """导出文件对应的统计摘要文件路径"""
+        return os.path.splitext(filepath)[0] + '_stats.txt'
+
+    def _create_stats_file(self, summary: Dict[str, Any], filepath: str, timestamp: Optional[str] = None):
         """创建统计摘要文本文件"""
-        summary = self.get_statistics_summary(df)
-        
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write("费用统计摘要\n")
             f.write("=" * 50 + "\n\n")
-            
+
             # 写入基本统计
             f.write("基本统计:\n")
             f.write("-" * 30 + "\n")
             for key, value in summary.items():
                 if key != '按类型统计':
+                    if isinstance(value, float):
+                        value = f"{value:.2f}"
                     f.write(f"{key}: {value}\n")
-            
+            if not summary:
+                f.write("没有符合条件的记录\n")
+
             # 写入类型统计
-            if '按类型统计' in summary and not summary['按类型统计'].empty:
+            if summary.get('按类型统计'):
                 f.write("\n按类型统计:\n")
                 f.write("-" * 30 + "\n")
-                type_stats = summary['按类型统计']
-                for index, row in type_stats.iterrows():
-                    f.write(f"{index}: {row['记录数']}条记录, 总金额: {row['总金额']:.2f}\n")
-            
+                for type_name, (count, total) in summary['按类型统计'].items():
+                    f.write(f"{type_name}: {count}条记录, 总金额: {total:.2f}\n")
+
             export_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            f.write(f"\n导出时间: {export_time}\n")
             if timestamp:
-                f.write(f"\n导出时间: {export_time}\n")
                 f.write(f"导出批次: {timestamp}\n")
-            else:
-                f.write(f"\n导出时间: {export_time}\n")
-    
+
     def interactive_export(self):
-        """交互式导出"""
+        """交互式导出（命令行）"""
         print("\n=== 数据导出 ===")
-        
+
+        if not self.file_manager.current_project:
+            projects = self.file_manager.get_all_projects()
+            if not projects:
+                print("暂无项目")
+                return
+            print("\n请选择项目:")
+            for i, project in enumerate(projects, 1):
+                print(f"{i}. {project['name']}")
+            try:
+                project_choice = int(input(f"请选择项目 [1-{len(projects)}]: "))
+                if project_choice < 1 or project_choice > len(projects):
+                    raise ValueError("无效选择")
+            except ValueError:
+                print("无效输入")
+                return
+            if not self.file_manager.open_project(projects[project_choice - 1]['name']):
+                return
+
         # 选择导出格式
         print("\n请选择导出格式:")
         for i, fmt in enumerate(EXPORT_FORMATS, 1):
             print(f"{i}. {fmt.upper()}")
-        
+
         try:
             format_choice = int(input(f"请选择格式 [1-{len(EXPORT_FORMATS)}]: "))
             if format_choice < 1 or format_choice > len(EXPORT_FORMATS):
                 raise ValueError("无效选择")
             export_format = EXPORT_FORMATS[format_choice - 1]
         except ValueError:
-            print("无效输入，使用默认格式: excel")
-            export_format = "excel"
-        
+            print("无效输入，使用默认格式: csv")
+            export_format = "csv"
+
         # 选择导出范围
         print("\n导出范围:")
         print("1. 全部费用记录")
         print("2. 按类型导出")
         print("3. 按日期范围导出")
-        
+
         try:
             range_choice = int(input("请选择范围 [1-3]: "))
         except ValueError:
             print("无效输入，导出全部记录")
             range_choice = 1
-        
+
         expense_type = None
         start_date = None
         end_date = None
-        
+
         if range_choice == 2:
             # 按类型导出
-            from config import EXPENSE_TYPES
             type_keys = list(EXPENSE_TYPES.keys())
             print("\n请选择费用类型:")
             for i, key in enumerate(type_keys, 1):
                 print(f"{i}. {EXPENSE_TYPES[key]}")
-            
+
             try:
                 type_choice = int(input(f"请选择类型 [1-{len(type_keys)}]: "))
                 if type_choice < 1 or type_choice > len(type_keys):
@@ -241,16 +334,16 @@ class ExportManager:
                 expense_type = type_keys[type_choice - 1]
             except ValueError:
                 print("无效输入，导出全部记录")
-        
+
         elif range_choice == 3:
             # 按日期范围导出
             try:
-                start_date = input("开始日期 (YYYY-MM-DD，可选): ").strip()
+                start_date = input("开始日期 (YYYY-MM-DD，可选): ").strip() or None
                 if start_date:
                     # 验证日期格式
                     datetime.strptime(start_date, '%Y-%m-%d')
-                
-                end_date = input("结束日期 (YYYY-MM-DD，可选): ").strip()
+
+                end_date = input("结束日期 (YYYY-MM-DD，可选): ").strip() or None
                 if end_date:
                     # 验证日期格式
                     datetime.strptime(end_date, '%Y-%m-%d')
@@ -258,84 +351,63 @@ class ExportManager:
                 print("日期格式错误，使用默认范围")
                 start_date = None
                 end_date = None
-        
+
         # 自定义文件名
         custom_name = input("自定义文件名 (可选，按Enter使用默认): ").strip()
-        
-        # 获取数据
-        print("\n正在获取数据...")
-        df = self.get_export_data(expense_type, start_date, end_date)
-        
-        if df.empty:
-            print("没有找到符合条件的数据")
-            return
-        
-        print(f"找到 {len(df)} 条记录")
-        
-        # 执行导出
         filename = custom_name if custom_name else None
-        
+
+        print("\n正在导出...")
+        def show_progress(done, total):
+            print(f"  已读取 {done}/{total} 条记录")
+
         if export_format == 'excel':
-            filepath, success = self.export_to_excel(df, filename)
+            filepath, success = self.export_to_excel(filename, expense_type, start_date, end_date, show_progress)
             if success:
                 print(f"\n✅ Excel文件导出成功!")
                 print(f"文件位置: {os.path.abspath(filepath)}")
             else:
                 print("❌ 导出失败")
-        
+
         elif export_format == 'csv':
-            filepath, success = self.export_to_csv(df, filename)
+            filepath, success = self.export_to_csv(filename, expense_type, start_date, end_date, show_progress)
             if success:
                 print(f"\n✅ CSV文件导出成功!")
                 print(f"文件位置: {os.path.abspath(filepath)}")
-                # 同时生成了统计文件
-                stats_filepath = filepath.replace('.csv', '_stats.txt')
+                stats_filepath = self._stats_path(filepath)
                 if os.path.exists(stats_filepath):
                     print(f"统计文件: {os.path.abspath(stats_filepath)}")
             else:
                 print("❌ 导出失败")
-        
+
         else:
             print(f"不支持的导出格式: {export_format}")
-    
+
     def list_exports(self):
         """列出所有导出文件"""
         if not os.path.exists(EXPORT_DIR):
             print(f"导出目录 {EXPORT_DIR} 不存在")
             return
-        
+
         files = os.listdir(EXPORT_DIR)
         if not files:
             print("暂无导出文件")
             return
-        
+
         print(f"\n=== 导出文件列表 ({EXPORT_DIR}) ===")
-        
+
         # 按扩展名分类
-        excel_files = [f for f in files if f.endswith(('.xlsx', '.xls'))]
-        csv_files = [f for f in files if f.endswith('.csv')]
-        txt_files = [f for f in files if f.endswith('.txt')]
-        
-        if excel_files:
-            print("\nExcel文件:")
-            for file in sorted(excel_files):
-                filepath = os.path.join(EXPORT_DIR, file)
-                size = os.path.getsize(filepath)
-                mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                print(f"  {file} ({size:,} bytes, {mtime.strftime('%Y-%m-%d %H:%M')})")
-        
-        if csv_files:
-            print("\nCSV文件:")
-            for file in sorted(csv_files):
+        groups = [
+            ("Excel文件", [f for f in files if f.endswith(('.xlsx', '.xls'))]),
+            ("CSV文件", [f for f in files if f.endswith('.csv')]),
+            ("文本文件", [f for f in files if f.endswith('.txt')])
+        ]
+
+        for title, group in groups:
+            if not group:
+                continue
+            print(f"\n{title}:")
+            for file in sorted(group):
                 filepath = os.path.join(EXPORT_DIR, file)
                 size = os.path.getsize(filepath)
                 mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
                 print(f"  {file} ({size:,} bytes, {mtime.strftime('%Y-%m-%d %H:%M')})")
-        
-        if txt_files:
-            print("\n文本文件:")
-            for file in sorted(txt_files):
-                filepath = os.path.join(EXPORT_DIR, file)
-                size = os.path.getsize(filepath)
-                mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                print(f"  {file} ({size:,} bytes, {mtime.strftime('%Y-%m-%d %H:%M')})")
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+文件锁模块 - 多个程序（多个界面实例、脚本）同时修改同一个项目时的进程间互斥
+
+每个项目对应一个 <项目名>.lock 文件，写入项目文件或追加操作日志前对它加建议锁
+（Linux/macOS 上为 fcntl.flock，Windows 上为 msvcrt.locking）。锁可重入：
+同一个对象在持有锁时再次进入（例如添加费用时达到阈值触发保存）不会阻塞自己。
+两种锁都不可用时退化为不加锁（只在单个程序中使用时不受影响）。
+"""
+import os
+import time
+from typing import IO
+
+from .config import LOCK_FILE_EXTENSION, LOCK_TIMEOUT_SECONDS
+from .optional_deps import optional_module
+
+
+def lock_path_for(project_path: str) -> str:
+    """项目文件对应的锁文件路径"""
+    return os.path.splitext(project_path)[0] + LOCK_FILE_EXTENSION
+
+
+class ProjectFileLock:
+    """项目文件的进程间建议锁（可重入，用 with 语句加锁）"""
+
+    def __init__(self, project_path: str, timeout: float = LOCK_TIMEOUT_SECONDS):
+        self.path = lock_path_for(project_path)
+        self.timeout = timeout
+        self.wait_ms = 0.0  # 最近一次等待其他程序释放锁的耗时
+        self._file = None
+        self._depth = 0
+
+    @property
+    def held(self) -> bool:
+        return self._depth > 0
+
+    def acquire(self):
+        """加锁，其他程序持有锁时等待，超过 timeout 秒抛出 TimeoutError"""
+        if self._depth:
+            self._depth += 1
+            return
+
+        f = open(self.path, 'a+b')
+        started = time.perf_counter()
+        try:
+            if not _try_lock(f):
+                deadline = time.monotonic() + self.timeout
+                delay = 0.001
+                while not _try_lock(f):
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"项目正被其他程序写入，等待 {self.timeout:.0f} 秒后仍未释放: {self.path}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+        except BaseException:
+            f.close()
+            raise
+
+        self.wait_ms = (time.perf_counter() - started) * 1000
+        self._file = f
+        self._depth = 1
+
+    def release(self):
+        """解锁（最外层的 with 结束时才真正释放）"""
+        if not self._depth:
+            return
+        self._depth -= 1
+        if self._depth:
+            return
+        try:
+            _unlock(self._file)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'ProjectFileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def _try_lock(f: IO) -> bool:
+    """非阻塞地加排他锁，被其他程序持有时返回False"""
+    fcntl = optional_module('fcntl')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    msvcrt = optional_module('msvcrt')
+    if msvcrt is not None:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    return True
+
+
+def _unlock(f: IO):
+    fcntl = optional_module('fcntl')
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+
+    msvcrt = optional_module('msvcrt')
+    if msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
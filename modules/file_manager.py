@@ -2,31 +2,124 @@
 文件管理模块 - 替换原有的数据库系统
 基于JSON文件的项目数据存储系统
 """
+import contextlib
+import copy
+import functools
 import json
 import os
 import shutil
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable, Iterable, Tuple
 import hashlib
 
+from .atomic_write import atomic_write, backup_paths, WriteStats
+from .file_lock import ProjectFileLock, lock_path_for
+from .journal import ProjectJournal
+from .lazy_expenses import LazyExpenseList, StaleProjectFileError, load_project_lazily
+from .project_format import (
+    load_project_file, dump_json_project, dump_binary_project,
+    is_binary_project_file, read_project_header, project_summary_from_header
+)
+from .storage_backend import StorageBackend, expense_sort_key, check_expense_date
+from .expense_calculator import get_calculator
+from .expense_importer import prepare_expense_batch, iter_batches
+from .expense_stats import StatsAggregator
+from .time_rollup import TimeRollup, burn_rate
+from .expense_store import ExpenseStore, column_values
+from .id_index import PositionIndex
+from .project_catalog import ProjectCatalog, file_stamp
+from .project_watcher import ProjectWatcher
+from .portfolio import PortfolioCache, collect_portfolio_statistics
 from .config import (
     PROJECTS_DIR, 
-    PROJECT_FILE_EXTENSION,
+    PROJECT_FILE_FORMAT,
+    PROJECT_FILE_EXTENSIONS,
+    JOURNAL_FILE_EXTENSION,
+    JOURNAL_COMPACT_THRESHOLD,
+    AUTOSAVE_DELAY_SECONDS,
+    PROJECT_BACKUP_COUNT,
+    FSYNC_PROJECT_WRITES,
+    LAZY_LOAD_EXPENSES,
+    COLUMNAR_EXPENSE_STORE,
+    IMPORT_BATCH_ROWS,
     EXPENSE_TYPES,
     PREDEFINED_FORMULAS,
-    DEFAULT_PROJECT_TEMPLATE
+    DEFAULT_PROJECT_TEMPLATE,
+    STORAGE_BACKEND
 )
 
-class FileManager:
-    """文件管理器 - 管理项目文件的创建、读取、更新、删除"""
+def _locked(method):
+    """在文件管理器的锁内执行（自动保存在定时器线程中进行）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _ReadView:
+    """当前项目的只读快照，界面线程读取费用列表和统计时使用，不需要等待文件管理器的锁"""
+    
+    __slots__ = ('key', 'expenses', 'stats', 'custom_types', 'rollup', 'sort_orders', '_statistics', '_lock')
+    
+    def __init__(self, key, expenses, stats: StatsAggregator, custom_types: List[Dict[str, Any]],
+                 rollup: TimeRollup):
+        self.key = key                # (项目名称, 版本)
+        self.expenses = expenses      # 费用记录快照（列式存储写时复制，延迟加载的序列本身只读）
+        self.stats = stats            # 统计聚合的副本
+        self.custom_types = custom_types
+        self.rollup = rollup
+        self.sort_orders = {}         # (排序字段, 是否降序) -> 排序后的记录位置
+        self._statistics = None
+        self._lock = threading.Lock()
+    
+    def statistics(self) -> Dict[str, Any]:
+        """统计结果（第一次读取时生成；最大/最小值失效时在快照上重新计算，不占用文件管理器的锁）"""
+        with self._lock:
+            if self._statistics is None:
+                if self.stats.extremes_stale:
+                    self.stats.refresh_extremes(self.expenses)
+                self._statistics = self.stats.to_statistics(self.custom_types)
+            return self._statistics
+
+
+class FileManager(StorageBackend):
+    """文件管理器 - 管理项目文件的创建、读取、更新、删除（JSON存储后端）"""
     
-    def __init__(self):
-        """初始化文件管理器"""
+    def __init__(self, file_format: Optional[str] = None):
+        """初始化文件管理器
+        
+        file_format: 项目文件格式（"json" 或 "binary"），默认使用配置中的 PROJECT_FILE_FORMAT
+        """
         self.projects_dir = PROJECTS_DIR
-        self.file_extension = PROJECT_FILE_EXTENSION
+        self.file_format = file_format or PROJECT_FILE_FORMAT
+        if self.file_format not in PROJECT_FILE_EXTENSIONS:
+            raise ValueError(f"不支持的项目文件格式: {self.file_format}")
+        self.file_extension = PROJECT_FILE_EXTENSIONS[self.file_format]
         self._ensure_projects_dir()
+        self.catalog = ProjectCatalog(self.projects_dir)  # 项目摘要索引
+        self.portfolio = None  # 组合统计缓存（第一次汇总时创建）
+        self.watcher = None    # 项目目录监视器（start_watching 时创建）
+        self._own_stamp = None  # 本程序最后一次写入（或合并其他程序的修改）后当前项目文件和日志的文件戳
+        self._file_lock = None  # 当前项目的进程间文件锁
         self.current_project = None  # 当前打开的项目名称
         self.project_data = None     # 当前项目的完整数据
+        self.journal = None          # 当前项目的操作日志
+        self._formula_dependents = {}  # 公式ID -> 由该公式计算的费用记录ID集合
+        self.stats = None              # 当前项目的增量统计聚合
+        self.rollup = None             # 当前项目按日/月/季度的费用汇总
+        self._expense_index = None     # 费用记录ID -> 列表位置
+        self._formula_index = {}       # 公式ID -> 公式
+        self._custom_type_index = {}   # 自定义类型ID -> 类型
+        self._expenses_version = 0     # 费用记录（或统计用到的自定义类型）每次变化时递增，用于判断快照是否过期
+        self._view = None              # 最近一次发布的只读快照（_ReadView）
+        self.autosave_delay = AUTOSAVE_DELAY_SECONDS  # 修改后延迟保存的秒数，0表示立即保存
+        self.lock = threading.RLock()  # 保护项目数据（自动保存在定时器线程中执行）
+        self._dirty = False            # 内存中有尚未写入项目文件的修改
+        self._autosave_timer = None
+        self.write_stats = WriteStats()  # 项目文件写入耗时
         
     def _ensure_projects_dir(self):
         """确保项目目录存在"""
@@ -40,6 +133,11 @@ class FileManager:
         safe_name = self._sanitize_filename(project_name)
         return os.path.join(self.projects_dir, f"{safe_name}{self.file_extension}")
     
+    def _get_journal_path(self, project_name: str) -> str:
+        """获取项目操作日志文件完整路径"""
+        safe_name = self._sanitize_filename(project_name)
+        return os.path.join(self.projects_dir, f"{safe_name}{JOURNAL_FILE_EXTENSION}")
+    
     def _sanitize_filename(self, filename) -> str:
         """Clean filename, remove illegal characters"""
         # Convert to string to handle integer input
@@ -58,44 +156,61 @@ class FileManager:
         return filename
     
     def get_all_projects(self) -> List[Dict[str, Any]]:
-        """获取所有项目的基本信息列表"""
-        projects = []
-        
-        if not os.path.exists(self.projects_dir):
-            return projects
-        
-        for filename in os.listdir(self.projects_dir):
-            if filename.endswith(self.file_extension):
-                project_path = os.path.join(self.projects_dir, filename)
-                try:
-                    with open(project_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # 从JSON数据中获取项目名称，而不是从文件名推断
-                    project_info = data.get('project_info', {})
-                    project_name = project_info.get('name', '')
-                    
-                    # 如果JSON中没有项目名称，则使用文件名（不含扩展名）
-                    if not project_name:
-                        project_name = os.path.splitext(filename)[0]
-                    
-                    projects.append({
-                        'name': project_name,
-                        'file_name': filename,
-                        'path': project_path,
-                        'created_date': project_info.get('created_date', 'unknown'),
-                        'last_modified': project_info.get('last_modified', 'unknown'),
-                        'description': project_info.get('description', ''),
-                        'expense_count': len(data.get('expenses', [])),
-                        'total_amount': sum(exp.get('total_amount', 0) for exp in data.get('expenses', []))
-                    })
-                except Exception as e:
-                    print(f"[ERROR] Failed to read project file {filename}: {str(e)}")
+        """获取所有项目的基本信息列表（只重新解析有变化的项目文件）"""
+        projects = self.catalog.scan(self.file_extension, self._summarize_project_file)
         
         # 按最后修改时间排序，最新的在前
         projects.sort(key=lambda x: x.get('last_modified', ''), reverse=True)
         return projects
     
+    def get_cached_projects(self) -> List[Dict[str, Any]]:
+        """从项目目录索引中读取上次已知的项目列表（不读取项目文件，用于启动时立即显示）"""
+        projects = self.catalog.snapshot(self.file_extension)
+        projects.sort(key=lambda x: x.get('last_modified', ''), reverse=True)
+        return projects
+    
+    def _summarize_project_file(self, project_path: str, filename: str) -> Dict[str, Any]:
+        """读取项目文件并生成项目列表所需的摘要信息"""
+        journal_path = os.path.splitext(project_path)[0] + JOURNAL_FILE_EXTENSION
+        if not os.path.exists(journal_path) and is_binary_project_file(project_path):
+            # 二进制格式只需读取文件头，不解码费用记录
+            summary = project_summary_from_header(read_project_header(project_path))
+            project_info = summary['project_info']
+            expense_count = summary['expense_count']
+            total_amount = summary['total_amount']
+        else:
+            data = self._read_project_file(project_path)
+            project_info = data.get('project_info', {})
+            expense_count = len(data.get('expenses', []))
+            total_amount = sum(exp.get('total_amount', 0) for exp in data.get('expenses', []))
+        
+        # 从项目数据中获取项目名称，而不是从文件名推断
+        project_name = project_info.get('name', '')
+        
+        # 如果JSON中没有项目名称，则使用文件名（不含扩展名）
+        if not project_name:
+            project_name = os.path.splitext(filename)[0]
+        
+        return {
+            'name': project_name,
+            'file_name': filename,
+            'path': project_path,
+            'created_date': project_info.get('created_date', 'unknown'),
+            'last_modified': project_info.get('last_modified', 'unknown'),
+            'description': project_info.get('description', ''),
+            'expense_count': expense_count,
+            'total_amount': total_amount
+        }
+    
+    def _read_project_file(self, project_path: str) -> Dict[str, Any]:
+        """读取项目文件，并合并尚未压缩的操作日志（例如上次异常退出遗留的日志）"""
+        data = load_project_file(project_path)
+        
+        journal_path = os.path.splitext(project_path)[0] + JOURNAL_FILE_EXTENSION
+        if os.path.exists(journal_path):
+            ProjectJournal(journal_path).replay(data)
+        return data
+    
     def project_exists(self, project_name: str) -> bool:
         """检查项目是否已存在"""
         project_path = self._get_project_path(project_name)
@@ -114,7 +229,8 @@ class FileManager:
                 'name': project_name,
                 'created_date': now,
                 'last_modified': now,
-                'description': description
+                'description': description,
+                'version': 1  # 每次保存递增
             }
             
             # 添加预定义公式
@@ -130,8 +246,7 @@ class FileManager:
             
             # 保存项目文件
             project_path = self._get_project_path(project_name)
-            with open(project_path, 'w', encoding='utf-8') as f:
-                json.dump(project_data, f, ensure_ascii=False, indent=2)
+            self._write_project_file(project_path, project_data, keep_backups=False)
             
             print(f"[SUCCESS] Project created successfully: {project_name}")
             return True
@@ -140,21 +255,35 @@ class FileManager:
             print(f"[ERROR] Failed to create project: {str(e)}")
             return False
     
-    def open_project(self, project_name: str) -> Optional[Dict[str, Any]]:
-        """Open project, load project data into memory"""
+    @_locked
+    def open_project(self, project_name: str, lazy: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+        """Open project, load project data into memory
+        
+        lazy: 二进制项目文件是否延迟加载费用记录，默认使用配置中的 LAZY_LOAD_EXPENSES；
+        存在未合并的操作日志时总是完整加载。
+        """
         try:
             project_path = self._get_project_path(project_name)
             
             if not os.path.exists(project_path):
                 raise FileNotFoundError(f"Project file does not exist: {project_path}")
             
-            with open(project_path, 'r', encoding='utf-8') as f:
-                self.project_data = json.load(f)
-            
-            self.current_project = project_name
-            
-            # 更新最后修改时间
-            self._update_last_modified()
+            # 读取期间其他程序不能保存或追加日志
+            file_lock = ProjectFileLock(project_path)
+            with file_lock:
+                replayed = self._load_project(project_name, LAZY_LOAD_EXPENSES if lazy is None else lazy)
+                self.current_project = project_name
+                self._file_lock = file_lock
+                # 先记录刚读取的文件戳，下面的保存不会把同一个文件当作其他程序的修改再读一遍
+                self._remember_own_writes()
+                
+                # 重放了上次未合并（或其他程序尚未合并）的操作日志时合并回项目文件
+                if replayed:
+                    print(f"[RECOVER] Replayed {replayed} journal entries: {project_name}")
+                    self.save_project()
+                
+                # 更新最后修改时间
+                self._update_last_modified()
             
             print(f"[SUCCESS] Project opened successfully: {project_name}")
             return self.project_data
@@ -163,6 +292,27 @@ class FileManager:
             print(f"[ERROR] Failed to open project: {str(e)}")
             return None
     
+    def _load_project(self, project_name: str, lazy: bool) -> int:
+        """读取项目文件并重放操作日志，重建索引，返回重放的操作数（调用方持有文件锁）"""
+        project_path = self._get_project_path(project_name)
+        journal_path = self._get_journal_path(project_name)
+        if lazy and not os.path.exists(journal_path) and is_binary_project_file(project_path):
+            # 只读取项目信息、自定义类型和公式，费用记录在查看时按分段读取
+            self.project_data = load_project_lazily(project_path)
+        else:
+            self.project_data = load_project_file(project_path)
+        
+        # 重放操作日志中尚未合并的费用记录变更
+        if self.journal:
+            self.journal.close()
+        self.journal = ProjectJournal(journal_path)
+        replayed = self.journal.replay(self.project_data)
+        
+        # 重放过日志时保存的统计已过期，需要重新计算
+        self._build_indexes(trust_saved_stats=not replayed)
+        return replayed
+    
+    @_locked
     def save_project(self) -> bool:
         """Save current project to file"""
         try:
@@ -171,29 +321,71 @@ class FileManager:
             
             project_path = self._get_project_path(self.current_project)
             
-            # 更新最后修改时间
-            self._update_last_modified()
-            
-            # 保存到文件
-            with open(project_path, 'w', encoding='utf-8') as f:
-                json.dump(self.project_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"[SUCCESS] Project saved successfully: {self.current_project}")
+            # 加文件锁并先合并其他程序的修改，再写入，不会覆盖别人刚保存的内容
+            with self._project_write():
+                # 更新最后修改时间和版本号
+                self._update_last_modified()
+                project_info = self.project_data.setdefault('project_info', {})
+                project_info['version'] = project_info.get('version', 0) + 1
+                
+                # 延迟加载的费用记录需要先全部读入，才能写入新文件
+                self._ensure_expenses_loaded()
+                
+                # 统计聚合和时间汇总随项目一起保存
+                if self.stats is not None:
+                    self.project_data['statistics'] = self.stats.to_dict()
+                if self.rollup is not None:
+                    self.project_data['time_rollup'] = self.rollup.to_dict()
+                
+                # 先发布最新的只读快照，写入文件期间界面读取的就是保存的内容
+                self._refresh_view()
+                
+                # 保存到文件（原子替换，失败时原文件保持不变）
+                size = self._write_project_file(project_path, self.project_data)
+                
+                # 日志中的操作（包括其他程序追加的）已全部写入项目文件，清空日志
+                if self.journal:
+                    self.journal.truncate()
+                self._remember_own_writes()
+                
+            self._dirty = False
+            self._cancel_autosave()
+                
+            print(f"[SUCCESS] Project saved successfully: {self.current_project} "
+                  f"({size / 1024:.1f} KB, {self.write_stats.summary()['last_ms']:.1f} ms)")
             return True
             
         except Exception as e:
             print(f"[ERROR] Failed to save project: {str(e)}")
             return False
     
+    @_locked
     def close_project(self):
-        """关闭当前项目"""
+        """关闭当前项目（先写入尚未保存的修改）"""
         if self.current_project:
-            self.save_project()
+            self.flush()
             print(f"[SUCCESS] Project closed: {self.current_project}")
         
+        self._cancel_autosave()
+        self._dirty = False
+        
+        if self.journal:
+            self.journal.close()
+        
         self.current_project = None
         self.project_data = None
+        self.journal = None
+        self._own_stamp = None
+        self._file_lock = None
+        self._formula_dependents = {}
+        self.stats = None
+        self.rollup = None
+        self._expense_index = None
+        self._view = None
+        self._formula_index = {}
+        self._custom_type_index = {}
     
+    @_locked
     def delete_project(self, project_name: str) -> bool:
         """Delete project"""
         try:
@@ -207,6 +399,15 @@ class FileManager:
                 self.close_project()
             
             os.remove(project_path)
+            
+            for extra_path in (self._get_journal_path(project_name), lock_path_for(project_path)):
+                if os.path.exists(extra_path):
+                    os.remove(extra_path)
+            
+            for backup_path in backup_paths(project_path, PROJECT_BACKUP_COUNT):
+                if os.path.exists(backup_path):
+                    os.remove(backup_path)
+            
             print(f"[SUCCESS] Project deleted successfully: {project_name}")
             return True
             
@@ -214,6 +415,7 @@ class FileManager:
             print(f"[ERROR] Failed to delete project: {str(e)}")
             return False
     
+    @_locked
     def rename_project(self, old_name: str, new_name: str) -> bool:
         """Rename project"""
         try:
@@ -226,14 +428,33 @@ class FileManager:
             if os.path.exists(new_path):
                 raise ValueError(f"New project name already exists: {new_name}")
             
-            # 如果是当前打开的项目，更新项目数据中的名称
-            if self.current_project == old_name:
-                self.current_project = new_name
+            # 如果是当前打开的项目，先更新名称并合并日志，再移动文件
+            is_current = self.current_project == old_name
+            if is_current:
                 if self.project_data and 'project_info' in self.project_data:
                     self.project_data['project_info']['name'] = new_name
                 self.save_project()
+                self.journal.close()
             
             os.rename(old_path, new_path)
+            
+            old_journal_path = self._get_journal_path(old_name)
+            if os.path.exists(old_journal_path):
+                os.rename(old_journal_path, self._get_journal_path(new_name))
+            
+            for old_backup, new_backup in zip(backup_paths(old_path, PROJECT_BACKUP_COUNT),
+                                              backup_paths(new_path, PROJECT_BACKUP_COUNT)):
+                if os.path.exists(old_backup):
+                    os.replace(old_backup, new_backup)
+            
+            if os.path.exists(lock_path_for(old_path)):
+                os.remove(lock_path_for(old_path))
+            
+            if is_current:
+                self.current_project = new_name
+                self.journal = ProjectJournal(self._get_journal_path(new_name))
+                self._file_lock = ProjectFileLock(new_path)
+                self._remember_own_writes()
             print(f"[SUCCESS] Project renamed: {old_name} -> {new_name}")
             return True
             
@@ -241,46 +462,490 @@ class FileManager:
             print(f"[ERROR] Failed to rename project: {str(e)}")
             return False
     
+    # ===== 自动保存 =====
+    
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未写入项目文件的修改"""
+        return self._dirty
+    
+    def _mark_dirty(self):
+        """标记有未保存的修改，在 autosave_delay 秒后合并保存一次
+        
+        第一次修改时开始计时，计时期间的后续修改不再重新计时，
+        连续录入时也能按固定间隔保存。
+        """
+        self._dirty = True
+        if self.autosave_delay <= 0:
+            self.save_project()
+            return
+        
+        if self._autosave_timer is None:
+            self._autosave_timer = threading.Timer(self.autosave_delay, self._autosave, args=(self.current_project,))
+            self._autosave_timer.daemon = True
+            self._autosave_timer.start()
+    
+    def _cancel_autosave(self):
+        """取消尚未触发的自动保存"""
+        if self._autosave_timer is not None:
+            self._autosave_timer.cancel()
+            self._autosave_timer = None
+    
+    def _autosave(self, project_name: str):
+        """自动保存（定时器线程）"""
+        with self.lock:
+            self._autosave_timer = None
+            if self._dirty and self.current_project == project_name:
+                self.save_project()
+    
+    @_locked
+    def flush(self) -> bool:
+        """立即写入尚未保存的修改（需要马上持久化时调用）"""
+        self._cancel_autosave()
+        if not self._dirty or not self.current_project:
+            return True
+        return self.save_project()
+    
+    # ===== 外部修改 =====
+    
+    def _remember_own_writes(self):
+        """记录本程序写入后当前项目的文件戳，目录监视据此区分自己和其他程序的修改"""
+        try:
+            self._own_stamp = file_stamp(self._get_project_path(self.current_project))
+        except OSError:
+            self._own_stamp = None
+    
+    @contextlib.contextmanager
+    def _project_write(self):
+        """修改当前项目前加进程间文件锁，并先合并其他程序的修改
+        
+        所有写入（保存项目文件、追加操作日志）都在锁内进行，同一时刻只有一个程序写入；
+        费用记录的ID也在合并之后分配，多个程序同时添加费用不会得到相同的ID。
+        """
+        if not self.current_project or not self.project_data:
+            raise ValueError("没有打开的项目")
+        
+        with self._file_lock:
+            self._merge_external_changes()
+            yield
+    
+    def _merge_external_changes(self) -> bool:
+        """检查当前项目是否被其他程序修改，有修改时合并到内存中，返回是否合并了修改（调用方持有文件锁）
+        
+        先只比较文件戳（一次stat，不读取文件）：与本程序最后一次写入后的文件戳相同时没有冲突。
+        项目文件没变、操作日志变长时，其他程序只是追加了费用变更，只读取并应用新增的部分；
+        项目文件被其他程序保存过时，重新读取项目文件和日志（本程序的费用变更都已在日志中，
+        或已被对方合并进项目文件，不会丢失）。
+        """
+        project_path = self._get_project_path(self.current_project)
+        try:
+            stamp = file_stamp(project_path)
+        except OSError:
+            return False  # 项目文件被删除，保存时用内存中的数据重新写入
+        
+        own_stamp = self._own_stamp
+        if stamp == own_stamp:
+            return False
+        
+        if own_stamp is not None and stamp[:2] == own_stamp[:2] and stamp[3] > own_stamp[3]:
+            ops = self.journal.read_ops(offset=own_stamp[3])
+            self._apply_external_ops(ops)
+            print(f"[MERGE] Applied {len(ops)} expense changes from another program: {self.current_project}")
+        else:
+            old_version = self.project_data.get('project_info', {}).get('version', 0)
+            self._load_project(self.current_project, LAZY_LOAD_EXPENSES)
+            new_version = self.project_data.get('project_info', {}).get('version', 0)
+            self._dirty = self.journal.op_count > 0
+            print(f"[MERGE] Reloaded project saved by another program: {self.current_project} "
+                  f"(version {old_version} -> {new_version})")
+        
+        self._remember_own_writes()
+        return True
+    
+    def _apply_external_ops(self, ops: List[Dict[str, Any]]):
+        """把其他程序追加到操作日志中的费用变更应用到内存中的数据和索引上"""
+        self._ensure_expenses_loaded()
+        counters = self.project_data.setdefault('id_counters', {})
+        
+        for op in ops:
+            kind = op.get('op')
+            if kind in ('add', 'update'):
+                record = op['expense']
+                old = self._expense_index.get(record.get('id'))
+                if old is None:
+                    self._expense_index.append(record)
+                else:
+                    self._unindex_expense(old)
+                    self._expense_index.replace(record.get('id'), record)
+                self._index_expense(record)
+                if isinstance(record.get('id'), int):
+                    counters['expense'] = max(counters.get('expense', 0), record['id'])
+            elif kind == 'delete':
+                old = self._expense_index.pop(op.get('id'))
+                if old is not None:
+                    self._unindex_expense(old)
+            
+            if op.get('at'):
+                self.project_data['project_info']['last_modified'] = op['at']
+        
+        self.journal.op_count += len(ops)
+    
+    def start_watching(self, listener: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+        """开始监视项目目录，其他程序修改项目文件时更新项目索引和当前项目
+        
+        listener(结果) 在监视线程中调用，结果同 apply_external_changes。
+        """
+        if self.watcher is not None:
+            return True
+        
+        def on_change(filenames):
+            result = self.apply_external_changes(filenames)
+            if listener and (result['catalog_changed'] or result['current_reloaded'] or result['current_conflict']):
+                listener(result)
+        
+        try:
+            self.watcher = ProjectWatcher(on_change, (self.file_extension, JOURNAL_FILE_EXTENSION), self.projects_dir)
+            self.watcher.start()
+            return True
+        except Exception as e:
+            print(f"[ERROR] Failed to watch project directory: {str(e)}")
+            self.watcher = None
+            return False
+    
+    def stop_watching(self):
+        """停止监视项目目录"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+    
+    @_locked
+    def apply_external_changes(self, filenames: Iterable[str]) -> Dict[str, Any]:
+        """处理项目目录中发生变化的文件（项目文件或操作日志）
+        
+        只重新解析这些文件并更新项目索引；当前打开的项目被其他程序修改时合并这些修改
+        （见 _merge_external_changes），项目文件被删除时标记为冲突。
+        """
+        project_files = {os.path.splitext(name)[0] + self.file_extension for name in filenames}
+        result = {'changed_files': sorted(project_files), 'catalog_changed': False,
+                  'current_reloaded': False, 'current_conflict': False}
+        
+        if self.current_project:
+            current_file = os.path.basename(self._get_project_path(self.current_project))
+            if current_file in project_files:
+                try:
+                    stamp = file_stamp(self._get_project_path(self.current_project))
+                except OSError:
+                    stamp = None
+                
+                if stamp == self._own_stamp:
+                    # 本程序自己的写入
+                    project_files.discard(current_file)
+                elif stamp is None:
+                    print(f"[WARNING] Project file deleted by another program: {self.current_project}")
+                    result['current_conflict'] = True
+                else:
+                    try:
+                        with self._file_lock:
+                            result['current_reloaded'] = self._merge_external_changes()
+                    except Exception as e:
+                        print(f"[ERROR] Failed to merge external changes: {str(e)}")
+        
+        if project_files:
+            result['catalog_changed'] = self.catalog.refresh(project_files, self._summarize_project_file)
+        return result
+    
+    # ===== 文件写入 =====
+    
+    def _write_project_file(self, project_path: str, project_data: Dict[str, Any], keep_backups: bool = True) -> int:
+        """原子写入项目文件：临时文件 + fsync + os.replace，可选保留旧版本备份
+        
+        按 file_format 写入JSON或二进制格式；返回写入的字节数，耗时记录在 write_stats 中。
+        """
+        binary = self.file_format == 'binary'
+        return atomic_write(
+            project_path,
+            lambda f: (dump_binary_project if binary else dump_json_project)(project_data, f),
+            backup_count=PROJECT_BACKUP_COUNT if keep_backups else 0,
+            fsync=FSYNC_PROJECT_WRITES,
+            stats=self.write_stats,
+            binary=binary)
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """获取最近项目文件写入的耗时统计（毫秒）"""
+        return self.write_stats.summary()
+    
     def _update_last_modified(self):
         """更新最后修改时间"""
         if self.project_data and 'project_info' in self.project_data:
             self.project_data['project_info']['last_modified'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
+    # ===== 索引维护 =====
+    
+    def _build_indexes(self, trust_saved_stats: bool = True):
+        """根据当前项目数据重建内存索引、统计聚合和时间汇总
+        
+        项目文件中保存的统计和时间汇总与记录数一致时直接使用，否则重新计算。
+        费用记录延迟加载时只准备统计，ID索引等到第一次修改或按ID查找时再建立。
+        """
+        expenses = self.project_data.setdefault('expenses', [])
+        self._expenses_version += 1
+        self._rebuild_formula_index()
+        self._rebuild_custom_type_index()
+        
+        self.stats = None
+        self.rollup = None
+        if trust_saved_stats:
+            saved_stats = StatsAggregator.from_dict(self.project_data.get('statistics'))
+            if saved_stats is not None and saved_stats.count == len(expenses):
+                self.stats = saved_stats
+            saved_rollup = TimeRollup.from_dict(self.project_data.get('time_rollup'))
+            if saved_rollup is not None and saved_rollup.count == len(expenses):
+                self.rollup = saved_rollup
+        rebuild_stats = self.stats is None or self.rollup is None
+        if rebuild_stats:
+            self.stats = StatsAggregator()
+            self.rollup = TimeRollup()
+        
+        if isinstance(expenses, LazyExpenseList) and not rebuild_stats:
+            self._formula_dependents = {}
+            self._expense_index = None
+        else:
+            # 没有可用的统计时反正要读取全部记录，直接完整加载
+            expenses = self._adopt_expenses(expenses)
+            if rebuild_stats:
+                self.stats.rebuild(expenses)
+                self.rollup.rebuild(expenses)
+            self._index_all_expenses()
+        
+        self._init_id_counters()
+    
+    def _adopt_expenses(self, expenses) -> Union[ExpenseStore, List[Dict[str, Any]]]:
+        """把读入的费用记录转换为内存中使用的形式（列式存储或普通列表）"""
+        if COLUMNAR_EXPENSE_STORE:
+            if not isinstance(expenses, ExpenseStore):
+                expenses = ExpenseStore(expenses)
+        elif isinstance(expenses, LazyExpenseList):
+            expenses = expenses.materialize()
+        self.project_data['expenses'] = expenses
+        return expenses
+    
+    def _index_all_expenses(self):
+        """为全部费用记录建立ID索引和公式依赖索引"""
+        expenses = self.project_data['expenses']
+        self._expenses_version += 1
+        self._expense_index = PositionIndex(expenses)
+        self._formula_dependents = {}
+        for expense_id, formula_id in zip(column_values(expenses, 'id'), column_values(expenses, 'formula_id')):
+            if formula_id is not None:
+                self._formula_dependents.setdefault(formula_id, set()).add(expense_id)
+    
+    def _ensure_expenses_loaded(self):
+        """延迟加载的费用记录在需要修改或按ID查找时全部读入内存并建立索引"""
+        expenses = self.project_data.get('expenses')
+        if isinstance(expenses, LazyExpenseList):
+            try:
+                self._adopt_expenses(expenses)
+            except StaleProjectFileError:
+                # 项目文件已被其他程序替换，在文件锁内重新读取后再全部读入
+                self._reload_replaced_project()
+                with self._file_lock:
+                    self._ensure_expenses_loaded()
+                return
+            self._index_all_expenses()
+    
+    def _reload_replaced_project(self):
+        """延迟加载的项目文件被其他程序替换（分段偏移已失效）时重新读取当前项目"""
+        print(f"[MERGE] Project file replaced during lazy loading, reloading: {self.current_project}")
+        with self._file_lock:
+            self._merge_external_changes()
+    
+    def _rebuild_formula_index(self):
+        """重建公式ID索引（ID重复时与按顺序查找一致，取第一个）"""
+        self._formula_index = {}
+        for formula in self.project_data.setdefault('formulas', []):
+            self._formula_index.setdefault(formula.get('id'), formula)
+    
+    def _rebuild_custom_type_index(self):
+        """重建自定义类型ID索引"""
+        self._custom_type_index = {}
+        for custom_type in self.project_data.setdefault('custom_expense_types', []):
+            self._custom_type_index.setdefault(custom_type.get('id'), custom_type)
+    
+    def _init_id_counters(self):
+        """初始化ID计数器，保证不小于已有记录的最大ID
+        
+        旧项目文件没有计数器，或者日志重放加入了新记录时，从现有记录中补齐。
+        """
+        counters = self.project_data.setdefault('id_counters', {})
+        expenses = self.project_data['expenses']
+        if isinstance(expenses, LazyExpenseList) and 'expense' in counters:
+            expense_ids = []  # 延迟加载且文件中已有计数器时不需要读取全部记录
+        else:
+            expense_ids = column_values(expenses, 'id')
+        type_ids = [t.get('id') for t in self.project_data['custom_expense_types']]
+        formula_numbers = [_custom_formula_number(f.get('id')) for f in self.project_data['formulas']
+                           if f.get('is_custom', False)]
+        
+        for kind, ids in (('expense', expense_ids), ('custom_expense_type', type_ids),
+                          ('custom_formula', formula_numbers)):
+            ids = [i for i in ids if isinstance(i, int)]
+            counters[kind] = max([counters.get(kind, 0)] + ids)
+    
+    def _next_id(self, kind: str) -> int:
+        """分配下一个ID（单调递增，删除后的ID不会被重复使用）"""
+        counters = self.project_data.setdefault('id_counters', {})
+        counters[kind] = counters.get(kind, 0) + 1
+        return counters[kind]
+    
+    def _index_expense(self, expense: Dict[str, Any]):
+        """把一条费用记录加入索引和统计"""
+        self._expenses_version += 1
+        formula_id = expense.get('formula_id')
+        if formula_id is not None:
+            self._formula_dependents.setdefault(formula_id, set()).add(expense.get('id'))
+        self.stats.add(expense)
+        self.rollup.add(expense)
+    
+    def _unindex_expense(self, expense: Dict[str, Any]):
+        """把一条费用记录移出索引和统计"""
+        self._expenses_version += 1
+        formula_id = expense.get('formula_id')
+        if formula_id is not None:
+            self._formula_dependents.get(formula_id, set()).discard(expense.get('id'))
+        self.stats.remove(expense)
+        self.rollup.remove(expense)
+    
     # ===== 费用记录管理方法 =====
     
+    def _log_expense_op(self, op: Dict[str, Any]):
+        """记录一次费用变更：追加到操作日志，达到阈值时合并回项目文件"""
+        self._update_last_modified()
+        op['at'] = self.project_data['project_info']['last_modified']
+        self.journal.append(op)
+        self._remember_own_writes()
+        
+        # 日志保证每次修改不丢失，项目文件由自动保存合并写入
+        if self.journal.op_count >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact_journal()
+        else:
+            self._mark_dirty()
+    
+    @_locked
+    def compact_journal(self) -> bool:
+        """将操作日志合并回项目文件"""
+        if not self.journal or not self.journal.op_count:
+            return True
+        return self.save_project()
+    
+    @_locked
     def add_expense(self, expense_data: Dict[str, Any]) -> Optional[int]:
         """添加费用记录"""
         try:
-            if not self.current_project or not self.project_data:
-                raise ValueError("没有打开的项目")
+            check_expense_date(expense_data)
+            
+            # 加文件锁并合并其他程序的修改后再分配ID
+            with self._project_write():
+                self._ensure_expenses_loaded()
+                
+                # 生成唯一的ID
+                new_id = self._next_id('expense')
+                
+                # 创建完整的费用记录
+                expense_record = {
+                    'id': new_id,
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+                expense_record.update(expense_data)
+                
+                # 添加到项目数据
+                self._expense_index.append(expense_record)
+                self._index_expense(expense_record)
+                
+                # 追加写入操作日志
+                self._log_expense_op({'op': 'add', 'expense': expense_record})
             
-            # 生成唯一的ID
-            expenses = self.project_data.get('expenses', [])
-            new_id = max([exp.get('id', 0) for exp in expenses], default=0) + 1
+            print(f"[SUCCESS] Expense added: ID={new_id}")
+            return new_id
             
-            # 创建完整的费用记录
-            expense_record = {
-                'id': new_id,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            expense_record.update(expense_data)
+        except Exception as e:
+            print(f"[ERROR] Failed to add expense: {str(e)}")
+            return None
+    
+    def bulk_add_expenses(self, expenses: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_ROWS,
+                          progress: Optional[Callable[[int], None]] = None) -> Optional[Dict[str, Any]]:
+        """批量添加费用记录（导入大量记录时使用）
+        
+        逐批读取 expenses，每 batch_size 条校验一次并按公式批量计算总金额，每批完成后调用
+        progress(已读取的记录数)；全部校验完成后在文件锁内一次分配ID，只保存一次项目文件
+        （不逐条写操作日志）。有错误的记录被跳过，其余记录要么全部加入、要么都不加入。
+        
+        返回 {'rows': 读取的记录数, 'added': 添加的记录数, 'errors': [(记录序号, 原因)],
+              'first_id', 'last_id', 'seconds', 'rows_per_second'}，失败时返回None。
+        """
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
             
-            # 添加到项目数据
-            if 'expenses' not in self.project_data:
-                self.project_data['expenses'] = []
+            started = time.perf_counter()
+            with self.lock:
+                formulas = dict(self._formula_index)
             
-            self.project_data['expenses'].append(expense_record)
+            # 校验和计算不持有锁，读取文件期间界面和其他程序仍可以访问项目
+            valid, errors, rows = [], [], 0
+            for batch in iter_batches(expenses, batch_size):
+                batch_valid, batch_errors = prepare_expense_batch(batch, formulas, rows + 1)
+                valid.extend(batch_valid)
+                errors.extend(batch_errors)
+                rows += len(batch)
+                if progress:
+                    progress(rows)
             
-            # 保存项目
-            self.save_project()
+            first_id, last_id = self._commit_expenses(valid) if valid else (None, None)
             
-            print(f"[SUCCESS] Expense added: ID={new_id}")
-            return new_id
+            seconds = time.perf_counter() - started
+            print(f"[SUCCESS] Bulk added {len(valid)} expenses "
+                  f"({len(errors)} rejected, {rows / seconds if seconds else 0:.0f} rows/s)")
+            return {'rows': rows, 'added': len(valid), 'errors': errors, 'first_id': first_id, 'last_id': last_id,
+                    'seconds': seconds, 'rows_per_second': rows / seconds if seconds else 0.0}
             
         except Exception as e:
-            print(f"[ERROR] Failed to add expense: {str(e)}")
+            print(f"[ERROR] Failed to bulk add expenses: {str(e)}")
             return None
     
+    @_locked
+    def _commit_expenses(self, expenses: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """为校验过的记录分配连续的ID并加入当前项目，保存一次，返回 (第一个ID, 最后一个ID)
+        
+        保存失败时重新读取项目文件，内存中不留下只加入了一部分的记录。
+        """
+        with self._project_write():
+            self._ensure_expenses_loaded()
+            
+            # 合并其他程序的修改之后再分配ID，一次占用一段连续的ID
+            counters = self.project_data.setdefault('id_counters', {})
+            first_id = counters.get('expense', 0) + 1
+            created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            records = []
+            for expense_id, expense in enumerate(expenses, first_id):
+                record = {'id': expense_id, 'created_at': created_at}
+                record.update(expense)
+                record['id'] = expense_id
+                records.append(record)
+            
+            try:
+                counters['expense'] = first_id + len(records) - 1
+                self._expense_index.extend(records)
+                for record in records:
+                    self._index_expense(record)
+                if not self.save_project():
+                    raise IOError("保存项目文件失败")
+            except Exception:
+                self._load_project(self.current_project, LAZY_LOAD_EXPENSES)
+                self._remember_own_writes()
+                raise
+            
+            return first_id, counters['expense']
+    
     def get_all_expenses(self) -> List[Dict[str, Any]]:
         """获取所有费用记录"""
         if not self.current_project or not self.project_data:
@@ -288,57 +953,157 @@ class FileManager:
         
         return self.project_data.get('expenses', [])
     
+    def get_expense_count(self) -> int:
+        """获取当前项目的费用记录数"""
+        if not self.current_project or not self.project_data:
+            return 0
+        
+        return len(self.project_data.get('expenses', []))
+    
+    # ===== 只读快照 =====
+    
+    def _read_view(self) -> Optional[_ReadView]:
+        """取得当前项目的只读快照
+        
+        锁空闲时按需发布新的快照；其他线程（自动保存、后台任务、批量导入）持有锁时
+        直接使用上一次发布的快照，界面线程不会等待。还没有快照时才等待锁。
+        """
+        if not self.lock.acquire(blocking=False):
+            view = self._view
+            if view is not None and view.key[0] == self.current_project:
+                return view
+            self.lock.acquire()
+        try:
+            return self._refresh_view()
+        finally:
+            self.lock.release()
+    
+    def _refresh_view(self) -> Optional[_ReadView]:
+        """在锁内按需重新发布只读快照
+        
+        列式存储共享各分块（之后修改时只复制改动的分块），统计聚合和时间汇总复制一份，
+        耗时与记录数无关。统计结果等到读取时才在快照上生成。
+        """
+        if not self.current_project or not self.project_data:
+            return None
+        key = (self.current_project, self._expenses_version)
+        if self._view is not None and self._view.key == key:
+            return self._view
+        
+        expenses = self.project_data.get('expenses', [])
+        if isinstance(expenses, ExpenseStore):
+            expenses = expenses.snapshot()
+        elif not isinstance(expenses, LazyExpenseList):
+            expenses = list(expenses)
+        
+        stats = StatsAggregator.from_dict(self.stats.to_dict())
+        custom_types = [dict(t) for t in self.get_all_custom_expense_types()]
+        self._view = _ReadView(key, expenses, stats, custom_types, self.rollup.copy())
+        return self._view
+    
+    def get_expenses_page(self, offset: int, limit: int, sort_by: Optional[str] = None,
+                          descending: bool = False) -> List[Dict[str, Any]]:
+        """按位置取一页费用记录（供表格虚拟滚动使用，读取只读快照）
+        
+        排序结果按(字段, 方向)缓存在快照中，费用记录没有变化时翻页不再重新排序。
+        """
+        view = self._read_view()
+        if view is None:
+            return []
+        
+        try:
+            return self._read_expenses_page(view, offset, limit, sort_by, descending)
+        except StaleProjectFileError:
+            self._reload_replaced_project()
+            view = self._read_view()
+            return self._read_expenses_page(view, offset, limit, sort_by, descending) if view else []
+    
+    def _read_expenses_page(self, view: _ReadView, offset: int, limit: int, sort_by: Optional[str],
+                            descending: bool) -> List[Dict[str, Any]]:
+        expenses = view.expenses
+        offset = max(0, offset)
+        if sort_by:
+            order = self._sorted_positions(view, sort_by, descending)
+            return [expenses[i] for i in order[offset:offset + limit]]
+        return expenses[offset:offset + limit]
+    
+    def _sorted_positions(self, view: _ReadView, sort_by: str, descending: bool) -> List[int]:
+        """获取快照中按字段排序后的记录位置（带缓存）"""
+        order = view.sort_orders.get((sort_by, descending))
+        if order is None:
+            # 延迟加载时逐段只取排序字段，不把全部记录读入内存
+            expenses = view.expenses
+            key = expense_sort_key(sort_by)
+            # 只取排序字段所在的列；没有该字段的记录用整行计算（日期字段兼容旧的 expense_date）
+            keys = [key({sort_by: value}) if value is not None else key(expenses[i])
+                    for i, value in enumerate(column_values(expenses, sort_by))]
+            order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+            if descending:
+                # 稳定排序，把空值重新移到末尾
+                order.sort(key=lambda i: keys[i][0])
+            view.sort_orders[(sort_by, descending)] = order
+        return order
+    
+    @_locked
     def get_expense_by_id(self, expense_id: int) -> Optional[Dict[str, Any]]:
-        """根据ID获取费用记录"""
-        expenses = self.get_all_expenses()
-        for expense in expenses:
-            if expense.get('id') == expense_id:
-                return expense
-        return None
+        """根据ID获取费用记录
+        
+        延迟加载时需要先全部读入并建立索引，界面中应通过后台任务调用。
+        """
+        if not self.current_project or not self.project_data:
+            return None
+        
+        self._ensure_expenses_loaded()
+        return self._expense_index.get(expense_id)
     
+    @_locked
     def update_expense(self, expense_id: int, expense_data: Dict[str, Any]) -> bool:
         """更新费用记录"""
         try:
-            expenses = self.project_data.get('expenses', [])
-            
-            for i, expense in enumerate(expenses):
-                if expense.get('id') == expense_id:
-                    # 保留原有的创建时间和ID
-                    expense_data['id'] = expense_id
-                    expense_data['created_at'] = expense.get('created_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                    
-                    # 更新记录
-                    self.project_data['expenses'][i] = expense_data
-                    
-                    # 保存项目
-                    self.save_project()
-                    
-                    print(f"[SUCCESS] Expense updated: ID={expense_id}")
-                    return True
-            
-            raise ValueError(f"找不到费用记录: ID={expense_id}")
+            check_expense_date(expense_data)
+            
+            # 其他程序可能已经删除了该记录，合并后再查找
+            with self._project_write():
+                expense = self.get_expense_by_id(expense_id)
+                if expense is None:
+                    raise ValueError(f"找不到费用记录: ID={expense_id}")
+                
+                # 保留原有的创建时间和ID
+                expense_data['id'] = expense_id
+                expense_data['created_at'] = expense.get('created_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                
+                # 更新记录
+                self._unindex_expense(expense)
+                self._expense_index.replace(expense_id, expense_data)
+                self._index_expense(expense_data)
+                
+                # 追加写入操作日志
+                self._log_expense_op({'op': 'update', 'expense': expense_data})
+            
+            print(f"[SUCCESS] Expense updated: ID={expense_id}")
+            return True
             
         except Exception as e:
             print(f"[ERROR] Failed to update expense: {str(e)}")
             return False
     
+    @_locked
     def delete_expense(self, expense_id: int) -> bool:
         """删除费用记录"""
         try:
-            expenses = self.project_data.get('expenses', [])
-            
-            for i, expense in enumerate(expenses):
-                if expense.get('id') == expense_id:
-                    # 删除记录
-                    del self.project_data['expenses'][i]
-                    
-                    # 保存项目
-                    self.save_project()
-                    
-                    print(f"[SUCCESS] Expense deleted: ID={expense_id}")
-                    return True
-            
-            raise ValueError(f"找不到费用记录: ID={expense_id}")
+            with self._project_write():
+                # 删除记录
+                self._ensure_expenses_loaded()
+                expense = self._expense_index.pop(expense_id)
+                if expense is None:
+                    raise ValueError(f"找不到费用记录: ID={expense_id}")
+                self._unindex_expense(expense)
+                
+                # 追加写入操作日志
+                self._log_expense_op({'op': 'delete', 'id': expense_id})
+            
+            print(f"[SUCCESS] Expense deleted: ID={expense_id}")
+            return True
             
         except Exception as e:
             print(f"[ERROR] Failed to delete expense: {str(e)}")
@@ -346,31 +1111,29 @@ class FileManager:
     
     # ===== 自定义类型管理方法 =====
     
+    @_locked
     def add_custom_expense_type(self, type_data: Dict[str, Any]) -> Optional[int]:
         """添加自定义费用类型"""
         try:
-            if not self.current_project or not self.project_data:
-                raise ValueError("没有打开的项目")
-            
-            # 生成唯一的ID
-            custom_types = self.project_data.get('custom_expense_types', [])
-            new_id = max([t.get('id', 0) for t in custom_types], default=0) + 1
-            
-            # 创建类型记录
-            type_record = {
-                'id': new_id,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            type_record.update(type_data)
-            
-            # 添加到项目数据
-            if 'custom_expense_types' not in self.project_data:
-                self.project_data['custom_expense_types'] = []
-            
-            self.project_data['custom_expense_types'].append(type_record)
-            
-            # 保存项目
-            self.save_project()
+            # 加文件锁并合并其他程序的修改后再分配ID
+            with self._project_write():
+                # 生成唯一的ID
+                new_id = self._next_id('custom_expense_type')
+                
+                # 创建类型记录
+                type_record = {
+                    'id': new_id,
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+                type_record.update(type_data)
+                
+                # 添加到项目数据
+                self.project_data['custom_expense_types'].append(type_record)
+                self._custom_type_index.setdefault(new_id, type_record)
+                self._expenses_version += 1  # 统计结果中的自定义类型名称随之变化
+                
+                # 自定义类型不写操作日志，立即写入项目文件，其他程序合并时才能读到
+                self.save_project()
             
             print(f"[SUCCESS] Custom expense type added: ID={new_id}")
             return new_id
@@ -386,32 +1149,37 @@ class FileManager:
         
         return self.project_data.get('custom_expense_types', [])
     
+    def get_custom_expense_type_by_id(self, type_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取自定义费用类型"""
+        if not self.current_project or not self.project_data:
+            return None
+        
+        return self._custom_type_index.get(type_id)
+    
     # ===== 公式管理方法 =====
     
+    @_locked
     def add_custom_formula(self, formula_data: Dict[str, Any]) -> Optional[int]:
         """添加自定义公式"""
         try:
-            if not self.current_project or not self.project_data:
-                raise ValueError("没有打开的项目")
-            
-            # 生成唯一的ID
-            formulas = self.project_data.get('formulas', [])
-            custom_formulas = [f for f in formulas if f.get('is_custom', False)]
-            new_id = max([f.get('id', 0) for f in custom_formulas], default=0) + 1
-            
-            # 创建公式记录
-            formula_record = {
-                'id': f"custom_{new_id}",
-                'is_custom': True,
-                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            formula_record.update(formula_data)
-            
-            # 添加到项目数据
-            self.project_data['formulas'].append(formula_record)
-            
-            # 保存项目
-            self.save_project()
+            with self._project_write():
+                # 生成唯一的ID（自定义公式ID为 custom_N）
+                new_id = self._next_id('custom_formula')
+                
+                # 创建公式记录
+                formula_record = {
+                    'id': f"custom_{new_id}",
+                    'is_custom': True,
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+                formula_record.update(formula_data)
+                
+                # 添加到项目数据
+                self.project_data['formulas'].append(formula_record)
+                self._formula_index.setdefault(formula_record['id'], formula_record)
+                
+                # 公式不写操作日志，立即写入项目文件
+                self.save_project()
             
             print(f"[SUCCESS] Custom formula added: ID={formula_record['id']}")
             return formula_record['id']
@@ -420,6 +1188,88 @@ class FileManager:
             print(f"[ERROR] Failed to add custom formula: {str(e)}")
             return None
     
+    @_locked
+    def update_custom_formula(self, formula_id: str, formula_data: Dict[str, Any]) -> Optional[int]:
+        """更新自定义公式，并重新计算由该公式得出的费用记录
+        
+        返回重新计算的记录数，失败时返回None。
+        """
+        try:
+            with self._project_write():
+                formula = self.get_formula_by_id(formula_id)
+                if not formula:
+                    raise ValueError(f"找不到公式: ID={formula_id}")
+                if not formula.get('is_custom', False):
+                    raise ValueError("预定义公式不能修改")
+                
+                # 重新计算依赖该公式的记录需要完整的索引
+                self._ensure_expenses_loaded()
+                
+                # 先校验新表达式并用它算出全部相关记录的金额，任何一条算不出来都拒绝修改，
+                # 公式和已有金额保持不变
+                expression = formula_data.get('expression', formula.get('expression'))
+                params = formula_data.get('params', formula.get('params', []))
+                get_calculator().compile(expression, params)
+                rows, totals = self._calculate_formula_dependents(formula_id, expression, params)
+                
+                formula.update(formula_data)
+                formula['id'] = formula_id  # ID不允许修改，公式索引保持有效
+                formula['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                
+                recalculated = self._apply_recalculated_totals(rows, totals)
+                
+                # 公式和重新计算的金额不写操作日志，立即写入项目文件
+                self.save_project()
+            
+            print(f"[SUCCESS] Custom formula updated: ID={formula_id}, recalculated {recalculated} expenses")
+            return recalculated
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to update custom formula: {str(e)}")
+            return None
+    
+    def _calculate_formula_dependents(self, formula_id: str, expression: str,
+                                      param_names: List[str]) -> Tuple[List[Dict[str, Any]], List[float]]:
+        """用新的表达式批量计算依赖某个公式的费用记录（不修改任何数据）
+        
+        返回 (记录, 新的总金额)；任何一条记录计算失败时抛出 ValueError。
+        """
+        dependent_ids = self._formula_dependents.get(formula_id)
+        if not dependent_ids:
+            return [], []
+        
+        dependents = (self._expense_index.get(expense_id) for expense_id in dependent_ids)
+        rows = [exp for exp in dependents
+                if exp is not None and all(name in exp.get('params', {}) for name in param_names)]
+        skipped = len(dependent_ids) - len(rows)
+        if skipped:
+            print(f"[WARNING] {skipped} expenses lack parameters for formula {formula_id}, not recalculated")
+        if not rows:
+            return [], []
+        
+        calculator = get_calculator()
+        if param_names:
+            columns = {name: [exp['params'][name] for exp in rows] for name in param_names}
+            totals = calculator.calculate_batch(expression, columns)
+        else:
+            totals = [calculator.calculate_expense(expression, {})] * len(rows)
+        return rows, totals
+    
+    def _apply_recalculated_totals(self, rows: List[Dict[str, Any]], totals: List[float]) -> int:
+        """写回重新计算的总金额并更新统计，返回更新的记录数"""
+        if not rows:
+            return 0
+        
+        for expense, total in zip(rows, totals):
+            self.stats.remove(expense)
+            self.rollup.remove(expense)
+            expense['total_amount'] = total
+            self._expense_index.replace(expense['id'], expense)  # 列式存储返回的是副本，需要写回
+            self.stats.add(expense)
+            self.rollup.add(expense)
+        self._expenses_version += 1
+        return len(rows)
+    
     def get_all_formulas(self) -> List[Dict[str, Any]]:
         """获取所有公式（包括预定义和自定义）"""
         if not self.current_project or not self.project_data:
@@ -429,99 +1279,83 @@ class FileManager:
     
     def get_formula_by_id(self, formula_id: str) -> Optional[Dict[str, Any]]:
         """根据ID获取公式"""
-        formulas = self.get_all_formulas()
-        for formula in formulas:
-            if formula.get('id') == formula_id:
-                return formula
-        return None
+        if not self.current_project or not self.project_data:
+            return None
+        
+        return self._formula_index.get(formula_id)
     
     # ===== 统计方法 =====
     
     def get_expense_statistics(self) -> Dict[str, Any]:
-        """获取费用统计信息"""
-        if not self.current_project or not self.project_data:
+        """获取费用统计信息（读取只读快照中增量维护的聚合结果）"""
+        view = self._read_view()
+        if view is None:
             return {}
         
-        expenses = self.get_all_expenses()
-        
-        if not expenses:
-            return {
-                'overall': {
-                    'total_count': 0,
-                    'grand_total': 0,
-                    'avg_amount': 0
-                },
-                'by_type': [],
-                'by_custom_type': []
-            }
+        # 只有删除了最大/最小金额的记录后才需要在快照上重新遍历
+        stale = view.stats.extremes_stale
+        try:
+            statistics = view.statistics()
+        except StaleProjectFileError:
+            self._reload_replaced_project()
+            return self.get_expense_statistics()
+        if stale:
+            self._adopt_view_extremes(view)
+        return copy.deepcopy(statistics)
+    
+    def _adopt_view_extremes(self, view: _ReadView):
+        """快照仍是最新时，把在快照上重新计算的最大/最小值写回统计聚合（锁被占用时跳过）"""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if view.key == (self.current_project, self._expenses_version) and self.stats.extremes_stale:
+                self.stats.adopt_extremes(view.stats)
+        finally:
+            self.lock.release()
+    
+    def get_expense_time_series(self, granularity: str = 'month', start: Optional[str] = None,
+                                end: Optional[str] = None, expense_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按日/月/季度汇总的费用序列（读取预先汇总的结果，附带累计支出和消耗速率）
         
-        # 总体统计
-        total_count = len(expenses)
-        grand_total = sum(exp.get('total_amount', 0) for exp in expenses)
-        avg_amount = grand_total / total_count if total_count > 0 else 0
-        
-        # 按类型统计
-        type_stats = {}
-        for expense in expenses:
-            expense_type = expense.get('expense_type', 'other')
-            type_name = EXPENSE_TYPES.get(expense_type, expense_type)
-            
-            if type_name not in type_stats:
-                type_stats[type_name] = {
-                    'count': 0,
-                    'total_amount': 0
-                }
-            
-            type_stats[type_name]['count'] += 1
-            type_stats[type_name]['total_amount'] += expense.get('total_amount', 0)
-        
-        # 转换为列表格式
-        by_type = []
-        for type_name, stats in type_stats.items():
-            by_type.append({
-                'expense_type': type_name,
-                'count': stats['count'],
-                'total_amount': stats['total_amount']
-            })
-        
-        # 按自定义类型统计（如果有）
-        by_custom_type = []
-        custom_types = self.get_all_custom_expense_types()
-        if custom_types:
-            custom_type_stats = {}
-            for expense in expenses:
-                custom_type_id = expense.get('custom_type_id')
-                if custom_type_id:
-                    for custom_type in custom_types:
-                        if custom_type.get('id') == custom_type_id:
-                            type_name = custom_type.get('name', f"自定义类型{custom_type_id}")
-                            
-                            if type_name not in custom_type_stats:
-                                custom_type_stats[type_name] = {
-                                    'count': 0,
-                                    'total_amount': 0
-                                }
-                            
-                            custom_type_stats[type_name]['count'] += 1
-                            custom_type_stats[type_name]['total_amount'] += expense.get('total_amount', 0)
-                            break
-            
-            for type_name, stats in custom_type_stats.items():
-                by_custom_type.append({
-                    'type_name': type_name,
-                    'count': stats['count'],
-                    'total_amount': stats['total_amount']
-                })
+        start/end 为同一粒度的周期键，如 '2026-01' 或 '2026-Q1'；中间没有费用的周期合计为0。
+        """
+        view = self._read_view()
+        if view is None:
+            return []
         
-        return {
-            'overall': {
-                'total_count': total_count,
-                'grand_total': grand_total,
-                'avg_amount': avg_amount
-            },
-            'by_type': by_type,
-            'by_custom_type': by_custom_type
-        }
+        try:
+            return burn_rate(view.rollup.series(granularity, start, end, expense_type, fill_gaps=True))
+        except ValueError as e:
+            print(f"[ERROR] Failed to get expense time series: {str(e)}")
+            return []
+    
+    def get_expense_total_in_range(self, start_date: str, end_date: str,
+                                   expense_type: Optional[str] = None) -> Dict[str, Any]:
+        """日期区间内（包含两端）的费用合计，如第二季度的人工费用"""
+        view = self._read_view()
+        if view is None:
+            return {}
+        
+        try:
+            return view.rollup.range_total(start_date, end_date, expense_type)
+        except ValueError as e:
+            print(f"[ERROR] Failed to get expense total in range: {str(e)}")
+            return {}
+    
+    def get_portfolio_statistics(self) -> Dict[str, Any]:
+        """汇总全部项目的费用（按项目、类型、自定义类型和月份）
+        
+        每个项目文件的汇总结果按修改时间缓存，只重新读取变化的文件。
+        """
+        try:
+            # 当前项目尚未保存的自定义类型等修改先写入文件
+            self.flush()
+            if self.portfolio is None:
+                self.portfolio = PortfolioCache(self.projects_dir)
+            return collect_portfolio_statistics(self.file_extension, self.projects_dir, self.portfolio)
+        except Exception as e:
+            print(f"[ERROR] Failed to collect portfolio statistics: {str(e)}")
+            return {}
     
     # ===== 导入导出方法 =====
     
@@ -531,24 +1365,48 @@ class FileManager:
             if not os.path.exists(source_path):
                 raise FileNotFoundError(f"源文件不存在: {source_path}")
             
-            # 读取源文件
-            with open(source_path, 'r', encoding='utf-8') as f:
-                source_data = json.load(f)
+            # 读取源文件（JSON或二进制格式均可）
+            source_data = load_project_file(source_path)
             
+            return self.store_project_data(source_data, overwrite)
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to import project: {str(e)}")
+            return False
+    
+    def store_project_data(self, project_data: Dict[str, Any], overwrite: bool = False) -> bool:
+        """将完整的项目数据写入项目目录"""
+        try:
             # 验证项目数据结构
-            if 'project_info' not in source_data or 'name' not in source_data['project_info']:
+            if 'project_info' not in project_data or 'name' not in project_data['project_info']:
                 raise ValueError("无效的项目文件格式")
             
-            project_name = source_data['project_info']['name']
+            project_name = project_data['project_info']['name']
             target_path = self._get_project_path(project_name)
             
             # 检查目标文件是否已存在
             if os.path.exists(target_path) and not overwrite:
                 raise ValueError(f"项目 '{project_name}' 已存在，请选择覆盖或重命名")
             
-            # 保存项目文件
-            with open(target_path, 'w', encoding='utf-8') as f:
-                json.dump(source_data, f, ensure_ascii=False, indent=2)
+            # 写入统计聚合、时间汇总和ID计数器，打开时不需要遍历全部费用记录
+            expenses = project_data.get('expenses', [])
+            stats = StatsAggregator()
+            stats.rebuild(expenses)
+            rollup = TimeRollup()
+            rollup.rebuild(expenses)
+            counters = dict(project_data.get('id_counters') or {})
+            expense_ids = [exp.get('id') for exp in expenses if isinstance(exp.get('id'), int)]
+            counters['expense'] = max([counters.get('expense', 0)] + expense_ids)
+            project_data = dict(project_data, statistics=stats.to_dict(), time_rollup=rollup.to_dict(),
+                                id_counters=counters)
+            
+            # 保存项目文件（覆盖时丢弃旧项目遗留的操作日志），期间其他程序不能写入
+            with ProjectFileLock(target_path):
+                self._write_project_file(target_path, project_data)
+                
+                journal_path = self._get_journal_path(project_name)
+                if os.path.exists(journal_path):
+                    os.remove(journal_path)
             
             print(f"[SUCCESS] Project imported: {project_name}")
             return True
@@ -557,6 +1415,20 @@ class FileManager:
             print(f"[ERROR] Failed to import project: {str(e)}")
             return False
     
+    def load_project_data(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """读取项目的完整数据，不改变当前打开的项目"""
+        try:
+            project_path = self._get_project_path(project_name)
+            
+            if not os.path.exists(project_path):
+                raise FileNotFoundError(f"项目文件不存在: {project_path}")
+            
+            return self._read_project_file(project_path)
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to load project data: {str(e)}")
+            return None
+    
     def export_project(self, project_name: str, target_path: str) -> bool:
         """导出项目文件"""
         try:
@@ -565,8 +1437,18 @@ class FileManager:
             if not os.path.exists(source_path):
                 raise FileNotFoundError(f"项目文件不存在: {source_path}")
             
-            # 复制文件
-            shutil.copy2(source_path, target_path)
+            # 当前打开的项目先写入尚未保存的修改
+            if self.current_project == project_name:
+                self.flush()
+            
+            if self.file_format == 'binary' and target_path.lower().endswith('.json'):
+                # 导出为JSON时转换格式，便于在其他环境中查看和导入
+                project_data = self._read_project_file(source_path)
+                with open(target_path, 'w', encoding='utf-8') as f:
+                    dump_json_project(project_data, f)
+            else:
+                # 复制文件
+                shutil.copy2(source_path, target_path)
             
             print(f"[SUCCESS] Project exported: {project_name} -> {target_path}")
             return True
@@ -575,12 +1457,23 @@ class FileManager:
             print(f"[ERROR] Failed to export project: {str(e)}")
             return False
 
+def _custom_formula_number(formula_id) -> Optional[int]:
+    """从自定义公式ID（custom_N）中取出编号N"""
+    prefix = 'custom_'
+    if isinstance(formula_id, str) and formula_id.startswith(prefix) and formula_id[len(prefix):].isdigit():
+        return int(formula_id[len(prefix):])
+    return None
+
 # 全局文件管理器实例
 file_manager_instance = None
 
 def get_file_manager():
-    """获取文件管理器实例（单例模式）"""
+    """获取文件管理器实例（单例模式），按配置选择存储后端"""
     global file_manager_instance
     if file_manager_instance is None:
-        file_manager_instance = FileManager()
+        if STORAGE_BACKEND == "sqlite":
+            from .sqlite_backend import SqliteStorageBackend
+            file_manager_instance = SqliteStorageBackend()
+        else:
+            file_manager_instance = FileManager()
     return file_manager_instance
\ No newline at end of file
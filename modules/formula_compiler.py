@@ -0,0 +1,271 @@
+"""
+公式编译模块 - 基于ast的安全表达式编译器
+只允许白名单中的语法节点和函数，变量名按声明的参数解析，
+编译结果是一个以参数为位置参数的闭包，比通用eval更安全也更快
+"""
+import ast
+import copy
+import math
+from typing import Dict, Any, List, Optional, Sequence
+
+# 常量指数的上限，防止 9 ** 9 ** 9 之类的表达式耗尽CPU
+MAX_CONSTANT_EXPONENT = 100
+# 常量子表达式（整数）的最大位数，防止 ((9 ** 100) ** 100) ** 100 之类逐层放大的表达式
+MAX_CONSTANT_BITS = 1024
+
+
+class FormulaError(ValueError):
+    """公式不合法"""
+
+
+def _bounded_pow(base, exponent):
+    """有上限的乘方：整数的指数和结果位数超过上限时抛出 FormulaError，浮点溢出同样视为公式错误"""
+    if isinstance(base, int) and isinstance(exponent, int):
+        if abs(exponent) > MAX_CONSTANT_EXPONENT:
+            raise FormulaError("指数过大")
+        if exponent > 0 and base.bit_length() * exponent > MAX_CONSTANT_BITS:
+            raise FormulaError("乘方结果过大")
+    try:
+        return base ** exponent
+    except OverflowError:
+        raise FormulaError("乘方结果过大")
+
+
+# 表达式中可以直接调用的函数（pow 换成有上限的版本）
+ALLOWED_FUNCTIONS = {
+    'abs': abs,
+    'round': round,
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'pow': _bounded_pow
+}
+
+# 可以接收 [..] 或 (..) 字面量作为参数的函数，列表和元组不能出现在其他位置
+AGGREGATE_FUNCTIONS = frozenset({'min', 'max', 'sum'})
+
+# 可以通过 math.xxx 使用的函数和常量（只列出耗时与参数大小无关的函数，不含 factorial、comb 等）
+ALLOWED_MATH_NAMES = frozenset({
+    'pi', 'e', 'tau', 'inf',
+    'ceil', 'floor', 'trunc', 'fabs', 'copysign', 'fmod',
+    'sqrt', 'exp', 'log', 'log10', 'log2', 'pow', 'hypot',
+    'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'degrees', 'radians',
+    'isfinite', 'isinf', 'isnan'
+})
+
+# 编译后的公式共享的全局命名空间
+FORMULA_GLOBALS = dict(ALLOWED_FUNCTIONS, math=math, __builtins__={})
+
+ALLOWED_NODES = (
+    ast.Expression, ast.Load,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UnaryOp, ast.UAdd, ast.USub, ast.Not,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.IfExp, ast.Call, ast.Name, ast.Attribute, ast.Constant
+)
+
+
+class CompiledFormula:
+    """编译后的公式"""
+
+    __slots__ = ('expression', 'param_names', 'func', '_mapping_func')
+
+    def __init__(self, expression: str, param_names: Sequence[str], func, mapping_func):
+        self.expression = expression
+        self.param_names = tuple(param_names)  # 表达式中使用的变量，按首次出现顺序
+        self.func = func                       # lambda(*param_names) -> 结果
+        self._mapping_func = mapping_func      # lambda(params) -> 结果，直接按键读取参数
+
+    def evaluate(self, params: Dict[str, Any]):
+        """用参数字典求值"""
+        try:
+            return self._mapping_func(params)
+        except KeyError as e:
+            if e.args and e.args[0] in self.param_names and e.args[0] not in params:
+                raise FormulaError(f"缺少参数: {e.args[0]}")
+            raise
+
+
+class _FormulaValidator(ast.NodeVisitor):
+    """检查语法节点并收集变量名"""
+
+    def __init__(self):
+        self.names = []
+
+    def generic_visit(self, node):
+        if not isinstance(node, ALLOWED_NODES):
+            raise FormulaError(f"不允许的语法: {type(node).__name__}")
+        super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise FormulaError(f"不允许的常量: {node.value!r}")
+
+    def visit_Name(self, node):
+        if node.id in ALLOWED_FUNCTIONS or node.id in ('math', '_params'):
+            raise FormulaError(f"变量名与内置函数冲突: {node.id}")
+        if node.id not in self.names:
+            self.names.append(node.id)
+
+    def visit_Attribute(self, node):
+        if not (isinstance(node.value, ast.Name) and node.value.id == 'math'
+                and node.attr in ALLOWED_MATH_NAMES):
+            raise FormulaError("只允许使用 math 模块中列出的函数和常量")
+
+    def visit_Call(self, node):
+        if node.keywords:
+            raise FormulaError("函数调用不支持关键字参数")
+
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id not in ALLOWED_FUNCTIONS:
+                raise FormulaError(f"不允许的函数: {func.id}")
+        elif isinstance(func, ast.Attribute):
+            self.visit_Attribute(func)
+        else:
+            raise FormulaError("不允许的函数调用")
+
+        is_pow = isinstance(func, ast.Name) and func.id == 'pow'
+        if is_pow and len(node.args) != 2:
+            raise FormulaError("pow 只接受两个参数")
+        aggregate = isinstance(func, ast.Name) and func.id in AGGREGATE_FUNCTIONS
+        for arg in node.args:
+            if isinstance(arg, ast.Starred):
+                raise FormulaError("函数调用不支持 * 参数")
+            if aggregate and isinstance(arg, (ast.List, ast.Tuple)):
+                # min/max/sum 的列表参数只检查其中的元素，元素本身不能再是列表
+                for element in arg.elts:
+                    self.visit(element)
+            else:
+                self.visit(arg)
+        if is_pow:
+            _check_exponent(node.args[1])
+        _constant_value(node)
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            _check_exponent(node.right)
+        _constant_value(node)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        _constant_value(node)
+
+
+def _check_exponent(node):
+    """常量指数超过上限时抛出 FormulaError"""
+    exponent = _constant_value(node)
+    if exponent is not None and abs(exponent) > MAX_CONSTANT_EXPONENT:
+        raise FormulaError("指数过大")
+
+
+_CONSTANT_OPERATIONS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+    ast.Pow: _bounded_pow
+}
+
+
+def _constant_value(node):
+    """折叠只由常量组成的子表达式（包括常量参数的 pow 调用）并返回其值
+
+    包含变量或其他函数调用、或者计算出错（如除零，留给求值时报告）时返回None；
+    值超过 MAX_CONSTANT_BITS 位或溢出为无穷大时抛出 FormulaError。
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _constant_value(node.operand)
+        if value is None:
+            return None
+        return -value if isinstance(node.op, ast.USub) else value
+
+    if isinstance(node, ast.BinOp):
+        operation = _CONSTANT_OPERATIONS[type(node.op)]
+        operands = (node.left, node.right)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'pow':
+        operation = _bounded_pow
+        operands = node.args
+    else:
+        return None
+
+    values = [_constant_value(operand) for operand in operands]
+    if any(value is None for value in values):
+        return None
+    try:
+        value = operation(*values)
+    except FormulaError:
+        raise
+    except (ZeroDivisionError, ValueError, TypeError):
+        return None
+    except OverflowError:
+        raise FormulaError("常量过大")
+
+    if isinstance(value, int) and value.bit_length() > MAX_CONSTANT_BITS:
+        raise FormulaError("常量过大")
+    if isinstance(value, float) and math.isinf(value):
+        raise FormulaError("常量过大")
+    return value
+
+
+class _ParamsToMapping(ast.NodeTransformer):
+    """把变量访问改写为从参数字典中取值：x -> _params['x']"""
+
+    def visit_Name(self, node):
+        return ast.copy_location(ast.Subscript(
+            value=ast.Name(id='_params', ctx=ast.Load()),
+            slice=ast.Constant(value=node.id),
+            ctx=ast.Load()), node)
+
+    def visit_Attribute(self, node):
+        return node  # math.xxx 保持不变
+
+    def visit_Call(self, node):
+        # 函数名保持不变，只改写参数
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+def compile_formula(expression: str, params: Optional[List[str]] = None) -> CompiledFormula:
+    """编译公式表达式
+
+    params 为声明的参数列表；给出时表达式中的每个变量都必须在其中声明。
+    """
+    if not isinstance(expression, str) or not expression.strip():
+        raise FormulaError("表达式为空")
+
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise FormulaError(f"表达式语法错误: {e.msg}")
+
+    validator = _FormulaValidator()
+    validator.visit(tree)
+
+    if params is not None:
+        undeclared = [name for name in validator.names if name not in params]
+        if undeclared:
+            raise FormulaError(f"未声明的参数: {', '.join(undeclared)}")
+
+    # 把表达式包装为 lambda，变量成为位置参数（局部变量访问比eval的名字查找快）
+    func = _build_lambda(validator.names, tree.body)
+    # 另一个版本直接接收参数字典，单条计算时省去组装位置参数的开销
+    mapping_body = _ParamsToMapping().visit(copy.deepcopy(tree.body))
+    mapping_func = _build_lambda(['_params'], mapping_body)
+
+    return CompiledFormula(expression, validator.names, func, mapping_func)
+
+
+def _build_lambda(arg_names: List[str], body):
+    """把表达式语法树编译为以arg_names为参数的函数"""
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg(arg=name) for name in arg_names],
+                              vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+    wrapper = ast.Expression(body=ast.Lambda(args=arguments, body=body))
+    ast.fix_missing_locations(wrapper)
+    return eval(compile(wrapper, '<formula>', 'eval'), FORMULA_GLOBALS)
@@ -0,0 +1,89 @@
+"""
+ID索引模块 - 维护记录ID到列表位置的哈希索引
+按ID查找、替换、删除都不需要遍历列表，列表本身的顺序保持不变
+"""
+from bisect import bisect_left, insort
+from typing import List, Dict, Any, Optional
+
+# 删除的记录累计到这个数量（且不少于现存记录数）后重建一次位置索引
+POSITION_REBUILD_THRESHOLD = 256
+
+
+class PositionIndex:
+    """记录ID -> 列表位置 的索引
+
+    删除记录时不逐条修正后面记录的位置，而是记下被删除的槽位，
+    查找时用二分法扣除前面已删除的槽位数；被删除的槽位累计到与现存记录一样多时整体重建，
+    重建的开销分摊到每次删除上是常数。列式存储的删除同样只标记被删除的行（见 ExpenseStore）。
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], key: str = 'id'):
+        self.items = items  # 被索引的列表（项目数据中的原列表）
+        self.key = key
+        self.rebuild()
+
+    def rebuild(self):
+        """根据列表重新建立索引"""
+        self._slots = {}     # 记录ID -> 槽位
+        self._deleted = []   # 已删除的槽位（有序）
+        column = getattr(self.items, 'column', None)  # 列式存储可以直接取ID列
+        keys = column(self.key) if column is not None else (item.get(self.key) for item in self.items)
+        for i, item_id in enumerate(keys):
+            self._slots.setdefault(item_id, i)
+        self._next_slot = len(self.items)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def position(self, item_id) -> Optional[int]:
+        """获取记录在列表中的位置，不存在时返回None"""
+        slot = self._slots.get(item_id)
+        if slot is None:
+            return None
+        if not self._deleted:
+            return slot
+        return slot - bisect_left(self._deleted, slot)
+
+    def get(self, item_id) -> Optional[Dict[str, Any]]:
+        """根据ID获取记录"""
+        pos = self.position(item_id)
+        return self.items[pos] if pos is not None else None
+
+    def append(self, item: Dict[str, Any]):
+        """在列表末尾添加记录"""
+        self.items.append(item)
+        self._slots[item.get(self.key)] = self._next_slot
+        self._next_slot += 1
+
+    def extend(self, items: List[Dict[str, Any]]):
+        """在列表末尾批量添加记录（列式存储按列整批追加）"""
+        self.items.extend(items)
+        for item in items:
+            self._slots[item.get(self.key)] = self._next_slot
+            self._next_slot += 1
+
+    def replace(self, item_id, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """替换记录（位置不变），返回旧记录"""
+        pos = self.position(item_id)
+        if pos is None:
+            return None
+        old_item = self.items[pos]
+        self.items[pos] = item
+        return old_item
+
+    def pop(self, item_id) -> Optional[Dict[str, Any]]:
+        """删除记录并返回，不存在时返回None"""
+        pos = self.position(item_id)
+        if pos is None:
+            return None
+
+        slot = self._slots.pop(item_id)
+        item = self.items.pop(pos)
+        insort(self._deleted, slot)
+
+        if len(self._deleted) >= max(POSITION_REBUILD_THRESHOLD, len(self._slots)):
+            self.rebuild()
+        return item
@@ -0,0 +1,116 @@
+"""
+后台I/O执行器 - 把文件读写放到工作线程，避免阻塞Tk事件循环
+任务按提交顺序在同一个工作线程上执行，结果通过 root.after 回到主线程处理
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional, Any
+
+# 主线程检查任务结果的间隔（毫秒）
+POLL_INTERVAL_MS = 50
+
+
+class IOExecutor:
+    """后台I/O执行器
+
+    存储后端同一时间只打开一个项目，所有任务都在同一个工作线程上按提交顺序执行，
+    因此对同一项目的写操作不会乱序；任务回调总是在Tk主线程中调用。
+    """
+
+    def __init__(self, root, status_var=None):
+        self.root = root
+        self.status_var = status_var  # 用于显示进度的 tk.StringVar
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-io')
+        self._results = queue.Queue()  # 工作线程 -> 主线程
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._polling = False
+        self._progress = None  # 工作线程报告的最新进度文字，主线程检查结果时显示
+
+    @property
+    def pending(self) -> int:
+        """尚未完成（含回调尚未执行）的任务数"""
+        return self._pending
+
+    def submit(self, func: Callable, *args, description: str = "",
+               on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None, **kwargs) -> Future:
+        """提交后台任务
+
+        func 在工作线程中执行；完成后在主线程中调用 on_success(结果) 或 on_error(异常)。
+        """
+        with self._lock:
+            self._pending += 1
+
+        if description:
+            self._show_status(description)
+
+        future = self._executor.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: self._results.put((f, description, on_success, on_error)))
+        self._schedule_poll()
+        return future
+
+    def report_progress(self, text: str):
+        """在工作线程中报告任务进度（只保留最新的一条，由主线程显示在状态栏）"""
+        self._progress = text
+
+    def _schedule_poll(self):
+        """在主线程中安排检查结果"""
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        """处理已完成的任务（主线程）"""
+        self._polling = False
+
+        progress, self._progress = self._progress, None
+        if progress and self.status_var is not None:
+            self.status_var.set(progress)
+
+        while True:
+            try:
+                future, description, on_success, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._lock:
+                self._pending -= 1
+
+            error = future.exception()
+            try:
+                if error is None:
+                    if on_success:
+                        on_success(future.result())
+                    elif description and self.status_var is not None:
+                        self.status_var.set(f"{description}完成")
+                elif on_error:
+                    on_error(error)
+                else:
+                    print(f"[ERROR] Background task failed: {description} - {str(error)}")
+                    if self.status_var is not None:
+                        self.status_var.set(f"{description}失败: {str(error)}")
+            except Exception as e:
+                print(f"[ERROR] Background task callback failed: {description} - {str(e)}")
+
+        if self._pending > 0:
+            self._schedule_poll()
+
+    def _show_status(self, description: str):
+        """在状态栏显示当前任务"""
+        if self.status_var is None:
+            return
+        if self._pending > 1:
+            self.status_var.set(f"{description}...（队列中还有 {self._pending - 1} 项）")
+        else:
+            self.status_var.set(f"{description}...")
+
+    def run_pending(self):
+        """等待已提交的任务全部完成并在当前线程执行回调（关闭程序前使用）"""
+        self._executor.submit(lambda: None).result()
+        self._poll()
+
+    def shutdown(self):
+        """停止工作线程（等待已提交的任务完成）"""
+        self._executor.shutdown(wait=True)
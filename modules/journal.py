@@ -0,0 +1,114 @@
+"""
+操作日志模块 - 费用记录变更的追加式预写日志（write-ahead journal）
+每个项目对应一个 <项目名>.journal 文件，每行一个JSON操作
+"""
+import json
+import os
+from typing import List, Dict, Any
+
+
+class ProjectJournal:
+    """项目操作日志 - 追加写入并fsync，打开项目时重放，合并后清空"""
+
+    def __init__(self, journal_path: str):
+        """初始化操作日志"""
+        self.journal_path = journal_path
+        self._file = None
+        self.op_count = 0  # 尚未合并到项目文件的操作数（重放时更新）
+
+    def _open(self):
+        """以追加模式打开日志文件（延迟打开）"""
+        if self._file is None:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, op: Dict[str, Any]):
+        """追加一条操作记录并立即落盘"""
+        line = json.dumps(op, ensure_ascii=False, separators=(',', ':'))
+        f = self._open()
+        f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        self.op_count += 1
+
+    def read_ops(self, offset: int = 0) -> List[Dict[str, Any]]:
+        """读取日志中的操作，忽略崩溃时写了一半的尾行
+
+        offset: 从该字节位置开始读取（只读取其他程序在此之后追加的操作）
+        """
+        ops = []
+        if not os.path.exists(self.journal_path):
+            return ops
+
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    print(f"[WARNING] Skipped corrupted journal entry in {self.journal_path}")
+                    break
+        return ops
+
+    def replay(self, project_data: Dict[str, Any]) -> int:
+        """将日志中的操作按顺序重放到项目数据上，返回重放的操作数"""
+        ops = self.read_ops()
+        apply_journal_ops(project_data, ops)
+        self.op_count = len(ops)
+        return len(ops)
+
+    def truncate(self):
+        """清空日志（操作已合并到项目文件之后调用）"""
+        self.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.op_count = 0
+
+    def close(self):
+        """关闭日志文件句柄"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def apply_journal_ops(project_data: Dict[str, Any], ops: List[Dict[str, Any]]):
+    """将操作应用到项目数据上
+
+    操作是幂等的（add/update按ID覆盖，delete忽略不存在的ID），
+    因此项目文件已合并但日志未清空时重复重放也不会产生重复记录。
+    删除时只记下位置，全部操作应用完后一次性移除，不需要逐条修正后面记录的位置。
+    """
+    expenses = project_data.setdefault('expenses', [])
+    if not ops:
+        return
+    positions = {exp.get('id'): i for i, exp in enumerate(expenses)}
+    deleted = set()
+
+    for op in ops:
+        kind = op.get('op')
+        if kind in ('add', 'update'):
+            record = op['expense']
+            pos = positions.get(record.get('id'))
+            if pos is None:
+                positions[record.get('id')] = len(expenses)
+                expenses.append(record)
+            else:
+                expenses[pos] = record
+        elif kind == 'delete':
+            pos = positions.pop(op.get('id'), None)
+            if pos is not None:
+                deleted.add(pos)
+
+        if op.get('at') and 'project_info' in project_data:
+            project_data['project_info']['last_modified'] = op['at']
+
+    if deleted:
+        if isinstance(expenses, list):
+            expenses[:] = [exp for i, exp in enumerate(expenses) if i not in deleted]
+        else:
+            # 列式存储的删除只做标记，从后往前删除不影响前面的位置
+            for pos in sorted(deleted, reverse=True):
+                del expenses[pos]
@@ -0,0 +1,132 @@
+"""
+延迟加载模块 - 打开二进制项目文件时只读取文件头和meta分段
+费用记录按分段表中的偏移按需读取，只有实际查看或统计到的分段才会被解码
+读取分段前检查文件是否已被其他程序替换（偏移失效），替换后抛出 StaleProjectFileError
+"""
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Dict, Any, List, Optional, Tuple
+
+from .project_format import read_section, expense_sections, read_header
+from .config import LAZY_CHUNK_CACHE_SIZE
+
+
+class StaleProjectFileError(OSError):
+    """延迟加载期间项目文件被替换，文件头中的分段偏移已经失效"""
+
+
+def _file_identity(stat: os.stat_result) -> Tuple[int, int, int]:
+    """用于判断文件是否被替换的标识（os.replace 后inode、大小或修改时间会变化）"""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class LazyExpenseList(Sequence):
+    """按需从磁盘读取的只读费用记录序列
+
+    支持 len()、下标、切片和迭代；需要修改时调用 materialize() 取得完整列表。
+    界面线程读取快照的同时后台线程可能正在全部读入，分段缓存用锁保护。
+    identity 为读取文件头时的文件标识，之后每次从磁盘读取分段都与它比较。
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any], cache_size: int = LAZY_CHUNK_CACHE_SIZE,
+                 identity: Optional[Tuple[int, int, int]] = None):
+        self.path = path
+        self.header = header
+        self.identity = identity if identity is not None else _file_identity(os.stat(path))
+        self.sections = expense_sections(header)
+        self._first_rows = [section['first_row'] for section in self.sections]
+        self._length = header.get('counts', {}).get('expenses', 0)
+        self._cache = OrderedDict()  # 分段序号 -> 已解码的记录列表（LRU）
+        self._cache_lock = threading.Lock()
+        self.cache_size = max(1, cache_size)
+        self.chunks_loaded = 0       # 从磁盘解码过的分段次数
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _chunk(self, chunk_index: int) -> List[Dict[str, Any]]:
+        """读取一个分段（带LRU缓存）"""
+        with self._cache_lock:
+            rows = self._cache.get(chunk_index)
+            if rows is not None:
+                self._cache.move_to_end(chunk_index)
+                return rows
+
+        with open(self.path, 'rb') as f:
+            if _file_identity(os.fstat(f.fileno())) != self.identity:
+                raise StaleProjectFileError(f"项目文件已被其他程序替换: {self.path}")
+            rows = read_section(f, self.header, self.sections[chunk_index])
+
+        with self._cache_lock:
+            self.chunks_loaded += 1
+            self._cache[chunk_index] = rows
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rows
+
+    def _locate(self, index: int):
+        """行号 -> (分段序号, 分段内位置)"""
+        chunk_index = bisect_right(self._first_rows, index) - 1
+        return chunk_index, index - self._first_rows[chunk_index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._slice(start, stop)
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("费用记录下标超出范围")
+        chunk_index, offset = self._locate(index)
+        return self._chunk(chunk_index)[offset]
+
+    def _slice(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """连续切片，只读取覆盖到的分段"""
+        rows = []
+        while start < stop:
+            chunk_index, offset = self._locate(start)
+            chunk = self._chunk(chunk_index)
+            taken = chunk[offset:offset + (stop - start)]
+            if not taken:
+                break
+            rows.extend(taken)
+            start += len(taken)
+        return rows
+
+    def __iter__(self):
+        # 逐段读取，遍历统计时内存中最多保留 cache_size 个分段
+        for chunk_index in range(len(self.sections)):
+            yield from self._chunk(chunk_index)
+
+    def column(self, field: str) -> List[Any]:
+        """逐段取某个字段的全部值（没有该字段的行为None），不保留整行"""
+        return [row.get(field) for row in self]
+
+    def materialize(self) -> List[Dict[str, Any]]:
+        """读取全部记录，返回普通列表"""
+        rows = []
+        for chunk_index in range(len(self.sections)):
+            rows.extend(self._chunk(chunk_index))
+        with self._cache_lock:
+            self._cache.clear()
+        return rows
+
+
+def load_project_lazily(path: str) -> Dict[str, Any]:
+    """打开二进制项目文件：立即读取项目信息、自定义类型和公式，费用记录延迟加载"""
+    with open(path, 'rb') as f:
+        identity = _file_identity(os.fstat(f.fileno()))
+        header = read_header(f)
+        project_data = {'project_info': header.get('project_info', {})}
+        for section in header['sections']:
+            if section['name'] == 'meta':
+                project_data.update(read_section(f, header, section))
+
+    project_data['expenses'] = LazyExpenseList(path, header, identity=identity)
+    return project_data
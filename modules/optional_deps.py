@@ -0,0 +1,26 @@
+"""
+可选依赖模块 - numpy、openpyxl 等较重的第三方库在第一次用到时才导入
+
+启动程序时不加载这些库，只有批量计算、列汇总或导出Excel时才付出导入耗时；
+未安装的库返回None，由调用方回退到纯Python实现或提示安装。
+"""
+import importlib
+from types import ModuleType
+from typing import Dict, Optional
+
+_modules: Dict[str, Optional[ModuleType]] = {}
+
+
+def optional_module(name: str) -> Optional[ModuleType]:
+    """导入可选依赖（结果缓存），未安装时返回None"""
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    return _modules[name]
+
+
+def numpy() -> Optional[ModuleType]:
+    """numpy（用于向量化计算），未安装时返回None"""
+    return optional_module('numpy')
@@ -0,0 +1,176 @@
+"""
+组合统计模块 - 汇总项目目录下全部项目的费用（按项目、类型、自定义类型和月份）
+
+每个项目文件的汇总结果按 修改时间 + 文件大小（含操作日志）缓存，只有变化的文件才会被重新读取；
+需要读取的文件较多时用进程池并行解析，每个文件一个任务。
+"""
+import os
+import time
+from typing import List, Dict, Any, Callable, Optional
+
+from .config import (
+    PROJECTS_DIR, EXPENSE_TYPES, JOURNAL_FILE_EXTENSION,
+    PORTFOLIO_CACHE_FILE_NAME, PORTFOLIO_MAX_WORKERS, PORTFOLIO_PARALLEL_MIN_FILES
+)
+from .expense_store import ExpenseStore
+from .journal import ProjectJournal
+from .project_catalog import ProjectCatalog
+from .project_format import load_project_file
+from .time_rollup import month_of, UNDATED
+
+PORTFOLIO_VERSION = 1
+
+
+def _month_totals(expenses: ExpenseStore) -> Dict[str, List]:
+    """按月份汇总 {月份: [记录数, 金额合计]}"""
+    by_date = expenses.group_totals('date', 'total_amount')
+    if None in by_date:
+        # 没有 date 字段的旧记录使用 expense_date
+        del by_date[None]
+        for date, legacy_date, amount in zip(expenses.column('date'), expenses.column('expense_date'),
+                                             expenses.column('total_amount')):
+            if date is None:
+                bucket = by_date.setdefault(legacy_date, [0, 0])
+                bucket[0] += 1
+                bucket[1] += amount or 0
+
+    months = {}
+    for date, (count, total) in by_date.items():
+        bucket = months.setdefault(month_of(date), [0, 0])
+        bucket[0] += count
+        bucket[1] += total
+    return months
+
+
+def summarize_project_data(project_data: Dict[str, Any], default_name: str = '') -> Dict[str, Any]:
+    """计算一个项目的分组合计"""
+    expenses = project_data.get('expenses', [])
+    if not isinstance(expenses, ExpenseStore):
+        expenses = ExpenseStore(expenses)
+
+    project_info = project_data.get('project_info', {})
+    custom_type_names = {t.get('id'): t.get('name') or f"自定义类型{t.get('id')}"
+                         for t in project_data.get('custom_expense_types', [])}
+
+    # 自定义类型ID只在项目内有效，跨项目按名称合并；只统计仍然存在的类型
+    by_custom_type = {}
+    for type_id, (count, total) in expenses.group_totals('custom_type_id', 'total_amount').items():
+        if type_id in custom_type_names:
+            bucket = by_custom_type.setdefault(custom_type_names[type_id], [0, 0])
+            bucket[0] += count
+            bucket[1] += total
+
+    return {
+        'name': project_info.get('name') or default_name,
+        'expense_count': len(expenses),
+        'total_amount': expenses.sum('total_amount'),
+        'by_type': [[key, count, total] for key, (count, total)
+                    in expenses.group_totals('expense_type', 'total_amount', default='other').items()],
+        'by_custom_type': [[key, count, total] for key, (count, total) in by_custom_type.items()],
+        'by_month': [[key, count, total] for key, (count, total) in _month_totals(expenses).items()]
+    }
+
+
+def summarize_project_file(project_path: str, filename: str) -> Dict[str, Any]:
+    """读取一个项目文件（含尚未合并的操作日志）并计算分组合计，在工作进程中执行"""
+    project_data = load_project_file(project_path)
+    ProjectJournal(os.path.splitext(project_path)[0] + JOURNAL_FILE_EXTENSION).replay(project_data)
+    return summarize_project_data(project_data, os.path.splitext(filename)[0])
+
+
+def build_portfolio_statistics(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并各项目的分组合计，生成组合统计结果"""
+    by_type = {}
+    by_custom_type = {}
+    by_month = {}
+
+    def merge(target, rows, name_of=lambda key: key):
+        for key, count, total in rows:
+            bucket = target.setdefault(name_of(key), [0, 0])
+            bucket[0] += count
+            bucket[1] += total
+
+    for summary in summaries:
+        merge(by_type, summary['by_type'], lambda key: EXPENSE_TYPES.get(key, key))
+        merge(by_custom_type, summary['by_custom_type'])
+        merge(by_month, summary['by_month'])
+
+    total_count = sum(summary['expense_count'] for summary in summaries)
+    grand_total = sum(summary['total_amount'] for summary in summaries)
+
+    return {
+        'overall': {
+            'project_count': len(summaries),
+            'total_count': total_count,
+            'grand_total': grand_total,
+            'avg_amount': grand_total / total_count if total_count > 0 else 0
+        },
+        'by_project': sorted(({
+            'name': summary['name'],
+            'count': summary['expense_count'],
+            'total_amount': summary['total_amount']
+        } for summary in summaries), key=lambda item: item['total_amount'], reverse=True),
+        'by_type': [{'expense_type': key, 'count': count, 'total_amount': total}
+                    for key, (count, total) in sorted(by_type.items(), key=lambda item: -item[1][1])],
+        'by_custom_type': [{'type_name': key, 'count': count, 'total_amount': total}
+                           for key, (count, total) in sorted(by_custom_type.items(), key=lambda item: -item[1][1])],
+        # 按月份升序，无法识别日期的记录排在最后
+        'by_month': [{'month': key, 'count': count, 'total_amount': total}
+                     for key, (count, total) in sorted(by_month.items(), key=lambda item: (item[0] == UNDATED, item[0]))]
+    }
+
+
+class PortfolioCache(ProjectCatalog):
+    """每个项目文件的分组合计缓存，变化的文件较多时用进程池并行读取"""
+
+    version = PORTFOLIO_VERSION
+
+    def __init__(self, projects_dir: str = PROJECTS_DIR, cache_path: Optional[str] = None,
+                 max_workers: Optional[int] = PORTFOLIO_MAX_WORKERS):
+        super().__init__(projects_dir, cache_path or os.path.join(projects_dir, PORTFOLIO_CACHE_FILE_NAME))
+        self.max_workers = max_workers
+
+    def _summarize_files(self, stale: List[tuple], summarize: Callable[[str, str], Dict[str, Any]]):
+        """需要读取的文件较多时提交到进程池，每个文件一个任务"""
+        workers = self.max_workers or os.cpu_count() or 1
+        if len(stale) < PORTFOLIO_PARALLEL_MIN_FILES or workers == 1:
+            yield from super()._summarize_files(stale, summarize)
+            return
+
+        # 进程池相关模块在第一次并行读取时才导入，不影响启动耗时
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError) as e:
+            # 受限环境中无法创建子进程时逐个读取
+            print(f"[WARNING] Process pool unavailable, scanning sequentially: {str(e)}")
+            yield from super()._summarize_files(stale, summarize)
+            return
+
+        with executor:
+            futures = {executor.submit(summarize, project_path, filename): (filename, stamp)
+                       for filename, project_path, stamp in stale}
+            for future in as_completed(futures):
+                filename, stamp = futures[future]
+                try:
+                    yield filename, stamp, future.result()
+                except Exception as e:
+                    print(f"[ERROR] Failed to read project file {filename}: {str(e)}")
+
+
+def collect_portfolio_statistics(file_extension: str, projects_dir: str = PROJECTS_DIR,
+                                 cache: Optional[PortfolioCache] = None) -> Dict[str, Any]:
+    """汇总项目目录下全部项目文件，返回组合统计结果（附带本次扫描的耗时和读取文件数）"""
+    start = time.perf_counter()
+    cache = cache or PortfolioCache(projects_dir)
+    summaries = cache.scan(file_extension, summarize_project_file)
+
+    result = build_portfolio_statistics(summaries)
+    result['scan'] = {
+        'parsed': cache.last_scan_parsed,
+        'cached': len(summaries) - cache.last_scan_parsed,
+        'seconds': time.perf_counter() - start
+    }
+    print(f"[SUCCESS] Portfolio statistics: {len(summaries)} projects, "
+          f"{cache.last_scan_parsed} parsed, {result['scan']['seconds'] * 1000:.1f} ms")
+    return result
@@ -0,0 +1,168 @@
+"""
+项目目录索引模块 - 缓存每个项目文件的摘要信息
+按 文件路径 + 修改时间 + 文件大小 判断是否需要重新解析，只有变化的文件才会被读取
+"""
+import json
+import os
+import threading
+from typing import List, Dict, Any, Callable, Optional, Iterable
+
+from .config import PROJECTS_DIR, CATALOG_FILE_NAME, JOURNAL_FILE_EXTENSION
+
+CATALOG_VERSION = 1
+
+
+def file_stamp(project_path: str) -> List[int]:
+    """计算文件戳：项目文件与其操作日志的修改时间和大小"""
+    stat = os.stat(project_path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+
+    journal_path = os.path.splitext(project_path)[0] + JOURNAL_FILE_EXTENSION
+    try:
+        journal_stat = os.stat(journal_path)
+        stamp.extend([journal_stat.st_mtime_ns, journal_stat.st_size])
+    except OSError:
+        stamp.extend([0, 0])
+    return stamp
+
+
+class ProjectCatalog:
+    """项目目录索引 - 持久化到项目目录下的隐藏文件"""
+
+    version = CATALOG_VERSION  # 缓存的摘要结构变化时递增，旧缓存自动作废
+
+    def __init__(self, projects_dir: str = PROJECTS_DIR, catalog_path: Optional[str] = None):
+        """初始化目录索引"""
+        self.projects_dir = projects_dir
+        self.catalog_path = catalog_path or os.path.join(projects_dir, CATALOG_FILE_NAME)
+        self.entries = {}  # 文件名 -> {'stamp': [...], 'summary': {...}}
+        self.last_scan_parsed = 0  # 最近一次扫描实际解析的文件数
+        self.lock = threading.RLock()  # 扫描（I/O线程）与目录监视（监视线程）可能同时进行
+        self._load()
+
+    def _load(self):
+        """从磁盘加载索引，文件损坏或版本不符时从空索引开始"""
+        if not os.path.exists(self.catalog_path):
+            return
+
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.version:
+                self.entries = data.get('entries', {})
+        except Exception as e:
+            print(f"[WARNING] Project catalog unreadable, rebuilding: {str(e)}")
+            self.entries = {}
+
+    def save(self):
+        """将索引写回磁盘"""
+        tmp_path = self.catalog_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'entries': self.entries},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.catalog_path)
+
+    def snapshot(self, file_extension: str) -> List[Dict[str, Any]]:
+        """上次扫描时的项目摘要（不访问项目文件，文件可能已经变化，需要再调用 scan 校验）"""
+        with self.lock:
+            return [dict(entry['summary']) for filename, entry in self.entries.items()
+                    if not filename.startswith('.') and filename.endswith(file_extension)]
+
+    def _file_stamp(self, project_path: str) -> List[int]:
+        return file_stamp(project_path)
+
+    def refresh(self, filenames: Iterable[str],
+                summarize: Callable[[str, str], Dict[str, Any]]) -> bool:
+        """只更新指定的项目文件（目录监视发现变化时调用），返回索引是否有变化"""
+        with self.lock:
+            stale = []
+            changed = False
+            for filename in filenames:
+                project_path = os.path.join(self.projects_dir, filename)
+                try:
+                    stamp = self._file_stamp(project_path)
+                except OSError:
+                    # 文件已被删除
+                    changed = self.entries.pop(filename, None) is not None or changed
+                    continue
+                entry = self.entries.get(filename)
+                if entry is None or entry.get('stamp') != stamp:
+                    stale.append((filename, project_path, stamp))
+                    self.entries.pop(filename, None)
+                    changed = True
+
+            for filename, stamp, summary in self._summarize_files(stale, summarize):
+                self.entries[filename] = {'stamp': stamp, 'summary': summary}
+
+            if changed:
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"[WARNING] Failed to save project catalog: {str(e)}")
+            return changed
+
+    def scan(self, file_extension: str,
+             summarize: Callable[[str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """扫描项目目录，返回所有项目摘要
+
+        summarize(project_path, filename) 只对新增或已变化的文件调用。
+        """
+        with self.lock:
+            return self._scan(file_extension, summarize)
+
+    def _scan(self, file_extension: str,
+              summarize: Callable[[str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        seen = []
+        stale = []  # (文件名, 路径, 文件戳)
+        changed = False
+        self.last_scan_parsed = 0
+
+        if not os.path.exists(self.projects_dir):
+            return []
+
+        for filename in os.listdir(self.projects_dir):
+            if filename.startswith('.') or not filename.endswith(file_extension):
+                continue
+
+            project_path = os.path.join(self.projects_dir, filename)
+            try:
+                stamp = self._file_stamp(project_path)
+            except OSError:
+                continue
+
+            seen.append(filename)
+            entry = self.entries.get(filename)
+            if entry is None or entry.get('stamp') != stamp:
+                stale.append((filename, project_path, stamp))
+                # 解析失败的文件不再返回旧摘要
+                self.entries.pop(filename, None)
+                changed = True
+
+        for filename, stamp, summary in self._summarize_files(stale, summarize):
+            self.entries[filename] = {'stamp': stamp, 'summary': summary}
+            self.last_scan_parsed += 1
+
+        summaries = [dict(self.entries[filename]['summary']) for filename in seen if filename in self.entries]
+
+        # 清理已删除文件的索引
+        seen = set(seen)
+        for filename in list(self.entries):
+            if filename not in seen:
+                del self.entries[filename]
+                changed = True
+
+        if changed:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"[WARNING] Failed to save project catalog: {str(e)}")
+
+        return summaries
+
+    def _summarize_files(self, stale: List[tuple], summarize: Callable[[str, str], Dict[str, Any]]):
+        """解析新增或已变化的文件，逐个返回 (文件名, 文件戳, 摘要)，读取失败的文件跳过"""
+        for filename, project_path, stamp in stale:
+            try:
+                yield filename, stamp, summarize(project_path, filename)
+            except Exception as e:
+                print(f"[ERROR] Failed to read project file {filename}: {str(e)}")
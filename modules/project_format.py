@@ -0,0 +1,197 @@
+"""
+项目文件格式模块 - JSON文本格式与紧凑的分段二进制格式
+
+二进制格式结构：
+    magic(4字节 b'PTPJ') | 版本(uint16) | 保留(uint16) | 头部长度(uint32) | 头部 | 数据区
+
+头部是紧凑JSON，包含 project_info、记录数、摘要和分段表，
+读取项目列表所需的信息时不需要解码费用记录；
+数据区由若干分段组成：meta（自定义类型、公式等其余字段）和按块切分的 expenses。
+"""
+import json
+import struct
+from typing import Dict, Any, List, IO, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .config import BINARY_SECTION_CODEC, BINARY_EXPENSE_CHUNK_SIZE
+
+MAGIC = b'PTPJ'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<4sHHI')  # magic, 版本, 保留, 头部长度
+
+SECTION_CODECS = ('json', 'msgpack')
+
+
+class ProjectFormatError(ValueError):
+    """项目文件格式不正确"""
+
+
+# ===== 分段编码 =====
+
+def _encode(obj: Any, codec: str) -> bytes:
+    if codec == 'json':
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if codec == 'msgpack':
+        if msgpack is None:
+            raise ProjectFormatError("msgpack编码需要安装msgpack: pip install msgpack")
+        return msgpack.packb(obj, use_bin_type=True)
+    raise ProjectFormatError(f"不支持的分段编码: {codec}")
+
+
+def _decode(data: bytes, codec: str) -> Any:
+    if codec == 'json':
+        return json.loads(data.decode('utf-8'))
+    if codec == 'msgpack':
+        if msgpack is None:
+            raise ProjectFormatError("读取该文件需要安装msgpack: pip install msgpack")
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    raise ProjectFormatError(f"不支持的分段编码: {codec}")
+
+
+# ===== 格式识别 =====
+
+def is_binary_project_file(path: str) -> bool:
+    """根据文件开头的magic判断是否为二进制项目文件"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_project_file(path: str) -> Dict[str, Any]:
+    """读取项目文件（自动识别JSON或二进制格式）"""
+    if is_binary_project_file(path):
+        with open(path, 'rb') as f:
+            return load_binary_project(f)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ===== JSON格式 =====
+
+def dump_json_project(project_data: Dict[str, Any], f: IO):
+    """写入JSON格式（缩进，便于阅读和手工编辑）
+
+    费用记录可以是列表以外的序列（如列式存储），写入时按列表输出。
+    """
+    json.dump(project_data, f, ensure_ascii=False, indent=2, default=list)
+
+
+# ===== 二进制格式 =====
+
+def dump_binary_project(project_data: Dict[str, Any], f: IO, codec: str = BINARY_SECTION_CODEC,
+                        chunk_size: int = BINARY_EXPENSE_CHUNK_SIZE):
+    """写入二进制格式"""
+    expenses = project_data.get('expenses', [])
+    meta = {key: value for key, value in project_data.items() if key not in ('project_info', 'expenses')}
+
+    # 先编码各分段，计算偏移后再写头部
+    sections = []
+    blobs = []
+    offset = 0
+
+    def add_section(name, obj, **extra):
+        nonlocal offset
+        blob = _encode(obj, codec)
+        section = {'name': name, 'offset': offset, 'length': len(blob), 'codec': codec}
+        section.update(extra)
+        sections.append(section)
+        blobs.append(blob)
+        offset += len(blob)
+
+    add_section('meta', meta)
+    for start in range(0, len(expenses), chunk_size):
+        chunk = expenses[start:start + chunk_size]
+        add_section('expenses', chunk, first_row=start, row_count=len(chunk))
+
+    statistics = project_data.get('statistics')
+    if isinstance(statistics, dict) and statistics.get('count') == len(expenses):
+        total_amount = statistics.get('grand_total', 0)
+    else:
+        total_amount = sum(exp.get('total_amount', 0) for exp in expenses)
+
+    header = {
+        'project_info': project_data.get('project_info', {}),
+        'counts': {
+            'expenses': len(expenses),
+            'custom_expense_types': len(project_data.get('custom_expense_types', [])),
+            'formulas': len(project_data.get('formulas', []))
+        },
+        'summary': {'total_amount': total_amount},
+        'sections': sections
+    }
+    header_blob = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header_blob)))
+    f.write(header_blob)
+    for blob in blobs:
+        f.write(blob)
+
+
+def read_header(f: IO) -> Dict[str, Any]:
+    """读取头部，文件指针停在数据区起点"""
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) < PREAMBLE.size:
+        raise ProjectFormatError("文件过短，不是有效的项目文件")
+
+    magic, version, _, header_length = PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ProjectFormatError("不是二进制项目文件")
+    if version > FORMAT_VERSION:
+        raise ProjectFormatError(f"不支持的项目文件版本: {version}")
+
+    header_blob = f.read(header_length)
+    if len(header_blob) < header_length:
+        raise ProjectFormatError("项目文件头部不完整")
+    header = json.loads(header_blob.decode('utf-8'))
+    header['data_offset'] = PREAMBLE.size + header_length
+    return header
+
+
+def read_project_header(path: str) -> Dict[str, Any]:
+    """只读取二进制项目文件的头部（project_info、记录数、摘要和分段表）"""
+    with open(path, 'rb') as f:
+        return read_header(f)
+
+
+def read_section(f: IO, header: Dict[str, Any], section: Dict[str, Any]) -> Any:
+    """读取并解码一个分段"""
+    f.seek(header['data_offset'] + section['offset'])
+    blob = f.read(section['length'])
+    if len(blob) < section['length']:
+        raise ProjectFormatError(f"项目文件分段不完整: {section['name']}")
+    return _decode(blob, section['codec'])
+
+
+def load_binary_project(f: IO) -> Dict[str, Any]:
+    """读取完整的二进制项目文件"""
+    header = read_header(f)
+
+    project_data = {'project_info': header.get('project_info', {})}
+    expenses = []
+    for section in header['sections']:
+        if section['name'] == 'meta':
+            project_data.update(read_section(f, header, section))
+        elif section['name'] == 'expenses':
+            expenses.extend(read_section(f, header, section))
+    project_data['expenses'] = expenses
+
+    if len(expenses) != header.get('counts', {}).get('expenses', len(expenses)):
+        raise ProjectFormatError("费用记录数与文件头不一致")
+    return project_data
+
+
+def expense_sections(header: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """获取头部中的费用记录分段（按行号排序）"""
+    return sorted((s for s in header['sections'] if s['name'] == 'expenses'), key=lambda s: s['first_row'])
+
+
+def project_summary_from_header(header: Dict[str, Any]) -> Dict[str, Optional[Any]]:
+    """从头部取项目列表所需的摘要"""
+    return {
+        'project_info': header.get('project_info', {}),
+        'expense_count': header.get('counts', {}).get('expenses', 0),
+        'total_amount': header.get('summary', {}).get('total_amount', 0)
+    }
@@ -0,0 +1,162 @@
+"""
+项目目录监视模块 - 发现其他程序对项目文件的修改
+
+安装了watchdog时使用系统的文件变化通知（Linux上为inotify），否则定时比较目录中各文件的
+修改时间和大小。短时间内的连续变化合并为一次通知，只报告发生变化的文件名。
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Set, Tuple
+
+from .config import (
+    PROJECTS_DIR, WATCH_POLL_INTERVAL_SECONDS, WATCH_DEBOUNCE_SECONDS, WATCH_MAX_DELAY_SECONDS
+)
+from .optional_deps import optional_module
+
+
+class ProjectWatcher:
+    """监视项目目录，变化的文件名合并后在后台线程中回调 on_change(文件名集合)"""
+
+    def __init__(self, on_change: Callable[[Set[str]], None], extensions: Iterable[str],
+                 projects_dir: str = PROJECTS_DIR, poll_interval: float = WATCH_POLL_INTERVAL_SECONDS,
+                 debounce: float = WATCH_DEBOUNCE_SECONDS, max_delay: float = WATCH_MAX_DELAY_SECONDS,
+                 use_native: bool = True):
+        self.on_change = on_change
+        self.extensions = tuple(extensions)
+        self.projects_dir = projects_dir
+        self.poll_interval = poll_interval
+        self.debounce = debounce      # 最后一次变化后等待的秒数
+        self.max_delay = max_delay    # 持续变化时最多等待的秒数
+        self.use_native = use_native
+        self.mode = None              # 'native' 或 'polling'
+        self._pending = set()
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+        self._stamps = {}
+
+    # ===== 启动与停止 =====
+
+    def start(self):
+        """开始监视（优先使用系统通知，不可用时定时扫描）"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.mode = 'native' if self.use_native and self._start_observer() else 'polling'
+        if self.mode == 'polling':
+            self._stamps = self._scan()
+        self._thread = threading.Thread(target=self._run, name='project-watcher', daemon=True)
+        self._thread.start()
+        print(f"[SUCCESS] Watching project directory ({self.mode}): {self.projects_dir}")
+
+    def stop(self):
+        """停止监视，尚未通知的变化直接丢弃"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _start_observer(self) -> bool:
+        """启动watchdog观察器，未安装或启动失败时返回False"""
+        observers = optional_module('watchdog.observers')
+        events = optional_module('watchdog.events')
+        if observers is None or events is None:
+            return False
+
+        watcher = self
+
+        class Handler(events.FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # 原子写入是临时文件改名为项目文件，目标路径才是变化的文件
+                for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+                    if path:
+                        watcher.notify([os.path.basename(os.fsdecode(path))])
+
+        try:
+            self._observer = observers.Observer()
+            self._observer.schedule(Handler(), self.projects_dir, recursive=False)
+            self._observer.start()
+            return True
+        except Exception as e:
+            print(f"[WARNING] File system notifications unavailable, polling instead: {str(e)}")
+            self._observer = None
+            return False
+
+    # ===== 变化收集 =====
+
+    def _watched(self, filename: str) -> bool:
+        return not filename.startswith('.') and filename.endswith(self.extensions)
+
+    def notify(self, filenames: Iterable[str]):
+        """记录发生变化的文件（可在任意线程中调用）"""
+        filenames = [name for name in filenames if self._watched(name)]
+        if not filenames:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending:
+                self._first_event = now
+            self._pending.update(filenames)
+            self._last_event = now
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """目录中各文件的 (修改时间, 大小)"""
+        stamps = {}
+        try:
+            with os.scandir(self.projects_dir) as entries:
+                for entry in entries:
+                    if self._watched(entry.name):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        return stamps
+
+    def _poll(self):
+        """比较两次扫描的结果，找出新增、删除和修改的文件"""
+        stamps = self._scan()
+        changed = {name for name in stamps.keys() | self._stamps.keys()
+                   if stamps.get(name) != self._stamps.get(name)}
+        self._stamps = stamps
+        self.notify(changed)
+
+    def _take_ready(self) -> Set[str]:
+        """取出已经稳定（或等待过久）的变化"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending:
+                return set()
+            if now - self._last_event < self.debounce and now - self._first_event < self.max_delay:
+                return set()
+            ready, self._pending = self._pending, set()
+            return ready
+
+    def _run(self):
+        """后台线程：定时扫描（轮询模式）并在变化稳定后回调"""
+        tick = min(self.debounce, self.poll_interval) / 2 or 0.1
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.wait(tick):
+            if self.mode == 'polling' and time.monotonic() >= next_poll:
+                self._poll()
+                next_poll = time.monotonic() + self.poll_interval
+
+            ready = self._take_ready()
+            if ready:
+                try:
+                    self.on_change(ready)
+                except Exception as e:
+                    print(f"[ERROR] Failed to handle project file changes: {str(e)}")
+
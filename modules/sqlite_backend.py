@@ -0,0 +1,984 @@
+"""
+SQLite存储后端 - 与FileManager相同的API，数据保存在单个SQLite数据库中
+项目、费用记录、自定义类型和公式分别存放在带索引的表中，
+每次变更只是一个单行事务，不再重写整个项目
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Callable
+
+from .storage_backend import StorageBackend, EXPENSE_SORT_FIELDS, check_expense_date
+from .expense_calculator import get_calculator
+from .expense_importer import prepare_expense_batch, iter_batches
+from .portfolio import build_portfolio_statistics
+from .project_format import load_project_file
+from .time_rollup import TimeRollup, burn_rate, day_of, month_of
+from .config import SQLITE_DB_PATH, EXPENSE_TYPES, PREDEFINED_FORMULAS, IMPORT_BATCH_ROWS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    created_date TEXT,
+    last_modified TEXT,
+    description TEXT DEFAULT '',
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    created_at TEXT,
+    expense_type TEXT,
+    name TEXT,
+    quantity REAL,
+    unit_price REAL,
+    total_amount REAL NOT NULL DEFAULT 0,
+    date TEXT,
+    notes TEXT,
+    custom_type_id INTEGER,
+    formula_id TEXT,
+    extra TEXT,
+    PRIMARY KEY (project_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_formula ON expenses(project_id, formula_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_type ON expenses(project_id, expense_type);
+CREATE INDEX IF NOT EXISTS idx_expenses_custom_type ON expenses(project_id, custom_type_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(project_id, date);
+CREATE TABLE IF NOT EXISTS custom_expense_types (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    created_at TEXT,
+    name TEXT,
+    description TEXT,
+    category TEXT,
+    extra TEXT,
+    PRIMARY KEY (project_id, id)
+);
+CREATE TABLE IF NOT EXISTS formulas (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    expression TEXT,
+    params TEXT,
+    description TEXT,
+    is_custom INTEGER DEFAULT 0,
+    created_at TEXT,
+    extra TEXT,
+    PRIMARY KEY (project_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_formulas_id ON formulas(project_id, id);
+CREATE TABLE IF NOT EXISTS id_counters (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (project_id, kind)
+);
+"""
+
+# 各表中有独立列的字段，其余字段以JSON形式存放在extra列
+EXPENSE_COLUMNS = ['id', 'created_at', 'expense_type', 'name', 'quantity', 'unit_price',
+                   'total_amount', 'date', 'notes', 'custom_type_id', 'formula_id']
+CUSTOM_TYPE_COLUMNS = ['id', 'created_at', 'name', 'description', 'category']
+FORMULA_COLUMNS = ['id', 'name', 'expression', 'params', 'description', 'is_custom', 'created_at']
+PROJECT_INFO_COLUMNS = ['name', 'created_date', 'last_modified', 'description']
+TOTAL_AMOUNT_INDEX = 1 + EXPENSE_COLUMNS.index('total_amount')  # _expense_row 中总金额的位置（第一个是project_id）
+
+
+def _locked(method):
+    """在后端的锁内执行（连接允许跨线程使用，自动保存和后台任务可能与界面线程同时访问）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _split_record(record: Dict[str, Any], columns: List[str]) -> List[Any]:
+    """把记录拆分为列值列表 + extra JSON"""
+    values = [record.get(col) for col in columns]
+    extra = {k: v for k, v in record.items() if k not in columns}
+    values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return values
+
+
+def _expense_row(project_id: int, record: Dict[str, Any]) -> List[Any]:
+    """费用记录的插入参数（没有总金额时写0，与列的默认值一致）"""
+    values = [project_id] + _split_record(record, EXPENSE_COLUMNS)
+    if values[TOTAL_AMOUNT_INDEX] is None:
+        values[TOTAL_AMOUNT_INDEX] = 0
+    return values
+
+
+def _join_record(row: sqlite3.Row, columns: List[str]) -> Dict[str, Any]:
+    """把数据库行还原为记录字典，NULL列不出现在结果中"""
+    record = {col: row[col] for col in columns if row[col] is not None}
+    if row['extra']:
+        record.update(json.loads(row['extra']))
+    return record
+
+
+class SqliteStorageBackend(StorageBackend):
+    """SQLite存储后端"""
+
+    def __init__(self, db_path: str = SQLITE_DB_PATH):
+        """初始化数据库连接并创建表结构"""
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self.lock = threading.RLock()  # 串行化对连接和当前项目数据的访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+        self.current_project = None  # 当前打开的项目名称
+        self.project_data = None     # 当前项目的信息、公式和自定义类型（费用记录按需查询）
+        self._project_id = None
+
+    def _now(self) -> str:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _get_project_id(self, project_name: str) -> Optional[int]:
+        """根据项目名称获取数据库中的项目ID"""
+        row = self.conn.execute("SELECT id FROM projects WHERE name = ?", (str(project_name),)).fetchone()
+        return row['id'] if row else None
+
+    def _touch(self):
+        """更新当前项目的最后修改时间（在调用方的事务中执行）"""
+        now = self._now()
+        self.project_data['project_info']['last_modified'] = now
+        self.conn.execute("UPDATE projects SET last_modified = ? WHERE id = ?", (now, self._project_id))
+
+    # ===== 项目管理 =====
+
+    def get_cached_projects(self) -> List[Dict[str, Any]]:
+        """项目列表本身只需一次查询，不保存快照"""
+        return []
+
+    def start_watching(self, listener=None) -> bool:
+        """数据库由SQLite负责并发访问，不监视文件"""
+        return False
+
+    def stop_watching(self):
+        pass
+
+    @_locked
+    def get_all_projects(self) -> List[Dict[str, Any]]:
+        """获取所有项目的基本信息列表（一次聚合查询）"""
+        rows = self.conn.execute("""
+            SELECT p.name, p.created_date, p.last_modified, p.description,
+                   COUNT(e.id) AS expense_count,
+                   COALESCE(SUM(e.total_amount), 0) AS total_amount
+            FROM projects p LEFT JOIN expenses e ON e.project_id = p.id
+            GROUP BY p.id
+            ORDER BY p.last_modified DESC
+        """).fetchall()
+
+        return [{
+            'name': row['name'],
+            'file_name': row['name'],
+            'path': self.db_path,
+            'created_date': row['created_date'] or 'unknown',
+            'last_modified': row['last_modified'] or 'unknown',
+            'description': row['description'] or '',
+            'expense_count': row['expense_count'],
+            'total_amount': row['total_amount']
+        } for row in rows]
+
+    @_locked
+    def project_exists(self, project_name: str) -> bool:
+        """检查项目是否已存在"""
+        return self._get_project_id(project_name) is not None
+
+    @_locked
+    def create_project(self, project_name: str, description: str = "") -> bool:
+        """Create new project"""
+        try:
+            if self.project_exists(project_name):
+                raise ValueError(f"Project '{project_name}' already exists")
+
+            now = self._now()
+            formulas = []
+            for formula_key, formula in PREDEFINED_FORMULAS.items():
+                formulas.append({
+                    'id': formula_key,
+                    'name': formula['name'],
+                    'expression': formula['expression'],
+                    'params': formula['params'],
+                    'description': formula['description'],
+                    'is_custom': False
+                })
+
+            project_data = {
+                'project_info': {
+                    'name': project_name,
+                    'created_date': now,
+                    'last_modified': now,
+                    'description': description
+                },
+                'custom_expense_types': [],
+                'formulas': formulas,
+                'expenses': []
+            }
+            with self.conn:
+                self._insert_project(project_data)
+
+            print(f"[SUCCESS] Project created successfully: {project_name}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to create project: {str(e)}")
+            return False
+
+    def _insert_project(self, project_data: Dict[str, Any]):
+        """写入完整的项目数据（在调用方的事务中执行，失败时随事务一起回滚）"""
+        info = project_data['project_info']
+        cursor = self.conn.execute(
+            "INSERT INTO projects (name, created_date, last_modified, description, extra) VALUES (?, ?, ?, ?, ?)",
+            _split_record(info, PROJECT_INFO_COLUMNS))
+        project_id = cursor.lastrowid
+
+        self.conn.executemany(
+            "INSERT INTO expenses (project_id, id, created_at, expense_type, name, quantity, unit_price, "
+            "total_amount, date, notes, custom_type_id, formula_id, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_expense_row(project_id, exp) for exp in project_data.get('expenses', [])))
+
+        # ID计数器不小于已有记录的最大ID，删除后的ID不会被重新分配
+        expense_ids = [exp.get('id') for exp in project_data.get('expenses', []) if isinstance(exp.get('id'), int)]
+        counter = max([(project_data.get('id_counters') or {}).get('expense', 0)] + expense_ids)
+        self.conn.execute("INSERT INTO id_counters (project_id, kind, value) VALUES (?, 'expense', ?)",
+                          (project_id, counter))
+
+        self.conn.executemany(
+            "INSERT INTO custom_expense_types (project_id, id, created_at, name, description, category, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ([project_id] + _split_record(t, CUSTOM_TYPE_COLUMNS)
+             for t in project_data.get('custom_expense_types', [])))
+
+        for position, formula in enumerate(project_data.get('formulas', [])):
+            self._insert_formula(project_id, position, formula)
+
+    def _allocate_expense_ids(self, count: int) -> int:
+        """在调用方的事务中分配 count 个连续的费用ID，返回第一个
+
+        计数器保存在 id_counters 表中，单调递增，删除最后一条记录后ID也不会被重复使用。
+        """
+        row = self.conn.execute("SELECT value FROM id_counters WHERE project_id = ? AND kind = 'expense'",
+                                (self._project_id,)).fetchone()
+        if row is None:
+            # 没有计数器的旧数据库从现有记录的最大ID开始
+            row = self.conn.execute("SELECT COALESCE(MAX(id), 0) AS value FROM expenses WHERE project_id = ?",
+                                    (self._project_id,)).fetchone()
+        first_id = row['value'] + 1
+        self.conn.execute("INSERT OR REPLACE INTO id_counters (project_id, kind, value) VALUES (?, 'expense', ?)",
+                          (self._project_id, first_id + count - 1))
+        return first_id
+
+    def _insert_formula(self, project_id: int, position: int, formula: Dict[str, Any]):
+        """写入一条公式记录"""
+        record = dict(formula)
+        record['params'] = json.dumps(record.get('params', []), ensure_ascii=False)
+        record['is_custom'] = 1 if record.get('is_custom', False) else 0
+        self.conn.execute(
+            "INSERT INTO formulas (project_id, position, id, name, expression, params, description, "
+            "is_custom, created_at, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [project_id, position] + _split_record(record, FORMULA_COLUMNS))
+
+    def _load_project_parts(self, project_id: int) -> Dict[str, Any]:
+        """读取项目信息、自定义类型和公式（不含费用记录）"""
+        row = self.conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+        project_info = _join_record(row, PROJECT_INFO_COLUMNS)
+
+        custom_types = [_join_record(r, CUSTOM_TYPE_COLUMNS) for r in self.conn.execute(
+            "SELECT * FROM custom_expense_types WHERE project_id = ? ORDER BY id", (project_id,))]
+
+        formulas = []
+        for r in self.conn.execute("SELECT * FROM formulas WHERE project_id = ? ORDER BY position", (project_id,)):
+            formula = _join_record(r, FORMULA_COLUMNS)
+            formula['params'] = json.loads(formula.get('params') or '[]')
+            formula['is_custom'] = bool(formula.get('is_custom', 0))
+            formulas.append(formula)
+
+        return {
+            'project_info': project_info,
+            'custom_expense_types': custom_types,
+            'formulas': formulas
+        }
+
+    @_locked
+    def open_project(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """Open project, load project info, formulas and custom types"""
+        try:
+            project_id = self._get_project_id(project_name)
+            if project_id is None:
+                raise FileNotFoundError(f"Project does not exist in database: {project_name}")
+
+            self._project_id = project_id
+            self.project_data = self._load_project_parts(project_id)
+            self.current_project = project_name
+            self.project_data['project_info']['last_modified'] = self._now()
+
+            print(f"[SUCCESS] Project opened successfully: {project_name}")
+            return self.project_data
+
+        except Exception as e:
+            print(f"[ERROR] Failed to open project: {str(e)}")
+            return None
+
+    @_locked
+    def save_project(self) -> bool:
+        """Save current project info (expenses are already committed row by row)"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("No project opened")
+
+            with self.conn:
+                self._touch()
+                info = self.project_data['project_info']
+                self.conn.execute(
+                    "UPDATE projects SET name = ?, created_date = ?, last_modified = ?, description = ?, extra = ? "
+                    "WHERE id = ?", _split_record(info, PROJECT_INFO_COLUMNS) + [self._project_id])
+
+            print(f"[SUCCESS] Project saved successfully: {self.current_project}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to save project: {str(e)}")
+            return False
+
+    @_locked
+    def flush(self) -> bool:
+        """每次修改都在事务中提交，没有需要延迟写入的数据"""
+        return True
+
+    @_locked
+    def close_project(self):
+        """关闭当前项目"""
+        if self.current_project:
+            self.save_project()
+            print(f"[SUCCESS] Project closed: {self.current_project}")
+
+        self.current_project = None
+        self.project_data = None
+        self._project_id = None
+
+    @_locked
+    def delete_project(self, project_name: str) -> bool:
+        """Delete project"""
+        try:
+            project_id = self._get_project_id(project_name)
+            if project_id is None:
+                raise FileNotFoundError(f"Project does not exist in database: {project_name}")
+
+            if self.current_project == project_name:
+                self.close_project()
+
+            with self.conn:
+                self.conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+            print(f"[SUCCESS] Project deleted successfully: {project_name}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to delete project: {str(e)}")
+            return False
+
+    @_locked
+    def rename_project(self, old_name: str, new_name: str) -> bool:
+        """Rename project"""
+        try:
+            project_id = self._get_project_id(old_name)
+            if project_id is None:
+                raise FileNotFoundError(f"Original project does not exist: {old_name}")
+
+            if self.project_exists(new_name):
+                raise ValueError(f"New project name already exists: {new_name}")
+
+            with self.conn:
+                self.conn.execute("UPDATE projects SET name = ?, last_modified = ? WHERE id = ?",
+                                  (new_name, self._now(), project_id))
+
+            if self.current_project == old_name:
+                self.current_project = new_name
+                self.project_data['project_info']['name'] = new_name
+
+            print(f"[SUCCESS] Project renamed: {old_name} -> {new_name}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to rename project: {str(e)}")
+            return False
+
+    # ===== 费用记录管理方法 =====
+
+    @_locked
+    def add_expense(self, expense_data: Dict[str, Any]) -> Optional[int]:
+        """添加费用记录"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
+            check_expense_date(expense_data)
+
+            with self.conn:
+                new_id = self._allocate_expense_ids(1)
+
+                expense_record = {
+                    'id': new_id,
+                    'created_at': self._now()
+                }
+                expense_record.update(expense_data)
+
+                self.conn.execute(
+                    "INSERT INTO expenses (project_id, id, created_at, expense_type, name, quantity, unit_price, "
+                    "total_amount, date, notes, custom_type_id, formula_id, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    _expense_row(self._project_id, expense_record))
+                self._touch()
+
+            print(f"[SUCCESS] Expense added: ID={new_id}")
+            return new_id
+
+        except Exception as e:
+            print(f"[ERROR] Failed to add expense: {str(e)}")
+            return None
+
+    @_locked
+    def bulk_add_expenses(self, expenses: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_ROWS,
+                          progress: Optional[Callable[[int], None]] = None) -> Optional[Dict[str, Any]]:
+        """批量添加费用记录：分批校验，每批 executemany 插入，全部在一个事务中提交"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
+
+            started = time.perf_counter()
+            formulas = {formula.get('id'): formula for formula in reversed(self.get_all_formulas())}
+            errors, rows, added, first_id, last_id = [], 0, 0, None, None
+            created_at = self._now()
+
+            with self.conn:
+                for batch in iter_batches(expenses, batch_size):
+                    valid, batch_errors = prepare_expense_batch(batch, formulas, rows + 1)
+                    errors.extend(batch_errors)
+                    rows += len(batch)
+
+                    if valid:
+                        # 同一事务中每批分配的ID是连续的
+                        next_id = self._allocate_expense_ids(len(valid))
+                        records = []
+                        for expense_id, expense in enumerate(valid, next_id):
+                            record = {'id': expense_id, 'created_at': created_at}
+                            record.update(expense)
+                            record['id'] = expense_id
+                            records.append(_expense_row(self._project_id, record))
+                        self.conn.executemany(
+                            "INSERT INTO expenses (project_id, id, created_at, expense_type, name, quantity, unit_price, "
+                            "total_amount, date, notes, custom_type_id, formula_id, extra) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+                        if first_id is None:
+                            first_id = next_id
+                        last_id = next_id + len(records) - 1
+                        added += len(records)
+                    if progress:
+                        progress(rows)
+                if added:
+                    self._touch()
+
+            seconds = time.perf_counter() - started
+            print(f"[SUCCESS] Bulk added {added} expenses "
+                  f"({len(errors)} rejected, {rows / seconds if seconds else 0:.0f} rows/s)")
+            return {'rows': rows, 'added': added, 'errors': errors, 'first_id': first_id,
+                    'last_id': last_id,
+                    'seconds': seconds, 'rows_per_second': rows / seconds if seconds else 0.0}
+
+        except Exception as e:
+            print(f"[ERROR] Failed to bulk add expenses: {str(e)}")
+            return None
+
+    @_locked
+    def get_all_expenses(self) -> List[Dict[str, Any]]:
+        """获取所有费用记录"""
+        if not self.current_project or not self.project_data:
+            return []
+
+        rows = self.conn.execute("SELECT * FROM expenses WHERE project_id = ? ORDER BY id", (self._project_id,))
+        return [_join_record(row, EXPENSE_COLUMNS) for row in rows]
+
+    @_locked
+    def get_expense_count(self) -> int:
+        """获取当前项目的费用记录数"""
+        if not self.current_project:
+            return 0
+
+        row = self.conn.execute("SELECT COUNT(*) FROM expenses WHERE project_id = ?", (self._project_id,)).fetchone()
+        return row[0]
+
+    @_locked
+    def get_expenses_page(self, offset: int, limit: int, sort_by: Optional[str] = None,
+                          descending: bool = False) -> List[Dict[str, Any]]:
+        """按位置取一页费用记录（ORDER BY ... LIMIT/OFFSET）"""
+        if not self.current_project:
+            return []
+
+        if sort_by is None:
+            order_by = "id"
+        elif sort_by in EXPENSE_SORT_FIELDS:
+            # 字段名来自白名单，可以直接拼入SQL；空值排在最后
+            direction = "DESC" if descending else "ASC"
+            order_by = f"{sort_by} IS NULL OR {sort_by} = '', {sort_by} {direction}, id"
+        else:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+
+        rows = self.conn.execute(
+            f"SELECT * FROM expenses WHERE project_id = ? ORDER BY {order_by} LIMIT ? OFFSET ?",
+            (self._project_id, limit, max(0, offset)))
+        return [_join_record(row, EXPENSE_COLUMNS) for row in rows]
+
+    @_locked
+    def get_expense_by_id(self, expense_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取费用记录"""
+        if not self.current_project:
+            return None
+
+        row = self.conn.execute("SELECT * FROM expenses WHERE project_id = ? AND id = ?",
+                                (self._project_id, expense_id)).fetchone()
+        return _join_record(row, EXPENSE_COLUMNS) if row else None
+
+    @_locked
+    def update_expense(self, expense_id: int, expense_data: Dict[str, Any]) -> bool:
+        """更新费用记录"""
+        try:
+            check_expense_date(expense_data)
+            existing = self.get_expense_by_id(expense_id)
+            if not existing:
+                raise ValueError(f"找不到费用记录: ID={expense_id}")
+
+            # 保留原有的创建时间和ID
+            expense_data['id'] = expense_id
+            expense_data['created_at'] = existing.get('created_at', self._now())
+
+            values = _expense_row(self._project_id, expense_data)[1:]
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE expenses SET id = ?, created_at = ?, expense_type = ?, name = ?, quantity = ?, "
+                    "unit_price = ?, total_amount = ?, date = ?, notes = ?, custom_type_id = ?, formula_id = ?, extra = ? "
+                    "WHERE project_id = ? AND id = ?", values + [self._project_id, expense_id])
+                self._touch()
+
+            print(f"[SUCCESS] Expense updated: ID={expense_id}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to update expense: {str(e)}")
+            return False
+
+    @_locked
+    def delete_expense(self, expense_id: int) -> bool:
+        """删除费用记录"""
+        try:
+            with self.conn:
+                cursor = self.conn.execute("DELETE FROM expenses WHERE project_id = ? AND id = ?",
+                                           (self._project_id, expense_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"找不到费用记录: ID={expense_id}")
+                self._touch()
+
+            print(f"[SUCCESS] Expense deleted: ID={expense_id}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to delete expense: {str(e)}")
+            return False
+
+    # ===== 自定义类型管理方法 =====
+
+    @_locked
+    def add_custom_expense_type(self, type_data: Dict[str, Any]) -> Optional[int]:
+        """添加自定义费用类型"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
+
+            custom_types = self.project_data['custom_expense_types']
+            new_id = max([t.get('id', 0) for t in custom_types], default=0) + 1
+
+            type_record = {
+                'id': new_id,
+                'created_at': self._now()
+            }
+            type_record.update(type_data)
+
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO custom_expense_types (project_id, id, created_at, name, description, category, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", [self._project_id] + _split_record(type_record, CUSTOM_TYPE_COLUMNS))
+                self._touch()
+            custom_types.append(type_record)
+
+            print(f"[SUCCESS] Custom expense type added: ID={new_id}")
+            return new_id
+
+        except Exception as e:
+            print(f"[ERROR] Failed to add custom expense type: {str(e)}")
+            return None
+
+    @_locked
+    def get_all_custom_expense_types(self) -> List[Dict[str, Any]]:
+        """获取所有自定义费用类型"""
+        if not self.current_project or not self.project_data:
+            return []
+
+        return self.project_data.get('custom_expense_types', [])
+
+    @_locked
+    def get_custom_expense_type_by_id(self, type_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取自定义费用类型"""
+        for custom_type in self.get_all_custom_expense_types():
+            if custom_type.get('id') == type_id:
+                return custom_type
+        return None
+
+    # ===== 公式管理方法 =====
+
+    @_locked
+    def add_custom_formula(self, formula_data: Dict[str, Any]) -> Optional[str]:
+        """添加自定义公式"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
+
+            formulas = self.project_data['formulas']
+            custom_numbers = [int(f['id'][len('custom_'):]) for f in formulas
+                              if f.get('is_custom', False) and str(f.get('id', '')).startswith('custom_')
+                              and str(f['id'][len('custom_'):]).isdigit()]
+            new_id = max(custom_numbers, default=0) + 1
+
+            formula_record = {
+                'id': f"custom_{new_id}",
+                'is_custom': True,
+                'created_at': self._now()
+            }
+            formula_record.update(formula_data)
+
+            with self.conn:
+                self._insert_formula(self._project_id, len(formulas), formula_record)
+                self._touch()
+            formulas.append(formula_record)
+
+            print(f"[SUCCESS] Custom formula added: ID={formula_record['id']}")
+            return formula_record['id']
+
+        except Exception as e:
+            print(f"[ERROR] Failed to add custom formula: {str(e)}")
+            return None
+
+    @_locked
+    def update_custom_formula(self, formula_id: str, formula_data: Dict[str, Any]) -> Optional[int]:
+        """更新自定义公式，并在同一事务中重新计算依赖它的费用记录"""
+        try:
+            if not self.current_project or not self.project_data:
+                raise ValueError("没有打开的项目")
+
+            formula = self.get_formula_by_id(formula_id)
+            if not formula:
+                raise ValueError(f"找不到公式: ID={formula_id}")
+            if not formula.get('is_custom', False):
+                raise ValueError("预定义公式不能修改")
+
+            updated = dict(formula)
+            updated.update(formula_data)
+            updated['id'] = formula_id
+            updated['updated_at'] = self._now()
+            param_names = updated.get('params', [])
+            calculator = get_calculator()
+            calculator.compile(updated['expression'], param_names)
+
+            # 通过formula_id索引只读取依赖该公式的记录
+            rows = []
+            for row in self.conn.execute("SELECT id, extra FROM expenses WHERE project_id = ? AND formula_id = ?",
+                                         (self._project_id, formula_id)):
+                params = json.loads(row['extra'] or '{}').get('params', {})
+                if all(name in params for name in param_names):
+                    rows.append((row['id'], params))
+
+            if param_names:
+                columns = {name: [params[name] for _, params in rows] for name in param_names}
+                totals = calculator.calculate_batch(updated['expression'], columns)
+            else:
+                totals = [calculator.calculate_expense(updated['expression'], {})] * len(rows)
+
+            record = dict(updated)
+            record['params'] = json.dumps(record.get('params', []), ensure_ascii=False)
+            record['is_custom'] = 1
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE formulas SET name = ?, expression = ?, params = ?, description = ?, is_custom = ?, "
+                    "created_at = ?, extra = ? WHERE project_id = ? AND id = ?",
+                    _split_record(record, FORMULA_COLUMNS)[1:] + [self._project_id, formula_id])
+                self.conn.executemany(
+                    "UPDATE expenses SET total_amount = ? WHERE project_id = ? AND id = ?",
+                    ((total, self._project_id, expense_id) for (expense_id, _), total in zip(rows, totals)))
+                self._touch()
+            formula.clear()
+            formula.update(updated)
+
+            print(f"[SUCCESS] Custom formula updated: ID={formula_id}, recalculated {len(rows)} expenses")
+            return len(rows)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to update custom formula: {str(e)}")
+            return None
+
+    @_locked
+    def get_all_formulas(self) -> List[Dict[str, Any]]:
+        """获取所有公式（包括预定义和自定义）"""
+        if not self.current_project or not self.project_data:
+            return []
+
+        return self.project_data.get('formulas', [])
+
+    @_locked
+    def get_formula_by_id(self, formula_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取公式"""
+        for formula in self.get_all_formulas():
+            if formula.get('id') == formula_id:
+                return formula
+        return None
+
+    # ===== 统计方法 =====
+
+    @_locked
+    def get_expense_statistics(self) -> Dict[str, Any]:
+        """获取费用统计信息（GROUP BY 聚合查询）"""
+        if not self.current_project or not self.project_data:
+            return {}
+
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS total_count, COALESCE(SUM(total_amount), 0) AS grand_total, "
+            "COALESCE(MIN(total_amount), 0) AS min_amount, COALESCE(MAX(total_amount), 0) AS max_amount "
+            "FROM expenses WHERE project_id = ?", (self._project_id,)).fetchone()
+        total_count = row['total_count']
+        grand_total = row['grand_total']
+
+        # 按类型统计（不同类型代码可能映射到同一显示名称，需要合并）
+        type_stats = {}
+        for r in self.conn.execute(
+                "SELECT COALESCE(expense_type, 'other') AS expense_type, COUNT(*) AS count, "
+                "SUM(total_amount) AS total_amount FROM expenses WHERE project_id = ? "
+                "GROUP BY COALESCE(expense_type, 'other')", (self._project_id,)):
+            type_name = EXPENSE_TYPES.get(r['expense_type'], r['expense_type'])
+            stats = type_stats.setdefault(type_name, {'count': 0, 'total_amount': 0})
+            stats['count'] += r['count']
+            stats['total_amount'] += r['total_amount']
+
+        by_type = [{
+            'expense_type': type_name,
+            'count': stats['count'],
+            'total_amount': stats['total_amount']
+        } for type_name, stats in type_stats.items()]
+
+        # 按自定义类型统计
+        custom_type_stats = {}
+        for r in self.conn.execute(
+                "SELECT e.custom_type_id, t.name, COUNT(*) AS count, SUM(e.total_amount) AS total_amount "
+                "FROM expenses e JOIN custom_expense_types t "
+                "ON t.project_id = e.project_id AND t.id = e.custom_type_id "
+                "WHERE e.project_id = ? GROUP BY e.custom_type_id", (self._project_id,)):
+            type_name = r['name'] or f"自定义类型{r['custom_type_id']}"
+            stats = custom_type_stats.setdefault(type_name, {'count': 0, 'total_amount': 0})
+            stats['count'] += r['count']
+            stats['total_amount'] += r['total_amount']
+
+        by_custom_type = [{
+            'type_name': type_name,
+            'count': stats['count'],
+            'total_amount': stats['total_amount']
+        } for type_name, stats in custom_type_stats.items()]
+
+        return {
+            'overall': {
+                'total_count': total_count,
+                'grand_total': grand_total,
+                'avg_amount': grand_total / total_count if total_count > 0 else 0,
+                'min_amount': row['min_amount'],
+                'max_amount': row['max_amount']
+            },
+            'by_type': by_type,
+            'by_custom_type': by_custom_type
+        }
+
+    @_locked
+    def get_expense_time_series(self, granularity: str = 'month', start: Optional[str] = None,
+                                end: Optional[str] = None, expense_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按日/月/季度汇总的费用序列（按日期和类型 GROUP BY 后合并到各周期）"""
+        if not self.current_project or not self.project_data:
+            return []
+
+        try:
+            rollup = TimeRollup()
+            for r in self.conn.execute(
+                    "SELECT date, COALESCE(expense_type, 'other') AS expense_type, COUNT(*) AS count, "
+                    "SUM(total_amount) AS total_amount FROM expenses WHERE project_id = ? "
+                    "GROUP BY date, COALESCE(expense_type, 'other')", (self._project_id,)):
+                rollup.add_bucket(r['date'], r['expense_type'], r['count'], r['total_amount'])
+            return burn_rate(rollup.series(granularity, start, end, expense_type, fill_gaps=True))
+        except ValueError as e:
+            print(f"[ERROR] Failed to get expense time series: {str(e)}")
+            return []
+
+    @_locked
+    def get_expense_total_in_range(self, start_date: str, end_date: str,
+                                   expense_type: Optional[str] = None) -> Dict[str, Any]:
+        """日期区间内（包含两端）的费用合计（日期统一为 YYYY-MM-DD 后比较）"""
+        if not self.current_project or not self.project_data:
+            return {}
+
+        start, end = day_of(start_date), day_of(end_date)
+        if not start or not end:
+            print(f"[ERROR] Failed to get expense total in range: 无效的日期 {start_date} ~ {end_date}")
+            return {}
+
+        sql = ("SELECT COUNT(*) AS count, COALESCE(SUM(total_amount), 0) AS total_amount FROM expenses "
+               "WHERE project_id = ? AND substr(replace(date, '/', '-'), 1, 10) BETWEEN ? AND ?")
+        params = [self._project_id, start, end]
+        if expense_type is not None:
+            sql += " AND COALESCE(expense_type, 'other') = ?"
+            params.append(expense_type)
+        row = self.conn.execute(sql, params).fetchone()
+        return {'start': start, 'end': end, 'count': row['count'], 'total_amount': row['total_amount']}
+
+    @_locked
+    def get_portfolio_statistics(self) -> Dict[str, Any]:
+        """汇总全部项目的费用（GROUP BY 聚合查询，不需要逐个读取项目）"""
+        try:
+            start = time.perf_counter()
+            summaries = {}
+            for row in self.conn.execute(
+                    "SELECT p.id, p.name, COUNT(e.id) AS expense_count, "
+                    "COALESCE(SUM(e.total_amount), 0) AS total_amount "
+                    "FROM projects p LEFT JOIN expenses e ON e.project_id = p.id GROUP BY p.id"):
+                summaries[row['id']] = {
+                    'name': row['name'],
+                    'expense_count': row['expense_count'],
+                    'total_amount': row['total_amount'],
+                    'by_type': [],
+                    'by_custom_type': [],
+                    'by_month': []
+                }
+
+            for r in self.conn.execute(
+                    "SELECT project_id, COALESCE(expense_type, 'other') AS expense_type, COUNT(*) AS count, "
+                    "SUM(total_amount) AS total_amount FROM expenses "
+                    "GROUP BY project_id, COALESCE(expense_type, 'other')"):
+                summaries[r['project_id']]['by_type'].append([r['expense_type'], r['count'], r['total_amount']])
+
+            for r in self.conn.execute(
+                    "SELECT e.project_id, e.custom_type_id, t.name, COUNT(*) AS count, "
+                    "SUM(e.total_amount) AS total_amount FROM expenses e JOIN custom_expense_types t "
+                    "ON t.project_id = e.project_id AND t.id = e.custom_type_id "
+                    "GROUP BY e.project_id, e.custom_type_id"):
+                type_name = r['name'] or f"自定义类型{r['custom_type_id']}"
+                summaries[r['project_id']]['by_custom_type'].append([type_name, r['count'], r['total_amount']])
+
+            # 不同的日期在合并时归入同一月份
+            for r in self.conn.execute(
+                    "SELECT project_id, date, COUNT(*) AS count, SUM(total_amount) AS total_amount "
+                    "FROM expenses GROUP BY project_id, date"):
+                summaries[r['project_id']]['by_month'].append([month_of(r['date']), r['count'], r['total_amount']])
+
+            result = build_portfolio_statistics(list(summaries.values()))
+            result['scan'] = {'parsed': len(summaries), 'cached': 0, 'seconds': time.perf_counter() - start}
+            return result
+
+        except Exception as e:
+            print(f"[ERROR] Failed to collect portfolio statistics: {str(e)}")
+            return {}
+
+    # ===== 导入导出方法 =====
+
+    @_locked
+    def import_project(self, source_path: str, overwrite: bool = False) -> bool:
+        """从项目文件导入项目（JSON或二进制格式均可）"""
+        try:
+            if not os.path.exists(source_path):
+                raise FileNotFoundError(f"源文件不存在: {source_path}")
+
+            source_data = load_project_file(source_path)
+
+            return self.store_project_data(source_data, overwrite)
+
+        except Exception as e:
+            print(f"[ERROR] Failed to import project: {str(e)}")
+            return False
+
+    @_locked
+    def store_project_data(self, project_data: Dict[str, Any], overwrite: bool = False) -> bool:
+        """把完整的项目数据写入数据库"""
+        try:
+            if 'project_info' not in project_data or 'name' not in project_data['project_info']:
+                raise ValueError("无效的项目文件格式")
+
+            project_name = project_data['project_info']['name']
+            project_id = self._get_project_id(project_name)
+            if project_id is not None:
+                if not overwrite:
+                    raise ValueError(f"项目 '{project_name}' 已存在，请选择覆盖或重命名")
+                if self.current_project == project_name:
+                    self.close_project()
+
+            # 删除旧项目和写入新数据在同一个事务中，写入失败时旧项目保持不变
+            with self.conn:
+                if project_id is not None:
+                    self.conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+                self._insert_project(project_data)
+
+            print(f"[SUCCESS] Project imported: {project_name}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to import project: {str(e)}")
+            return False
+
+    @_locked
+    def load_project_data(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """读取项目的完整数据（JSON项目文件结构）"""
+        try:
+            project_id = self._get_project_id(project_name)
+            if project_id is None:
+                raise FileNotFoundError(f"Project does not exist in database: {project_name}")
+
+            project_data = self._load_project_parts(project_id)
+            rows = self.conn.execute("SELECT * FROM expenses WHERE project_id = ? ORDER BY id", (project_id,))
+            project_data['expenses'] = [_join_record(row, EXPENSE_COLUMNS) for row in rows]
+            project_data['id_counters'] = {row['kind']: row['value'] for row in self.conn.execute(
+                "SELECT kind, value FROM id_counters WHERE project_id = ?", (project_id,))}
+            return project_data
+
+        except Exception as e:
+            print(f"[ERROR] Failed to load project data: {str(e)}")
+            return None
+
+    @_locked
+    def export_project(self, project_name: str, target_path: str) -> bool:
+        """将项目导出为JSON项目文件"""
+        try:
+            project_data = self.load_project_data(project_name)
+            if project_data is None:
+                raise FileNotFoundError(f"项目不存在: {project_name}")
+
+            with open(target_path, 'w', encoding='utf-8') as f:
+                json.dump(project_data, f, ensure_ascii=False, indent=2)
+
+            print(f"[SUCCESS] Project exported: {project_name} -> {target_path}")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] Failed to export project: {str(e)}")
+            return False
@@ -0,0 +1,202 @@
+"""
+存储后端接口 - 定义项目数据存储需要实现的统一API
+GUI只依赖这里列出的方法，具体存储方式（JSON文件 / SQLite）可以替换
+"""
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+from .config import IMPORT_BATCH_ROWS
+from .time_rollup import day_of, expense_date
+
+# 可用于分页排序的费用字段
+EXPENSE_SORT_FIELDS = ('id', 'date', 'expense_type', 'name', 'quantity', 'unit_price', 'total_amount', 'notes')
+NUMERIC_SORT_FIELDS = ('id', 'quantity', 'unit_price', 'total_amount')
+
+
+def expense_sort_key(sort_by: str) -> Callable[[Dict[str, Any]], Any]:
+    """生成按字段排序费用记录的key函数，空值排在最后"""
+    if sort_by not in EXPENSE_SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {sort_by}")
+
+    if sort_by in NUMERIC_SORT_FIELDS:
+        def key(expense):
+            value = expense.get(sort_by)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return (0, value)
+            return (1, 0)
+    elif sort_by == 'date':
+        def key(expense):
+            value = expense.get('date', expense.get('expense_date')) or ''
+            return (value == '', str(value))
+    else:
+        def key(expense):
+            value = expense.get(sort_by) or ''
+            return (value == '', str(value))
+    return key
+
+
+def check_expense_date(expense: Dict[str, Any]):
+    """校验费用记录的日期（没有日期时不检查），格式错误或日期不存在时抛出 ValueError"""
+    value = expense_date(expense)
+    if value not in (None, '') and not day_of(value):
+        raise ValueError(f"日期格式错误: {value}")
+
+
+class StorageBackend:
+    """存储后端基类 - 子类需要实现以下全部方法"""
+
+    current_project = None  # 当前打开的项目名称
+    project_data = None     # 当前项目的数据（至少包含project_info）
+
+    # ===== 项目管理 =====
+
+    def get_all_projects(self) -> List[Dict[str, Any]]:
+        """获取所有项目的基本信息列表"""
+        raise NotImplementedError
+
+    def get_cached_projects(self) -> List[Dict[str, Any]]:
+        """上次已知的项目列表（启动时立即显示，可能已过期；没有缓存时返回空列表）"""
+        raise NotImplementedError
+
+    def start_watching(self, listener: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+        """开始监视其他程序对项目的修改，listener(结果) 在后台线程中调用；不支持时返回False"""
+        raise NotImplementedError
+
+    def stop_watching(self):
+        """停止监视"""
+        raise NotImplementedError
+
+    def project_exists(self, project_name: str) -> bool:
+        """检查项目是否已存在"""
+        raise NotImplementedError
+
+    def create_project(self, project_name: str, description: str = "") -> bool:
+        """创建新项目"""
+        raise NotImplementedError
+
+    def open_project(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """打开项目"""
+        raise NotImplementedError
+
+    def save_project(self) -> bool:
+        """保存当前项目"""
+        raise NotImplementedError
+
+    def flush(self) -> bool:
+        """立即写入尚未保存的修改"""
+        raise NotImplementedError
+
+    def close_project(self):
+        """关闭当前项目"""
+        raise NotImplementedError
+
+    def delete_project(self, project_name: str) -> bool:
+        """删除项目"""
+        raise NotImplementedError
+
+    def rename_project(self, old_name: str, new_name: str) -> bool:
+        """重命名项目"""
+        raise NotImplementedError
+
+    # ===== 费用记录 =====
+
+    def add_expense(self, expense_data: Dict[str, Any]) -> Optional[int]:
+        """添加费用记录"""
+        raise NotImplementedError
+
+    def bulk_add_expenses(self, expenses: Iterable[Dict[str, Any]], batch_size: int = IMPORT_BATCH_ROWS,
+                          progress: Optional[Callable[[int], None]] = None) -> Optional[Dict[str, Any]]:
+        """批量添加费用记录（分批校验、计算总金额，一次提交），返回导入结果"""
+        raise NotImplementedError
+
+    def get_all_expenses(self) -> List[Dict[str, Any]]:
+        """获取所有费用记录"""
+        raise NotImplementedError
+
+    def get_expense_count(self) -> int:
+        """获取当前项目的费用记录数"""
+        raise NotImplementedError
+
+    def get_expenses_page(self, offset: int, limit: int, sort_by: Optional[str] = None,
+                          descending: bool = False) -> List[Dict[str, Any]]:
+        """按位置取一页费用记录，sort_by为None时按添加顺序"""
+        raise NotImplementedError
+
+    def get_expense_by_id(self, expense_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取费用记录"""
+        raise NotImplementedError
+
+    def update_expense(self, expense_id: int, expense_data: Dict[str, Any]) -> bool:
+        """更新费用记录"""
+        raise NotImplementedError
+
+    def delete_expense(self, expense_id: int) -> bool:
+        """删除费用记录"""
+        raise NotImplementedError
+
+    # ===== 自定义类型与公式 =====
+
+    def add_custom_expense_type(self, type_data: Dict[str, Any]) -> Optional[int]:
+        """添加自定义费用类型"""
+        raise NotImplementedError
+
+    def get_all_custom_expense_types(self) -> List[Dict[str, Any]]:
+        """获取所有自定义费用类型"""
+        raise NotImplementedError
+
+    def get_custom_expense_type_by_id(self, type_id: int) -> Optional[Dict[str, Any]]:
+        """根据ID获取自定义费用类型"""
+        raise NotImplementedError
+
+    def add_custom_formula(self, formula_data: Dict[str, Any]) -> Optional[str]:
+        """添加自定义公式"""
+        raise NotImplementedError
+
+    def update_custom_formula(self, formula_id: str, formula_data: Dict[str, Any]) -> Optional[int]:
+        """更新自定义公式并重新计算依赖它的费用记录，返回重新计算的记录数"""
+        raise NotImplementedError
+
+    def get_all_formulas(self) -> List[Dict[str, Any]]:
+        """获取所有公式"""
+        raise NotImplementedError
+
+    def get_formula_by_id(self, formula_id: str) -> Optional[Dict[str, Any]]:
+        """根据ID获取公式"""
+        raise NotImplementedError
+
+    # ===== 统计 =====
+
+    def get_expense_statistics(self) -> Dict[str, Any]:
+        """获取当前项目的费用统计信息"""
+        raise NotImplementedError
+
+    def get_expense_time_series(self, granularity: str = 'month', start: Optional[str] = None,
+                                end: Optional[str] = None, expense_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按日/月/季度（'day'/'month'/'quarter'）汇总的费用序列，附带累计支出和消耗速率"""
+        raise NotImplementedError
+
+    def get_expense_total_in_range(self, start_date: str, end_date: str,
+                                   expense_type: Optional[str] = None) -> Dict[str, Any]:
+        """日期区间内（包含两端）的费用合计"""
+        raise NotImplementedError
+
+    def get_portfolio_statistics(self) -> Dict[str, Any]:
+        """汇总全部项目的费用（按项目、类型、自定义类型和月份），失败时返回空字典"""
+        raise NotImplementedError
+
+    # ===== 导入导出 =====
+
+    def import_project(self, source_path: str, overwrite: bool = False) -> bool:
+        """从JSON项目文件导入项目"""
+        raise NotImplementedError
+
+    def export_project(self, project_name: str, target_path: str) -> bool:
+        """将项目导出为JSON项目文件"""
+        raise NotImplementedError
+
+    def load_project_data(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """读取项目的完整数据（JSON项目文件结构），不改变当前打开的项目"""
+        raise NotImplementedError
+
+    def store_project_data(self, project_data: Dict[str, Any], overwrite: bool = False) -> bool:
+        """写入一份完整的项目数据（JSON项目文件结构），用于导入和后端迁移"""
+        raise NotImplementedError
@@ -0,0 +1,79 @@
+"""
+存储后端迁移工具 - 在JSON项目文件、二进制项目文件与SQLite数据库之间迁移项目
+
+用法（在项目根目录下运行）:
+    python -m modules.storage_migration json-to-sqlite [--overwrite]
+    python -m modules.storage_migration sqlite-to-json [--overwrite]
+    python -m modules.storage_migration json-to-binary [--overwrite]
+    python -m modules.storage_migration binary-to-json [--overwrite]
+"""
+import argparse
+from typing import Dict, Any
+
+from .storage_backend import StorageBackend
+from .file_manager import FileManager
+from .sqlite_backend import SqliteStorageBackend
+from .config import PROJECTS_DIR, SQLITE_DB_PATH
+
+
+def migrate_projects(source: StorageBackend, target: StorageBackend, overwrite: bool = False) -> Dict[str, Any]:
+    """把源后端中的全部项目复制到目标后端，返回迁移结果"""
+    result = {'migrated': [], 'skipped': [], 'failed': []}
+
+    for project in source.get_all_projects():
+        project_name = project['name']
+
+        if target.project_exists(project_name) and not overwrite:
+            print(f"[SKIP] Project already exists in target: {project_name}")
+            result['skipped'].append(project_name)
+            continue
+
+        # 同一目录下的两种文件格式共用操作日志，先把日志合并进源文件
+        if isinstance(source, FileManager) and isinstance(target, FileManager):
+            if source.open_project(project_name) is not None:
+                source.close_project()
+
+        project_data = source.load_project_data(project_name)
+        if project_data is not None and target.store_project_data(project_data, overwrite=True):
+            result['migrated'].append(project_name)
+        else:
+            result['failed'].append(project_name)
+
+    print(f"[SUCCESS] Migration finished: {len(result['migrated'])} migrated, "
+          f"{len(result['skipped'])} skipped, {len(result['failed'])} failed")
+    return result
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="在JSON项目文件、二进制项目文件与SQLite数据库之间迁移项目")
+    parser.add_argument('direction', choices=['json-to-sqlite', 'sqlite-to-json', 'json-to-binary', 'binary-to-json'],
+                        help="迁移方向")
+    parser.add_argument('--db', default=SQLITE_DB_PATH, help=f"SQLite数据库路径（默认 {SQLITE_DB_PATH}）")
+    parser.add_argument('--overwrite', action='store_true', help="覆盖目标中已存在的同名项目")
+    args = parser.parse_args()
+
+    print(f"项目目录: {PROJECTS_DIR}")
+
+    if args.direction in ('json-to-binary', 'binary-to-json'):
+        json_backend = FileManager(file_format='json')
+        binary_backend = FileManager(file_format='binary')
+        if args.direction == 'json-to-binary':
+            migrate_projects(json_backend, binary_backend, args.overwrite)
+        else:
+            migrate_projects(binary_backend, json_backend, args.overwrite)
+        print("迁移完成后在 modules/config.py 中设置 PROJECT_FILE_FORMAT 以使用对应格式")
+        return
+
+    json_backend = FileManager()
+    sqlite_backend = SqliteStorageBackend(args.db)
+    print(f"SQLite数据库: {args.db}")
+
+    if args.direction == 'json-to-sqlite':
+        migrate_projects(json_backend, sqlite_backend, args.overwrite)
+    else:
+        migrate_projects(sqlite_backend, json_backend, args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+时间汇总模块 - 按日、月、季度预先汇总的费用合计（再按费用类型细分）
+随费用记录增删改增量维护，区间查询只读取区间内的汇总桶，不需要遍历费用记录；
+汇总结果随项目一起保存，打开项目时无需重新计算
+"""
+import calendar
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from .expense_store import ExpenseStore
+
+ROLLUP_VERSION = 1
+GRANULARITIES = ('day', 'month', 'quarter')
+UNDATED = ''  # 没有日期或日期格式无法识别的记录归入该周期
+
+
+# ===== 日期与周期 =====
+
+def day_of(value) -> str:
+    """规范化日期字符串（YYYY-MM-DD 或 YYYY/MM/DD，可带时间），无法识别或日期不存在时返回 UNDATED"""
+    if (isinstance(value, str) and len(value) >= 10 and value[4] in '-/' and value[7] == value[4]
+            and value[:4].isdigit() and value[5:7].isdigit() and value[8:10].isdigit()):
+        day = f"{value[:4]}-{value[5:7]}-{value[8:10]}"
+        try:
+            date.fromisoformat(day)  # 排除 2026-02-30、2026-00-10 这样不存在的日期
+        except ValueError:
+            return UNDATED
+        return day
+    return UNDATED
+
+
+def month_of(value) -> str:
+    """日期所在的月份 YYYY-MM"""
+    day = day_of(value)
+    return day[:7] if day else UNDATED
+
+
+def quarter_of(value) -> str:
+    """日期所在的季度 YYYY-Qn"""
+    day = day_of(value)
+    return f"{day[:4]}-Q{(int(day[5:7]) + 2) // 3}" if day else UNDATED
+
+
+def expense_date(expense: Dict[str, Any]):
+    """费用记录的日期（兼容旧的 expense_date 字段）"""
+    return expense.get('date', expense.get('expense_date'))
+
+
+def _periods(value) -> Tuple[str, str, str]:
+    """日期对应的 (日, 月, 季度) 周期"""
+    day = day_of(value)
+    if not day:
+        return UNDATED, UNDATED, UNDATED
+    return day, day[:7], f"{day[:4]}-Q{(int(day[5:7]) + 2) // 3}"
+
+
+def _next_period(granularity: str, period: str) -> str:
+    """下一个周期的键"""
+    if granularity == 'day':
+        return (date.fromisoformat(period) + timedelta(days=1)).isoformat()
+    year, number = int(period[:4]), int(period[-2:] if granularity == 'month' else period[-1])
+    if number == (12 if granularity == 'month' else 4):
+        year, number = year + 1, 1
+    else:
+        number += 1
+    return f"{year:04d}-{number:02d}" if granularity == 'month' else f"{year:04d}-Q{number}"
+
+
+def _month_end(day: date) -> date:
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _quarter_end(day: date) -> date:
+    last_month = (day.month - 1) // 3 * 3 + 3
+    return date(day.year, last_month, calendar.monthrange(day.year, last_month)[1])
+
+
+class TimeRollup:
+    """按日/月/季度和费用类型预先汇总的费用合计"""
+
+    def __init__(self):
+        self.count = 0
+        # 粒度 -> {周期: {费用类型代码: [记录数, 金额合计]}}
+        self.buckets = {granularity: {} for granularity in GRANULARITIES}
+
+    # ===== 增量维护 =====
+
+    def _apply(self, value, expense_type, amount, sign: int):
+        for granularity, period in zip(GRANULARITIES, _periods(value)):
+            by_type = self.buckets[granularity].setdefault(period, {})
+            bucket = by_type.setdefault(expense_type, [0, 0])
+            bucket[0] += sign
+            bucket[1] += sign * amount
+            if bucket[0] <= 0:
+                del by_type[expense_type]
+                if not by_type:
+                    del self.buckets[granularity][period]
+
+    def add(self, expense: Dict[str, Any]):
+        """计入一条费用记录"""
+        self.count += 1
+        self._apply(expense_date(expense), expense.get('expense_type', 'other'),
+                    expense.get('total_amount', 0), 1)
+
+    def remove(self, expense: Dict[str, Any]):
+        """移除一条费用记录"""
+        self.count -= 1
+        self._apply(expense_date(expense), expense.get('expense_type', 'other'),
+                    expense.get('total_amount', 0), -1)
+
+    def add_bucket(self, value, expense_type: str, count: int, total):
+        """计入同一天、同一类型的一组记录（用于从已分组的结果中构建）"""
+        for granularity, period in zip(GRANULARITIES, _periods(value)):
+            bucket = self.buckets[granularity].setdefault(period, {}).setdefault(expense_type, [0, 0])
+            bucket[0] += count
+            bucket[1] += total
+
+    def rebuild(self, expenses: Iterable[Dict[str, Any]]):
+        """从费用记录重新计算全部汇总"""
+        self.__init__()
+        if not isinstance(expenses, ExpenseStore):
+            for expense in expenses:
+                self.add(expense)
+            return
+
+        # 列式存储只取日期、类型和金额三列，不需要组装整行
+        dates = expenses.column('date')
+        if None in dates:
+            dates = [value if value is not None else legacy
+                     for value, legacy in zip(dates, expenses.column('expense_date'))]
+        types = expenses.column('expense_type')
+        amounts = expenses.column('total_amount')
+        for value, expense_type, amount in zip(dates, types, amounts):
+            self.count += 1
+            self._apply(value, expense_type if expense_type is not None else 'other', amount or 0, 1)
+
+    # ===== 查询 =====
+
+    def _bucket_total(self, granularity: str, period: str, expense_type: Optional[str]) -> Tuple[int, float]:
+        by_type = self.buckets[granularity].get(period)
+        if not by_type:
+            return 0, 0
+        if expense_type is not None:
+            count, total = by_type.get(expense_type, (0, 0))
+            return count, total
+        return sum(bucket[0] for bucket in by_type.values()), sum(bucket[1] for bucket in by_type.values())
+
+    def period_total(self, granularity: str, period: str, expense_type: Optional[str] = None) -> Dict[str, Any]:
+        """单个周期的合计，如 ('quarter', '2026-Q2', 'labor')"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"不支持的时间粒度: {granularity}")
+        count, total = self._bucket_total(granularity, period, expense_type)
+        return {'period': period, 'count': count, 'total_amount': total}
+
+    def range_total(self, start_date: str, end_date: str, expense_type: Optional[str] = None) -> Dict[str, Any]:
+        """日期区间 [start_date, end_date] 内的合计
+
+        区间按 完整季度 > 完整月份 > 单日 拆分，只读取对应的汇总桶，耗时与区间跨度有关、与记录数无关。
+        """
+        start = date.fromisoformat(day_of(start_date) or start_date)
+        end = date.fromisoformat(day_of(end_date) or end_date)
+
+        count, total = 0, 0
+        day = start
+        while day <= end:
+            if day.day == 1 and day.month % 3 == 1 and _quarter_end(day) <= end:
+                granularity, period, next_day = 'quarter', quarter_of(day.isoformat()), _quarter_end(day)
+            elif day.day == 1 and _month_end(day) <= end:
+                granularity, period, next_day = 'month', day.isoformat()[:7], _month_end(day)
+            else:
+                granularity, period, next_day = 'day', day.isoformat(), day
+            bucket_count, bucket_total = self._bucket_total(granularity, period, expense_type)
+            count += bucket_count
+            total += bucket_total
+            day = next_day + timedelta(days=1)
+
+        return {'start': start.isoformat(), 'end': end.isoformat(), 'count': count, 'total_amount': total}
+
+    def series(self, granularity: str = 'month', start: Optional[str] = None, end: Optional[str] = None,
+               expense_type: Optional[str] = None, fill_gaps: bool = False) -> List[Dict[str, Any]]:
+        """按周期排列的合计序列（不含无日期的记录）
+
+        start/end 为同一粒度的周期键（如 '2026-01'、'2026-Q1'），包含两端；
+        fill_gaps=True 时在第一个和最后一个周期之间补上没有记录的周期（合计为0）。
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"不支持的时间粒度: {granularity}")
+
+        result = []
+        for period in sorted(self.buckets[granularity]):
+            if period == UNDATED or (start and period < start) or (end and period > end):
+                continue
+            count, total = self._bucket_total(granularity, period, expense_type)
+            if count:
+                result.append({'period': period, 'count': count, 'total_amount': total})
+
+        if fill_gaps and result:
+            filled = []
+            present = {item['period']: item for item in result}
+            period = result[0]['period']
+            while period <= result[-1]['period']:
+                filled.append(present.get(period, {'period': period, 'count': 0, 'total_amount': 0}))
+                period = _next_period(granularity, period)
+            result = filled
+        return result
+
+    def undated_total(self) -> Dict[str, Any]:
+        """没有日期的记录合计"""
+        count, total = self._bucket_total('day', UNDATED, None)
+        return {'count': count, 'total_amount': total}
+
+    def copy(self) -> 'TimeRollup':
+        """复制一份（只复制汇总桶，与记录数无关）"""
+        rollup = TimeRollup()
+        rollup.count = self.count
+        rollup.buckets = {granularity: {period: {expense_type: bucket[:] for expense_type, bucket in by_type.items()}
+                                        for period, by_type in periods.items()}
+                          for granularity, periods in self.buckets.items()}
+        return rollup
+
+    # ===== 持久化 =====
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可写入项目文件的结构（只保存按日汇总，月和季度在读取时合并得到）"""
+        return {
+            'version': ROLLUP_VERSION,
+            'count': self.count,
+            'day': [[period, expense_type, count, total]
+                    for period, by_type in self.buckets['day'].items()
+                    for expense_type, (count, total) in by_type.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional['TimeRollup']:
+        """从项目文件中读取汇总结果，格式不符时返回None"""
+        if not isinstance(data, dict) or data.get('version') != ROLLUP_VERSION:
+            return None
+
+        try:
+            rollup = cls()
+            for period, expense_type, count, total in data.get('day', []):
+                rollup.add_bucket(period, expense_type, count, total)
+            rollup.count = data['count']
+            return rollup
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+def burn_rate(series: List[Dict[str, Any]], window: int = 3) -> List[Dict[str, Any]]:
+    """在合计序列上计算累计支出和最近 window 个周期的平均支出（消耗速率）"""
+    result = []
+    cumulative = 0
+    for i, item in enumerate(series):
+        cumulative += item['total_amount']
+        recent = series[max(0, i - window + 1):i + 1]
+        result.append(dict(item, cumulative=cumulative,
+                           burn_rate=sum(r['total_amount'] for r in recent) / len(recent)))
+    return result
@@ -9,6 +9,7 @@ from tkinter import ttk, messagebox, filedialog
 import sys
 import os
 import json
+import queue
 from datetime import datetime
 
 # 为Windows终端设置UTF-8编码
@@ -21,7 +22,15 @@ if sys.platform == 'win32':
 # 导入新架构模块
 from modules.file_manager import get_file_manager
 from modules.expense_calculator import get_calculator
-from modules.config import EXPENSE_TYPES
+from modules.config import EXPENSE_TYPES, EXPENSE_TABLE_BUFFER_ROWS, WATCH_PROJECTS_DIR
+from modules.io_executor import IOExecutor
+from modules.export_manager import ExportManager
+from modules.expense_importer import ExpenseImporter
+from modules.project_format import is_binary_project_file, read_project_header
+from modules.time_rollup import day_of
+
+# 主线程检查项目目录外部修改的间隔（毫秒）
+EXTERNAL_CHANGE_POLL_MS = 500
 
 class ProjectExpenseTrackerGUI:
     """新版GUI主类 - 三段式设计"""
@@ -48,9 +57,22 @@ class ProjectExpenseTrackerGUI:
         # 创建三段式布局
         self.create_three_section_layout()
         
-        # 加载初始数据
+        # 文件读写放到后台线程执行，结果回到主线程更新界面
+        self.io = IOExecutor(self.root, self.status_var)
+        
+        # 先显示上次的项目列表快照，再在后台检查项目文件，只更新有变化的行
+        self._project_rows = {}  # 表格行ID -> 显示的值
+        self._show_projects_list(self.file_manager.get_cached_projects(), cached=True)
         self.load_projects_list()
         
+        # 监视项目目录，其他程序修改项目时自动更新（结果从监视线程经队列回到主线程）
+        self._external_changes = queue.Queue()
+        if WATCH_PROJECTS_DIR and self.file_manager.start_watching(self._external_changes.put):
+            self.root.after(EXTERNAL_CHANGE_POLL_MS, self._check_external_changes)
+        
+        # 快捷键
+        self.root.bind('<Control-s>', lambda e: self.save_current_project())
+        
         # 绑定窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
@@ -88,6 +110,7 @@ class ProjectExpenseTrackerGUI:
         menubar.add_cascade(label="文件", menu=file_menu)
         file_menu.add_command(label="导入项目", command=self.import_project)
         file_menu.add_command(label="导出项目", command=self.export_project)
+        file_menu.add_command(label="保存项目", command=self.save_current_project, accelerator="Ctrl+S")
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.on_closing)
         
@@ -95,6 +118,7 @@ class ProjectExpenseTrackerGUI:
         data_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="数据", menu=data_menu)
         data_menu.add_command(label="自定义数据类型", command=self.manage_custom_types)
+        data_menu.add_command(label="组合统计（全部项目）", command=self.show_portfolio_statistics)
         data_menu.add_command(label="刷新数据", command=self.refresh_current_page)
         
         # 公式菜单
@@ -180,6 +204,7 @@ class ProjectExpenseTrackerGUI:
         ttk.Button(button_frame, text="刷新列表", command=self.load_projects_list).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="删除项目", command=self.delete_selected_project).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="重命名项目", command=self.rename_selected_project).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="组合统计", command=self.show_portfolio_statistics).pack(side=tk.LEFT, padx=5)
         
         # 项目列表表格
         list_frame = ttk.LabelFrame(main_frame, text="项目列表", padding="10")
@@ -240,23 +265,9 @@ class ProjectExpenseTrackerGUI:
         table_frame = ttk.Frame(main_frame)
         table_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # 创建树状视图
-        columns = ('ID', '日期', '类型', '名称', '数量', '单价', '总金额', '备注')
-        self.expenses_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15)
-        
-        # 定义列
-        column_widths = [50, 100, 80, 150, 60, 80, 100, 200]
-        for col, width in zip(columns, column_widths):
-            self.expenses_tree.heading(col, text=col)
-            self.expenses_tree.column(col, width=width, minwidth=50)
-        
-        # 添加滚动条
-        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.expenses_tree.yview)
-        self.expenses_tree.configure(yscrollcommand=scrollbar.set)
-        
-        # 布局
-        self.expenses_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        # 创建虚拟滚动表格（只为可见行创建条目，大项目也能快速显示）
+        self.expense_table = VirtualExpenseTable(table_frame, self.file_manager)
+        self.expenses_tree = self.expense_table.tree
         
         # 配置网格权重
         table_frame.columnconfigure(0, weight=1)
@@ -286,6 +297,10 @@ class ProjectExpenseTrackerGUI:
                       command=self.delete_selected_expense).pack(side=tk.LEFT, padx=2)
             ttk.Button(self.dynamic_button_frame, text="查看统计", 
                       command=self.show_statistics).pack(side=tk.LEFT, padx=2)
+            ttk.Button(self.dynamic_button_frame, text="费用趋势", 
+                      command=self.show_expense_trend).pack(side=tk.LEFT, padx=2)
+            ttk.Button(self.dynamic_button_frame, text="导入费用", 
+                      command=self.import_expenses).pack(side=tk.LEFT, padx=2)
             ttk.Button(self.dynamic_button_frame, text="导出数据", 
                       command=self.export_data).pack(side=tk.LEFT, padx=2)
     
@@ -303,15 +318,50 @@ class ProjectExpenseTrackerGUI:
             self.update_dynamic_buttons()
             self.update_stats_display()
     
+    def _on_io_error(self, title):
+        """生成后台任务失败时的回调"""
+        def handler(error):
+            messagebox.showerror("错误", f"{title}: {str(error)}")
+            self.status_var.set(title)
+        return handler
+    
     def load_projects_list(self):
-        """加载项目列表到表格"""
-        # 清空现有数据
-        for item in self.projects_tree.get_children():
-            self.projects_tree.delete(item)
+        """加载项目列表到表格（后台读取，只重新解析有变化的项目文件）"""
+        self.io.submit(self.file_manager.get_all_projects, description="正在检查项目文件",
+                       on_success=self._show_projects_list,
+                       on_error=self._on_io_error("加载项目列表失败"))
+    
+    def _check_external_changes(self):
+        """处理其他程序对项目文件的修改（主线程定时检查）"""
+        results = []
+        while True:
+            try:
+                results.append(self._external_changes.get_nowait())
+            except queue.Empty:
+                break
         
+        if results:
+            if any(result['catalog_changed'] for result in results):
+                # 项目索引已经只更新了变化的文件，直接按索引修补表格
+                self._show_projects_list(self.file_manager.get_cached_projects())
+            if any(result['current_reloaded'] for result in results) and self.current_project:
+                if self.current_page == "expense_list":
+                    self.load_expenses()
+                self.status_var.set(f"项目 '{self.current_project}' 已合并其他程序的修改")
+            elif any(result['current_conflict'] for result in results):
+                self.status_var.set(f"项目 '{self.current_project}' 的文件已被其他程序删除，"
+                                    f"保存时将用当前数据重新写入")
+        
+        self.root.after(EXTERNAL_CHANGE_POLL_MS, self._check_external_changes)
+    
+    def _show_projects_list(self, projects, cached=False):
+        """显示读取到的项目列表
+        
+        表格行按项目文件名标识，只更新有变化的行，新增、删除的项目插入或移除对应的行，
+        已选中的行保持选中。cached=True 表示显示的是启动时的快照，随后还会校验。
+        """
         try:
-            projects = self.file_manager.get_all_projects()
-            
+            rows = []
             for project in projects:
                 values = (
                     project['name'],
@@ -321,9 +371,29 @@ class ProjectExpenseTrackerGUI:
                     f"{project['total_amount']:.2f}",
                     project['description']
                 )
-                self.projects_tree.insert('', tk.END, values=values, tags=(project['name'],))
-            
-            self.status_var.set(f"已加载 {len(projects)} 个项目")
+                rows.append((project.get('file_name') or project['name'], values))
+            
+            keys = {key for key, _ in rows}
+            for item in self.projects_tree.get_children():
+                if item not in keys:
+                    self.projects_tree.delete(item)
+            
+            changed = 0
+            for index, (key, values) in enumerate(rows):
+                if not self.projects_tree.exists(key):
+                    self.projects_tree.insert('', index, iid=key, values=values, tags=(values[0],))
+                    changed += 1
+                else:
+                    if self._project_rows.get(key) != values:
+                        self.projects_tree.item(key, values=values, tags=(values[0],))
+                        changed += 1
+                    self.projects_tree.move(key, '', index)
+            self._project_rows = dict(rows)
+            
+            if cached:
+                self.status_var.set(f"已显示上次的 {len(rows)} 个项目，正在检查项目文件...")
+            else:
+                self.status_var.set(f"已加载 {len(rows)} 个项目（{changed} 个有变化）")
             
         except Exception as e:
             messagebox.showerror("错误", f"加载项目列表失败: {str(e)}")
@@ -333,7 +403,7 @@ class ProjectExpenseTrackerGUI:
     
     def create_new_project(self):
         """创建新项目"""
-        dialog = CreateProjectDialog(self.root, self.file_manager)
+        dialog = CreateProjectDialog(self.root, self.file_manager, self.io)
         self.root.wait_window(dialog.dialog)
         
         # 如果创建成功，刷新列表
@@ -354,15 +424,16 @@ class ProjectExpenseTrackerGUI:
         if not messagebox.askyesno("确认删除", f"确定要删除项目 '{project_name}' 吗？\n\n此操作无法撤销！"):
             return
         
-        try:
-            if self.file_manager.delete_project(project_name):
+        def on_deleted(success):
+            if success:
                 self.load_projects_list()
                 messagebox.showinfo("成功", f"项目 '{project_name}' 删除成功")
             else:
+                self.status_var.set("删除项目失败")
                 messagebox.showerror("错误", "删除项目失败")
         
-        except Exception as e:
-            messagebox.showerror("错误", f"删除项目失败: {str(e)}")
+        self.io.submit(self.file_manager.delete_project, project_name, description=f"正在删除项目 {project_name}",
+                       on_success=on_deleted, on_error=self._on_io_error("删除项目失败"))
     
     def rename_selected_project(self):
         """重命名选中的项目"""
@@ -379,15 +450,16 @@ class ProjectExpenseTrackerGUI:
         if not new_name or new_name == old_name:
             return
         
-        try:
-            if self.file_manager.rename_project(old_name, new_name):
+        def on_renamed(success):
+            if success:
                 self.load_projects_list()
                 messagebox.showinfo("成功", f"项目重命名成功: {old_name} -> {new_name}")
             else:
+                self.status_var.set("重命名项目失败")
                 messagebox.showerror("错误", "重命名项目失败")
         
-        except Exception as e:
-            messagebox.showerror("错误", f"重命名项目失败: {str(e)}")
+        self.io.submit(self.file_manager.rename_project, old_name, new_name, description=f"正在重命名项目 {old_name}",
+                       on_success=on_renamed, on_error=self._on_io_error("重命名项目失败"))
     
     def on_project_double_click(self, event):
         """双击项目时打开项目"""
@@ -397,10 +469,14 @@ class ProjectExpenseTrackerGUI:
             self.open_project(project_name)
     
     def open_project(self, project_name):
-        """打开项目并切换到费用管理页面"""
+        """打开项目（后台读取），完成后切换到费用管理页面"""
+        self.io.submit(self.file_manager.open_project, project_name, description=f"正在打开项目 {project_name}",
+                       on_success=lambda project_data: self._on_project_opened(project_name, project_data),
+                       on_error=self._on_io_error("打开项目失败"))
+    
+    def _on_project_opened(self, project_name, project_data):
+        """项目打开后切换到费用管理页面"""
         try:
-            # 打开项目
-            project_data = self.file_manager.open_project(project_name)
             if not project_data:
                 raise ValueError("打开项目失败")
             
@@ -413,7 +489,8 @@ class ProjectExpenseTrackerGUI:
             self.notebook.tab(1, state='normal')  # 启用费用管理选项卡
             self.notebook.select(1)  # 切换到费用管理
             
-            # 加载费用记录
+            # 加载费用记录（从第一行开始显示）
+            self.expense_table.clear()
             self.load_expenses()
             
             # 更新状态
@@ -424,40 +501,25 @@ class ProjectExpenseTrackerGUI:
     
     def back_to_projects(self):
         """返回到项目管理页面"""
-        # 关闭当前项目
-        if self.current_project:
-            self.file_manager.close_project()
-            self.current_project = None
+        closing = self.current_project is not None
+        self.current_project = None
+        self.expense_table.clear()
         
         # 切换到项目管理页面
         self.notebook.select(0)
         self.project_name_var.set("未选择项目")
         self.status_var.set("已返回项目管理")
+        
+        # 关闭当前项目（后台保存）
+        if closing:
+            self.io.submit(self.file_manager.close_project, description="正在保存并关闭项目",
+                           on_success=lambda result: self.status_var.set("已返回项目管理"),
+                           on_error=self._on_io_error("关闭项目失败"))
     
     def load_expenses(self):
-        """加载费用记录到表格"""
-        # 清空现有数据
-        for item in self.expenses_tree.get_children():
-            self.expenses_tree.delete(item)
-        
+        """加载费用记录到表格（只取可见区域的数据）"""
         try:
-            expenses = self.file_manager.get_all_expenses()
-            
-            for expense in expenses:
-                expense_type = EXPENSE_TYPES.get(expense.get('expense_type', 'other'), 
-                                               expense.get('expense_type', '其他费用'))
-                
-                values = (
-                    expense['id'],
-                    expense.get('date', expense.get('expense_date', '')),
-                    expense_type,
-                    expense['name'],
-                    expense.get('quantity', '') or '-',
-                    expense.get('unit_price', '') or '-',
-                    f"{expense['total_amount']:.2f}",
-                    expense.get('notes', '') or ''
-                )
-                self.expenses_tree.insert('', tk.END, values=values, tags=(expense['id'],))
+            self.expense_table.reload()
             
             # 更新统计显示
             self.update_stats_display()
@@ -490,7 +552,7 @@ class ProjectExpenseTrackerGUI:
             messagebox.showwarning("提示", "请先打开一个项目")
             return
         
-        dialog = AddExpenseDialog(self.root, self.file_manager, self.calculator)
+        dialog = AddExpenseDialog(self.root, self.file_manager, self.calculator, self.io)
         self.root.wait_window(dialog.dialog)
         
         # 如果添加成功，刷新数据
@@ -504,28 +566,28 @@ class ProjectExpenseTrackerGUI:
             messagebox.showwarning("提示", "请先打开一个项目")
             return
         
-        selected_items = self.expenses_tree.selection()
-        if not selected_items:
+        selected_ids = self.expense_table.get_selected_ids()
+        if not selected_ids:
             messagebox.showwarning("提示", "请先选择要删除的费用记录")
             return
         
         # 确认删除
-        if not messagebox.askyesno("确认删除", f"确定要删除选中的 {len(selected_items)} 条费用记录吗？"):
+        if not messagebox.askyesno("确认删除", f"确定要删除选中的 {len(selected_ids)} 条费用记录吗？"):
             return
         
-        try:
-            success_count = 0
-            for item in selected_items:
-                expense_id = self.expenses_tree.item(item)['values'][0]  # 第一列是ID
-                if self.file_manager.delete_expense(expense_id):
-                    success_count += 1
+        def delete_expenses():
+            return sum(1 for expense_id in selected_ids if self.file_manager.delete_expense(expense_id))
+        
+        def on_deleted(success_count):
+            self.expense_table.selected_ids = set()
             
             # 刷新数据
             self.load_expenses()
+            self.status_var.set(f"已删除 {success_count} 条费用记录")
             messagebox.showinfo("成功", f"已成功删除 {success_count} 条费用记录")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"删除费用记录失败: {str(e)}")
+        
+        self.io.submit(delete_expenses, description=f"正在删除 {len(selected_ids)} 条费用记录",
+                       on_success=on_deleted, on_error=self._on_io_error("删除费用记录失败"))
     
     def on_expense_double_click(self, event):
         """双击费用记录时查看详情"""
@@ -538,9 +600,14 @@ class ProjectExpenseTrackerGUI:
             self.view_expense_details(expense_id)
     
     def view_expense_details(self, expense_id):
-        """查看费用记录详情"""
+        """查看费用记录详情（后台查找，延迟加载的项目第一次查找需要读入全部记录）"""
+        self.io.submit(self.file_manager.get_expense_by_id, expense_id, description="正在读取费用记录",
+                       on_success=lambda expense: self._show_expense_details(expense_id, expense),
+                       on_error=self._on_io_error("查看详情失败"))
+    
+    def _show_expense_details(self, expense_id, expense):
+        """显示费用记录详情"""
         try:
-            expense = self.file_manager.get_expense_by_id(expense_id)
             if not expense:
                 messagebox.showwarning("提示", "找不到该费用记录")
                 return
@@ -589,6 +656,9 @@ class ProjectExpenseTrackerGUI:
             stats_text += f"  总记录数: {overall.get('total_count', 0)}\n"
             stats_text += f"  总费用: {overall.get('grand_total', 0):.2f}\n"
             stats_text += f"  平均费用: {overall.get('avg_amount', 0):.2f}\n"
+            if overall.get('total_count', 0):
+                stats_text += f"  最高费用: {overall.get('max_amount', 0):.2f}\n"
+                stats_text += f"  最低费用: {overall.get('min_amount', 0):.2f}\n"
             stats_text += "\n"
             
             if stats['by_type']:
@@ -610,13 +680,37 @@ class ProjectExpenseTrackerGUI:
         except Exception as e:
             messagebox.showerror("错误", f"获取统计信息失败: {str(e)}")
     
+    def show_expense_trend(self):
+        """显示按日/月/季度汇总的费用趋势和消耗速率"""
+        if not self.current_project:
+            messagebox.showwarning("提示", "请先打开一个项目")
+            return
+        
+        ExpenseTrendDialog(self.root, self.file_manager, self.current_project)
+    
+    def show_portfolio_statistics(self):
+        """显示全部项目的组合统计（后台汇总）"""
+        def on_collected(stats):
+            if not stats or 'overall' not in stats:
+                messagebox.showerror("错误", "汇总全部项目失败")
+                self.status_var.set("汇总全部项目失败")
+                return
+            scan = stats.get('scan', {})
+            self.status_var.set(f"已汇总 {stats['overall']['project_count']} 个项目"
+                                f"（读取 {scan.get('parsed', 0)} 个文件，{scan.get('seconds', 0) * 1000:.0f} ms）")
+            PortfolioDialog(self.root, stats)
+        
+        self.io.submit(self.file_manager.get_portfolio_statistics, description="正在汇总全部项目",
+                       on_success=on_collected, on_error=self._on_io_error("汇总全部项目失败"))
+    
     def import_project(self):
         """导入项目"""
         try:
             # 打开文件选择对话框
             file_path = filedialog.askopenfilename(
                 title="选择项目文件",
-                filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")],
+                filetypes=[("项目文件", "*.json *.ptpj"), ("JSON文件", "*.json"),
+                           ("二进制项目文件", "*.ptpj"), ("所有文件", "*.*")],
                 initialdir=os.path.abspath(".")
             )
             
@@ -625,14 +719,17 @@ class ProjectExpenseTrackerGUI:
             
             # 检查是否为目标目录下的项目文件
             filename = os.path.basename(file_path)
-            if not filename.endswith(".json"):
-                if not messagebox.askyesno("确认", "选择的文件不是JSON格式，是否继续导入？"):
+            if not filename.endswith((".json", ".ptpj")):
+                if not messagebox.askyesno("确认", "选择的文件不是项目文件格式，是否继续导入？"):
                     return
             
             # 获取项目名称（从文件名或文件内容中读取）
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    import_data = json.load(f)
+                if is_binary_project_file(file_path):
+                    import_data = read_project_header(file_path)
+                else:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        import_data = json.load(f)
                 
                 project_name = import_data.get('project_info', {}).get('name')
                 if not project_name:
@@ -642,6 +739,7 @@ class ProjectExpenseTrackerGUI:
                 project_name = os.path.splitext(filename)[0]
             
             # 检查是否已存在同名项目
+            overwrite = False
             if self.file_manager.project_exists(project_name):
                 choice = messagebox.askyesnocancel("项目已存在", 
                     f"项目 '{project_name}' 已存在。请选择：\n"
@@ -652,8 +750,8 @@ class ProjectExpenseTrackerGUI:
                 if choice is None:  # 取消
                     return
                 elif choice:  # 是 - 覆盖
-                    # 删除现有项目
-                    self.file_manager.delete_project(project_name)
+                    # 由导入直接覆盖现有项目，导入失败时现有项目保持不变
+                    overwrite = True
                 else:  # 否 - 重命名
                     new_name = tk.simpledialog.askstring("重命名项目", 
                         f"请输入新项目名称:", initialvalue=f"{project_name}_导入")
@@ -661,13 +759,21 @@ class ProjectExpenseTrackerGUI:
                         return
                     project_name = new_name
             
-            # 执行导入
-            if self.file_manager.import_project(file_path):
-                self.load_projects_list()
-                self.status_var.set(f"导入项目成功: {project_name}")
-                messagebox.showinfo("成功", f"项目 '{project_name}' 导入成功！")
-            else:
-                messagebox.showerror("错误", "导入项目失败")
+            # 执行导入（后台）
+            def do_import():
+                return self.file_manager.import_project(file_path, overwrite=overwrite)
+            
+            def on_imported(success):
+                if success:
+                    self.load_projects_list()
+                    self.status_var.set(f"导入项目成功: {project_name}")
+                    messagebox.showinfo("成功", f"项目 '{project_name}' 导入成功！")
+                else:
+                    self.status_var.set("导入项目失败")
+                    messagebox.showerror("错误", "导入项目失败")
+            
+            self.io.submit(do_import, description=f"正在导入项目 {project_name}",
+                           on_success=on_imported, on_error=self._on_io_error("导入项目失败"))
         
         except Exception as e:
             messagebox.showerror("错误", f"导入项目失败: {str(e)}")
@@ -699,24 +805,126 @@ class ProjectExpenseTrackerGUI:
             if not file_path:
                 return
             
-            # 执行导出
-            if self.file_manager.export_project(project_name, file_path):
-                self.status_var.set(f"导出项目成功: {project_name}")
-                messagebox.showinfo("成功", f"项目 '{project_name}' 导出成功！\n保存到: {file_path}")
-            else:
-                messagebox.showerror("错误", "导出项目失败")
+            # 执行导出（后台）
+            def on_exported(success):
+                if success:
+                    self.status_var.set(f"导出项目成功: {project_name}")
+                    messagebox.showinfo("成功", f"项目 '{project_name}' 导出成功！\n保存到: {file_path}")
+                else:
+                    self.status_var.set("导出项目失败")
+                    messagebox.showerror("错误", "导出项目失败")
+            
+            self.io.submit(self.file_manager.export_project, project_name, file_path,
+                           description=f"正在导出项目 {project_name}",
+                           on_success=on_exported, on_error=self._on_io_error("导出项目失败"))
         
         except Exception as e:
             messagebox.showerror("错误", f"导出项目失败: {str(e)}")
     
+    def save_current_project(self):
+        """立即保存当前项目（默认修改会延迟合并保存）"""
+        if not self.current_project:
+            return
+        
+        def on_saved(success):
+            if not success:
+                self.status_var.set("保存项目失败")
+                return
+            write_stats = self.file_manager.get_write_stats() if hasattr(self.file_manager, 'get_write_stats') else {}
+            if write_stats.get('count'):
+                self.status_var.set(f"项目已保存（最近写入 {write_stats['last_ms']:.1f} ms，"
+                                    f"平均 {write_stats['avg_ms']:.1f} ms）")
+            else:
+                self.status_var.set("项目已保存")
+        
+        self.io.submit(self.file_manager.flush, description="正在保存项目",
+                       on_success=on_saved, on_error=self._on_io_error("保存项目失败"))
+    
     def export_data(self):
         """导出数据"""
         if not self.current_project:
             messagebox.showwarning("提示", "请先打开一个项目")
             return
         
-        # TODO: 实现导出数据功能
-        messagebox.showinfo("提示", "导出数据功能将在后续版本中实现")
+        file_path = filedialog.asksaveasfilename(
+            title="导出费用记录",
+            defaultextension=".xlsx",
+            filetypes=[("Excel文件", "*.xlsx"), ("CSV文件", "*.csv"), ("所有文件", "*.*")],
+            initialfile=f"{self.current_project}_费用记录.xlsx",
+            initialdir=os.path.abspath(".")
+        )
+        
+        if not file_path:
+            return
+        
+        # 按扩展名选择格式，CSV同时生成统计摘要文件
+        export_manager = ExportManager(self.file_manager)
+        is_csv = file_path.lower().endswith('.csv')
+        export = export_manager.export_to_csv if is_csv else export_manager.export_to_excel
+        
+        def on_exported(result):
+            filepath, success = result
+            if success:
+                self.status_var.set(f"导出费用记录成功: {filepath}")
+                message = f"费用记录导出成功！\n保存到: {filepath}"
+                if is_csv:
+                    message += f"\n统计摘要: {os.path.splitext(filepath)[0]}_stats.txt"
+                messagebox.showinfo("成功", message)
+            else:
+                self.status_var.set("导出费用记录失败")
+                messagebox.showerror("错误", "导出费用记录失败（导出Excel需要安装openpyxl）")
+        
+        def on_progress(done, total):
+            self.io.report_progress(f"正在导出费用记录... {done}/{total} ({done * 100 // max(total, 1)}%)")
+        
+        # 执行导出（后台，按块写入）
+        self.io.submit(export, file_path, progress=on_progress,
+                       description="正在导出费用记录",
+                       on_success=on_exported, on_error=self._on_io_error("导出费用记录失败"))
+    
+    def import_expenses(self):
+        """从CSV或Excel文件批量导入费用记录"""
+        if not self.current_project:
+            messagebox.showwarning("提示", "请先打开一个项目")
+            return
+        
+        file_path = filedialog.askopenfilename(
+            title="导入费用记录",
+            filetypes=[("Excel或CSV文件", "*.xlsx *.csv"), ("所有文件", "*.*")],
+            initialdir=os.path.abspath(".")
+        )
+        
+        if not file_path:
+            return
+        
+        importer = ExpenseImporter(self.file_manager)
+        
+        def on_imported(result):
+            if result is None:
+                self.status_var.set("导入费用记录失败")
+                messagebox.showerror("错误", "导入费用记录失败（导入Excel需要安装openpyxl）")
+                return
+            
+            self.status_var.set(f"已导入 {result['added']} 条费用记录"
+                                f"（{result['rows_per_second']:.0f} 行/秒）")
+            message = (f"导入 {result['added']}/{result['rows']} 条费用记录，"
+                       f"耗时 {result['seconds']:.1f} 秒（{result['rows_per_second']:.0f} 行/秒）")
+            if result['errors']:
+                lines = [f"第{number}条: {reason}" for number, reason in result['errors'][:10]]
+                if len(result['errors']) > 10:
+                    lines.append(f"... 共 {len(result['errors'])} 条")
+                message += "\n\n以下记录有错误，未导入:\n" + "\n".join(lines)
+            messagebox.showinfo("导入完成", message)
+            if self.current_page == "expense_list":
+                self.load_expenses()
+        
+        def on_progress(rows):
+            self.io.report_progress(f"正在导入费用记录... 已读取 {rows} 行")
+        
+        # 执行导入（后台，分批校验后一次保存）
+        self.io.submit(importer.import_file, file_path, progress=on_progress,
+                       description="正在导入费用记录",
+                       on_success=on_imported, on_error=self._on_io_error("导入费用记录失败"))
     
     def manage_custom_types(self):
         """管理自定义数据类型"""
@@ -724,7 +932,7 @@ class ProjectExpenseTrackerGUI:
             messagebox.showwarning("提示", "请先打开一个项目")
             return
         
-        dialog = CustomTypeManagementDialog(self.root, self.file_manager)
+        dialog = CustomTypeManagementDialog(self.root, self.file_manager, self.io)
         self.root.wait_window(dialog.dialog)
         
         # 如果管理成功，可能需要刷新相关数据
@@ -741,23 +949,20 @@ class ProjectExpenseTrackerGUI:
             messagebox.showwarning("提示", "请先打开一个项目")
             return
         
-        dialog = FormulaManagementDialog(self.root, self.file_manager)
+        dialog = FormulaManagementDialog(self.root, self.file_manager, self.io)
         self.root.wait_window(dialog.dialog)
         
         # 如果管理成功，可能需要刷新相关数据
         if dialog.result:
             self.status_var.set("计算公式已更新")
-            # 刷新公式选择（如果需要）
+            # 公式修改后相关费用记录的金额可能已重新计算
             if self.current_page == "expense_list":
-                # 重新加载费用记录对话框中的公式列表
-                # 这里可以提示用户重新打开添加费用对话框
-                pass
+                self.load_expenses()
     
     def refresh_current_page(self):
         """刷新当前页面"""
         if self.current_page == "projects":
             self.load_projects_list()
-            self.status_var.set("项目列表已刷新")
         elif self.current_page == "expense_list" and self.current_project:
             self.load_expenses()
             self.status_var.set("费用记录已刷新")
@@ -786,19 +991,296 @@ class ProjectExpenseTrackerGUI:
     def on_closing(self):
         """关闭窗口时的处理"""
         try:
+            # 等待后台任务写完，再保存并关闭当前项目
+            self.file_manager.stop_watching()
+            self.io.run_pending()
             if self.current_project:
                 self.file_manager.close_project()
+            self.io.shutdown()
         except:
             pass
         self.root.destroy()
 
+# ===== 表格组件 =====
+
+class VirtualExpenseTable:
+    """虚拟滚动的费用记录表格
+    
+    Treeview中只保留可见的几行，滚动时从存储后端按页取数据并复用这些行，
+    上下各多取一段缓冲行，小幅滚动不需要重新取数。
+    """
+    
+    COLUMNS = ('ID', '日期', '类型', '名称', '数量', '单价', '总金额', '备注')
+    COLUMN_WIDTHS = [50, 100, 80, 150, 60, 80, 100, 200]
+    SORT_FIELDS = ('id', 'date', 'expense_type', 'name', 'quantity', 'unit_price', 'total_amount', 'notes')
+    
+    def __init__(self, parent, file_manager, buffer_rows=EXPENSE_TABLE_BUFFER_ROWS):
+        self.file_manager = file_manager
+        self.buffer_rows = buffer_rows
+        
+        self.total = 0             # 记录总数
+        self.offset = 0            # 第一行可见记录的位置
+        self.visible_rows = 15     # 可见行数（根据控件高度调整）
+        self.sort_by = None        # 排序字段，None表示按添加顺序
+        self.descending = False
+        self.selected_ids = set()  # 选中的费用记录ID（滚动出可见区域后仍保留）
+        
+        self._page_start = 0       # 已取数据的起始位置
+        self._page_rows = []       # 已取的数据（可见区域 + 缓冲）
+        self._rendering = False
+        self._extend_selection = False
+        
+        # 表格
+        self.tree = ttk.Treeview(parent, columns=self.COLUMNS, show='headings', height=self.visible_rows)
+        for col, field, width in zip(self.COLUMNS, self.SORT_FIELDS, self.COLUMN_WIDTHS):
+            self.tree.heading(col, text=col, command=lambda f=field: self.sort(f))
+            self.tree.column(col, width=width, minwidth=50)
+        
+        # 滚动条由表格自己驱动，而不是Treeview的yview
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+        
+        # 记录数显示
+        self.count_var = tk.StringVar(value="共 0 条记录")
+        self.count_label = ttk.Label(parent, textvariable=self.count_var)
+        
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.count_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        # 滚轮、键盘和尺寸变化
+        self.tree.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.tree.bind('<Up>', lambda e: self.on_arrow_key(-1))
+        self.tree.bind('<Down>', lambda e: self.on_arrow_key(1))
+        self.tree.bind('<Prior>', lambda e: self.scroll_by(-self.visible_rows))
+        self.tree.bind('<Next>', lambda e: self.scroll_by(self.visible_rows))
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<Button-1>', self.on_click, add='+')
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+    
+    # ===== 数据 =====
+    
+    def reload(self):
+        """重新读取记录数并刷新可见区域（保持当前滚动位置）"""
+        self.total = self.file_manager.get_expense_count()
+        self._page_rows = []
+        self.render()
+    
+    def _ensure_page(self):
+        """确保可见区域的数据已经取到，不在缓存范围内时重新取一页"""
+        page_end = self._page_start + len(self._page_rows)
+        visible_end = min(self.offset + self.visible_rows, self.total)
+        if self._page_rows and self._page_start <= self.offset and visible_end <= page_end:
+            return
+        
+        self._page_start = max(0, self.offset - self.buffer_rows)
+        limit = self.visible_rows + 2 * self.buffer_rows
+        self._page_rows = self.file_manager.get_expenses_page(
+            self._page_start, limit, self.sort_by, self.descending)
+    
+    def _format_row(self, expense):
+        """把费用记录格式化为表格行"""
+        expense_type = EXPENSE_TYPES.get(expense.get('expense_type', 'other'), 
+                                       expense.get('expense_type', '其他费用'))
+        return (
+            expense['id'],
+            expense.get('date', expense.get('expense_date', '')),
+            expense_type,
+            expense['name'],
+            expense.get('quantity', '') or '-',
+            expense.get('unit_price', '') or '-',
+            f"{expense['total_amount']:.2f}",
+            expense.get('notes', '') or ''
+        )
+    
+    # ===== 绘制 =====
+    
+    def render(self):
+        """把可见区域的数据写入表格（复用已有的行）"""
+        self.offset = max(0, min(self.offset, self.total - self.visible_rows))
+        self._ensure_page()
+        
+        start = self.offset - self._page_start
+        rows = self._page_rows[start:start + self.visible_rows]
+        
+        self._rendering = True
+        try:
+            items = list(self.tree.get_children())
+            for item in items[len(rows):]:
+                self.tree.delete(item)
+            
+            selected = []
+            for i, expense in enumerate(rows):
+                values = self._format_row(expense)
+                if i < len(items):
+                    self.tree.item(items[i], values=values)
+                    item = items[i]
+                else:
+                    item = self.tree.insert('', tk.END, values=values)
+                if expense['id'] in self.selected_ids:
+                    selected.append(item)
+            self.tree.selection_set(selected)
+        finally:
+            self._rendering = False
+        
+        self._update_scrollbar(len(rows))
+    
+    def _update_scrollbar(self, shown):
+        """更新滚动条位置和记录数显示"""
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, (self.offset + shown) / self.total)
+            self.count_var.set(f"共 {self.total} 条记录，显示第 {self.offset + 1}-{self.offset + shown} 条")
+        else:
+            self.scrollbar.set(0, 1)
+            self.count_var.set("共 0 条记录")
+    
+    # ===== 滚动 =====
+    
+    def scroll_to(self, offset):
+        """滚动到指定位置"""
+        offset = max(0, min(int(offset), self.total - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+    
+    def scroll_by(self, rows):
+        """滚动若干行"""
+        return self.scroll_to(self.offset + rows)
+    
+    def on_scrollbar(self, *args):
+        """滚动条回调：moveto / scroll"""
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.visible_rows
+            self.scroll_by(step)
+    
+    def on_mouse_wheel(self, event):
+        """鼠标滚轮（Windows / macOS）"""
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll_by(-3 * delta)
+    
+    def on_arrow_key(self, step):
+        """方向键移动到可见区域边缘时继续滚动"""
+        items = self.tree.get_children()
+        focus = self.tree.focus()
+        if not items or focus not in items:
+            return None
+        
+        index = items.index(focus) + step
+        if 0 <= index < len(items):
+            return None  # 可见区域内由Treeview自己处理
+        
+        self.scroll_by(step)
+        items = self.tree.get_children()
+        if items:
+            edge = items[0] if step < 0 else items[-1]
+            self.tree.focus(edge)
+            self.selected_ids = {self.tree.item(edge)['values'][0]}
+            self.tree.selection_set(edge)
+        return "break"
+    
+    def on_configure(self, event):
+        """控件高度变化时重新计算可见行数"""
+        items = self.tree.get_children()
+        bbox = self.tree.bbox(items[0]) if items else None
+        if not bbox:
+            return
+        
+        header_height, row_height = bbox[1], bbox[3]
+        visible_rows = max(1, (event.height - header_height) // max(1, row_height))
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+    
+    # ===== 排序与选择 =====
+    
+    def sort(self, field):
+        """点击列标题排序，再次点击切换升序/降序"""
+        if self.sort_by == field:
+            self.descending = not self.descending
+        else:
+            self.sort_by = field
+            self.descending = False
+        
+        for col, sort_field in zip(self.COLUMNS, self.SORT_FIELDS):
+            arrow = (' ▼' if self.descending else ' ▲') if sort_field == field else ''
+            self.tree.heading(col, text=col + arrow)
+        
+        self.offset = 0
+        self.reload()
+    
+    def on_click(self, event):
+        """记录本次点击是否按住Shift/Ctrl（扩展选择）"""
+        self._extend_selection = bool(event.state & 0x0005)
+    
+    def on_select(self, event):
+        """用户选择变化时同步选中的记录ID"""
+        if self._rendering:
+            return
+        
+        visible_ids = {self.tree.item(item)['values'][0]: item for item in self.tree.get_children()}
+        selected = set(self.tree.selection())
+        if not self._extend_selection:
+            self.selected_ids = set()
+        for expense_id, item in visible_ids.items():
+            if item in selected:
+                self.selected_ids.add(expense_id)
+            else:
+                self.selected_ids.discard(expense_id)
+        self._extend_selection = False
+    
+    def get_selected_ids(self):
+        """获取选中的费用记录ID（按ID排序）"""
+        return sorted(self.selected_ids)
+    
+    def clear(self):
+        """清空表格（关闭项目时）"""
+        self.total = 0
+        self.offset = 0
+        self.selected_ids = set()
+        self._page_rows = []
+        self.render()
+
 # ===== 对话框类 =====
 
+def close_dialog(owner):
+    """关闭对话框（保存仍在后台进行时忽略）"""
+    if not owner.saving:
+        owner.dialog.destroy()
+
+
+def submit_dialog_save(owner, func, *args, description="", on_done=None):
+    """在后台线程执行对话框的保存操作，不阻塞界面
+    
+    保存期间再次点击保存或关闭对话框都会被忽略；完成后在主线程调用 on_done(结果)。
+    """
+    if owner.saving:
+        return
+    owner.saving = True
+    
+    def finish(result):
+        owner.saving = False
+        on_done(result)
+    
+    def fail(error):
+        owner.saving = False
+        messagebox.showerror("错误", f"保存失败: {str(error)}", parent=owner.dialog)
+    
+    owner.io.submit(func, *args, description=description, on_success=finish, on_error=fail)
+
+
 class CreateProjectDialog:
     """创建项目对话框"""
-    def __init__(self, parent, file_manager):
+    def __init__(self, parent, file_manager, io):
         self.file_manager = file_manager
+        self.io = io
         self.result = False
+        self.saving = False
         
         # 创建对话框
         self.dialog = tk.Toplevel(parent)
@@ -806,6 +1288,7 @@ class CreateProjectDialog:
         self.dialog.geometry("400x200")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: close_dialog(self))
         
         # 创建界面
         self.create_interface()
@@ -836,7 +1319,7 @@ class CreateProjectDialog:
         button_frame.grid(row=2, column=0, columnspan=2, pady=20)
         
         ttk.Button(button_frame, text="创建", command=self.create_project).pack(side=tk.LEFT, padx=10)
-        ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="取消", command=lambda: close_dialog(self)).pack(side=tk.LEFT, padx=10)
         
         # 配置网格权重
         main_frame.columnconfigure(1, weight=1)
@@ -858,21 +1341,27 @@ class CreateProjectDialog:
                 messagebox.showwarning("提示", "请输入项目名称")
                 return
             
-            if self.file_manager.create_project(project_name, description):
-                self.result = True
-                self.dialog.destroy()
-            else:
-                messagebox.showerror("错误", "创建项目失败")
+            submit_dialog_save(self, self.file_manager.create_project, project_name, description,
+                               description=f"正在创建项目 {project_name}", on_done=self._on_created)
         
         except Exception as e:
             messagebox.showerror("错误", f"创建项目失败: {str(e)}")
+    
+    def _on_created(self, created):
+        if created:
+            self.result = True
+            self.dialog.destroy()
+        else:
+            messagebox.showerror("错误", "创建项目失败", parent=self.dialog)
 
 class AddExpenseDialog:
     """添加费用记录对话框"""
-    def __init__(self, parent, file_manager, calculator):
+    def __init__(self, parent, file_manager, calculator, io):
         self.file_manager = file_manager
         self.calculator = calculator
+        self.io = io
         self.result = False
+        self.saving = False
         
         # 创建对话框
         self.dialog = tk.Toplevel(parent)
@@ -880,6 +1369,7 @@ class AddExpenseDialog:
         self.dialog.geometry("500x550")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: close_dialog(self))
         
         # 创建界面
         self.create_interface()
@@ -955,7 +1445,7 @@ class AddExpenseDialog:
         
         ttk.Button(button_frame, text="计算", command=self.calculate_amount).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="保存", command=self.save_expense).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="取消", command=lambda: close_dialog(self)).pack(side=tk.LEFT, padx=5)
         
         # 加载公式
         self.load_formulas()
@@ -1033,6 +1523,9 @@ class AddExpenseDialog:
         try:
             selected_formula = self.formula_combo.get()
             
+            # 记录金额来源的公式和参数，保存时写入费用记录
+            self.formula_source = None
+            
             # 如果选择了公式
             if selected_formula and hasattr(self, 'param_vars'):
                 # 收集参数值
@@ -1054,6 +1547,7 @@ class AddExpenseDialog:
                     # 获取公式表达式
                     formulas = self.file_manager.get_all_formulas()
                     formula_expression = None
+                    formula_id = None
                     for formula in formulas:
                         formula_name = formula.get('name', '未命名公式')
                         if formula.get('is_custom', False):
@@ -1061,11 +1555,13 @@ class AddExpenseDialog:
                         
                         if formula_name == selected_formula:
                             formula_expression = formula.get('expression')
+                            formula_id = formula.get('id')
                             break
                     
                     if formula_expression:
                         amount = self.calculator.calculate_expense(formula_expression, params)
                         self.result_var.set(f"总金额: {amount:.2f}")
+                        self.formula_source = (formula_id, params)
                         return
             
             # 如果手动输入了金额
@@ -1135,29 +1631,256 @@ class AddExpenseDialog:
                 except ValueError:
                     messagebox.showwarning("提示", "单价格式错误，已忽略")
             
+            # 记录计算所用的公式和参数，公式修改后可以只重新计算这些记录
+            formula_source = getattr(self, 'formula_source', None)
+            if formula_source and formula_source[0] is not None:
+                expense_data['formula_id'] = formula_source[0]
+                expense_data['params'] = dict(formula_source[1])
+            
             date = self.date_var.get().strip()
             if date:
                 # 简单日期验证
-                if len(date) == 10 and date[4] == '-' and date[7] == '-':
+                if len(date) == 10 and date[4] == '-' and day_of(date) == date:
                     expense_data['date'] = date
                 else:
                     messagebox.showwarning("提示", "日期格式错误，已忽略")
             
-            # 保存到文件
-            expense_id = self.file_manager.add_expense(expense_data)
-            if expense_id:
-                self.result = True
-                self.dialog.destroy()
-            else:
-                messagebox.showerror("错误", "保存失败")
+            # 保存到文件（后台执行）
+            submit_dialog_save(self, self.file_manager.add_expense, expense_data,
+                               description="正在保存费用记录", on_done=self._on_saved)
         
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
+    
+    def _on_saved(self, expense_id):
+        if expense_id:
+            self.result = True
+            self.dialog.destroy()
+        else:
+            messagebox.showerror("错误", "保存失败", parent=self.dialog)
+
+class PortfolioDialog:
+    """组合统计对话框 - 按项目、类型、自定义类型和月份显示全部项目的费用合计"""
+    def __init__(self, parent, stats):
+        self.stats = stats
+        
+        # 创建对话框
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("组合统计（全部项目）")
+        self.dialog.geometry("640x480")
+        self.dialog.transient(parent)
+        
+        # 创建界面
+        self.create_interface()
+        
+        # 居中显示
+        self.center_dialog(parent)
+    
+    def create_interface(self):
+        """创建对话框界面"""
+        main_frame = ttk.Frame(self.dialog, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # 顶部：总体统计
+        overall = self.stats['overall']
+        summary = (f"项目数: {overall['project_count']}    总记录数: {overall['total_count']}    "
+                   f"总费用: {overall['grand_total']:.2f}    平均费用: {overall['avg_amount']:.2f}")
+        ttk.Label(main_frame, text=summary, font=('Arial', 10, 'bold')).pack(anchor=tk.W, pady=(0, 10))
+        
+        # 中间：分组统计
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        
+        grand_total = overall['grand_total']
+        tabs = [
+            ("按项目", '项目', 'name', self.stats['by_project']),
+            ("按类型", '费用类型', 'expense_type', self.stats['by_type']),
+            ("按自定义类型", '自定义类型', 'type_name', self.stats['by_custom_type']),
+            ("按月份", '月份', 'month', self.stats['by_month'])
+        ]
+        for title, key_heading, key, rows in tabs:
+            frame = ttk.Frame(notebook, padding="5")
+            notebook.add(frame, text=title)
+            self.create_table(frame, key_heading, key, rows, grand_total)
+        
+        # 底部：关闭按钮
+        ttk.Button(main_frame, text="关闭", command=self.dialog.destroy).pack(pady=(10, 0))
+    
+    def create_table(self, frame, key_heading, key, rows, grand_total):
+        """创建一个分组统计表格"""
+        columns = (key_heading, '记录数', '金额', '占比')
+        tree = ttk.Treeview(frame, columns=columns, show='headings')
+        
+        column_widths = [200, 100, 150, 80]
+        for col, width in zip(columns, column_widths):
+            tree.heading(col, text=col)
+            tree.column(col, width=width, minwidth=50, anchor=tk.W if col == key_heading else tk.E)
+        
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        
+        for row in rows:
+            percentage = (row['total_amount'] / grand_total * 100) if grand_total > 0 else 0
+            tree.insert('', tk.END, values=(
+                row[key] or '未填写',
+                row['count'],
+                f"{row['total_amount']:.2f}",
+                f"{percentage:.1f}%"
+            ))
+    
+    def center_dialog(self, parent):
+        """居中显示对话框"""
+        self.dialog.update_idletasks()
+        x = parent.winfo_rootx() + (parent.winfo_width() - self.dialog.winfo_width()) // 2
+        y = parent.winfo_rooty() + (parent.winfo_height() - self.dialog.winfo_height()) // 2
+        self.dialog.geometry(f"+{x}+{y}")
+
+class ExpenseTrendDialog:
+    """费用趋势对话框 - 按日/月/季度显示费用合计、累计支出和消耗速率（最近3个周期的平均支出）"""
+    GRANULARITIES = {'按月': 'month', '按季度': 'quarter', '按日': 'day'}
+    
+    def __init__(self, parent, file_manager, project_name):
+        self.file_manager = file_manager
+        
+        # 创建对话框
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(f"费用趋势 - {project_name}")
+        self.dialog.geometry("720x560")
+        self.dialog.transient(parent)
+        
+        # 创建界面
+        self.create_interface()
+        
+        # 居中显示
+        self.center_dialog(parent)
+        
+        # 加载数据
+        self.load_series()
+    
+    def create_interface(self):
+        """创建对话框界面"""
+        main_frame = ttk.Frame(self.dialog, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # 顶部：粒度和类型筛选
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(filter_frame, text="时间粒度:").pack(side=tk.LEFT)
+        self.granularity_var = tk.StringVar(value='按月')
+        granularity_combo = ttk.Combobox(filter_frame, textvariable=self.granularity_var, width=8,
+                                         values=list(self.GRANULARITIES.keys()), state='readonly')
+        granularity_combo.pack(side=tk.LEFT, padx=(5, 15))
+        granularity_combo.bind('<<ComboboxSelected>>', lambda e: self.load_series())
+        
+        ttk.Label(filter_frame, text="费用类型:").pack(side=tk.LEFT)
+        self.type_var = tk.StringVar(value='全部')
+        type_combo = ttk.Combobox(filter_frame, textvariable=self.type_var, width=12,
+                                  values=['全部'] + list(EXPENSE_TYPES.values()), state='readonly')
+        type_combo.pack(side=tk.LEFT, padx=5)
+        type_combo.bind('<<ComboboxSelected>>', lambda e: self.load_series())
+        
+        self.summary_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.summary_var, font=('Arial', 10, 'bold')).pack(anchor=tk.W)
+        
+        # 中间：柱状图
+        self.canvas = tk.Canvas(main_frame, height=180, background='white')
+        self.canvas.pack(fill=tk.X, pady=(5, 10))
+        self.canvas.bind('<Configure>', lambda e: self.draw_chart())
+        
+        # 表格
+        table_frame = ttk.Frame(main_frame)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ('周期', '记录数', '金额', '累计', '消耗速率')
+        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings')
+        for col, width in zip(columns, [120, 80, 130, 150, 130]):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=width, minwidth=50, anchor=tk.W if col == '周期' else tk.E)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        table_frame.columnconfigure(0, weight=1)
+        table_frame.rowconfigure(0, weight=1)
+        
+        # 底部：关闭按钮
+        ttk.Button(main_frame, text="关闭", command=self.dialog.destroy).pack(pady=(10, 0))
+    
+    def load_series(self):
+        """按当前筛选条件读取汇总序列"""
+        type_name = self.type_var.get()
+        expense_type = next((code for code, name in EXPENSE_TYPES.items() if name == type_name), None)
+        self.series = self.file_manager.get_expense_time_series(
+            self.GRANULARITIES[self.granularity_var.get()], expense_type=expense_type)
+        
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        for row in self.series:
+            self.tree.insert('', tk.END, values=(
+                row['period'],
+                row['count'],
+                f"{row['total_amount']:.2f}",
+                f"{row['cumulative']:.2f}",
+                f"{row['burn_rate']:.2f}"
+            ))
+        
+        if self.series:
+            latest = self.series[-1]
+            self.summary_var.set(f"{len(self.series)} 个周期    累计支出: {latest['cumulative']:.2f}    "
+                                 f"当前消耗速率: {latest['burn_rate']:.2f} / 周期")
+        else:
+            self.summary_var.set("暂无带日期的费用记录")
+        self.draw_chart()
+    
+    def draw_chart(self):
+        """绘制每个周期金额的柱状图和消耗速率折线"""
+        self.canvas.delete('all')
+        series = getattr(self, 'series', None)
+        if not series:
+            return
+        
+        width = max(self.canvas.winfo_width(), 100)
+        height = max(self.canvas.winfo_height(), 100)
+        margin = 20
+        peak = max(max(row['total_amount'] for row in series), max(row['burn_rate'] for row in series))
+        if peak <= 0:
+            return
+        
+        step = (width - 2 * margin) / len(series)
+        scale = (height - 2 * margin) / peak
+        points = []
+        for i, row in enumerate(series):
+            x0 = margin + i * step
+            self.canvas.create_rectangle(x0 + step * 0.15, height - margin - row['total_amount'] * scale,
+                                         x0 + step * 0.85, height - margin, fill='#4a90d9', outline='')
+            points.extend((x0 + step / 2, height - margin - row['burn_rate'] * scale))
+        if len(points) >= 4:
+            self.canvas.create_line(*points, fill='#d9534f', width=2)
+        
+        self.canvas.create_line(margin, height - margin, width - margin, height - margin)
+        self.canvas.create_text(margin, height - margin + 10, text=series[0]['period'], anchor=tk.W)
+        self.canvas.create_text(width - margin, height - margin + 10, text=series[-1]['period'], anchor=tk.E)
+        self.canvas.create_text(margin, 8, text=f"最高 {peak:.2f}（柱：金额，线：消耗速率）", anchor=tk.W)
+    
+    def center_dialog(self, parent):
+        """居中显示对话框"""
+        self.dialog.update_idletasks()
+        x = parent.winfo_rootx() + (parent.winfo_width() - self.dialog.winfo_width()) // 2
+        y = parent.winfo_rooty() + (parent.winfo_height() - self.dialog.winfo_height()) // 2
+        self.dialog.geometry(f"+{x}+{y}")
 
 class CustomTypeManagementDialog:
     """自定义类型管理对话框"""
-    def __init__(self, parent, file_manager):
+    def __init__(self, parent, file_manager, io):
         self.file_manager = file_manager
+        self.io = io
         self.result = False
         
         # 创建对话框
@@ -1259,7 +1982,7 @@ class CustomTypeManagementDialog:
     
     def add_custom_type(self):
         """添加自定义类型"""
-        dialog = CustomTypeEditDialog(self.dialog, self.file_manager)
+        dialog = CustomTypeEditDialog(self.dialog, self.file_manager, self.io)
         self.dialog.wait_window(dialog.dialog)
         
         if dialog.result:
@@ -1276,18 +1999,13 @@ class CustomTypeManagementDialog:
         type_id = self.custom_types_tree.item(selected_items[0])['values'][0]
         
         # 获取类型详情
-        custom_types = self.file_manager.get_all_custom_expense_types()
-        type_data = None
-        for custom_type in custom_types:
-            if custom_type.get('id') == type_id:
-                type_data = custom_type
-                break
+        type_data = self.file_manager.get_custom_expense_type_by_id(type_id)
         
         if not type_data:
             messagebox.showerror("错误", "找不到选中的类型")
             return
         
-        dialog = CustomTypeEditDialog(self.dialog, self.file_manager, type_data)
+        dialog = CustomTypeEditDialog(self.dialog, self.file_manager, self.io, type_data)
         self.dialog.wait_window(dialog.dialog)
         
         if dialog.result:
@@ -1318,10 +2036,12 @@ class CustomTypeManagementDialog:
 
 class CustomTypeEditDialog:
     """自定义类型编辑对话框"""
-    def __init__(self, parent, file_manager, type_data=None):
+    def __init__(self, parent, file_manager, io, type_data=None):
         self.file_manager = file_manager
+        self.io = io
         self.type_data = type_data  # 如果为None，则是新增；否则是编辑
         self.result = False
+        self.saving = False
         
         # 创建对话框
         self.dialog = tk.Toplevel(parent)
@@ -1329,6 +2049,7 @@ class CustomTypeEditDialog:
         self.dialog.geometry("400x300")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: close_dialog(self))
         
         # 创建界面
         self.create_interface()
@@ -1370,7 +2091,7 @@ class CustomTypeEditDialog:
         button_frame.grid(row=3, column=0, columnspan=2, pady=20)
         
         ttk.Button(button_frame, text="保存", command=self.save_custom_type).pack(side=tk.LEFT, padx=10)
-        ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="取消", command=lambda: close_dialog(self)).pack(side=tk.LEFT, padx=10)
         
         # 配置网格权重
         main_frame.columnconfigure(1, weight=1)
@@ -1413,20 +2134,24 @@ class CustomTypeEditDialog:
                 messagebox.showinfo("提示", "更新功能将在后续版本中实现")
                 self.result = False
             else:  # 新增模式
-                type_id = self.file_manager.add_custom_expense_type(type_data)
-                if type_id:
-                    self.result = True
-                    self.dialog.destroy()
-                else:
-                    messagebox.showerror("错误", "保存失败")
+                submit_dialog_save(self, self.file_manager.add_custom_expense_type, type_data,
+                                   description="正在保存自定义类型", on_done=self._on_saved)
         
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
+    
+    def _on_saved(self, type_id):
+        if type_id:
+            self.result = True
+            self.dialog.destroy()
+        else:
+            messagebox.showerror("错误", "保存失败", parent=self.dialog)
 
 class FormulaManagementDialog:
     """公式管理对话框"""
-    def __init__(self, parent, file_manager):
+    def __init__(self, parent, file_manager, io):
         self.file_manager = file_manager
+        self.io = io
         self.result = False
         
         # 创建对话框
@@ -1533,7 +2258,7 @@ class FormulaManagementDialog:
     
     def add_formula(self):
         """添加自定义公式"""
-        dialog = FormulaEditDialog(self.dialog, self.file_manager)
+        dialog = FormulaEditDialog(self.dialog, self.file_manager, self.io)
         self.dialog.wait_window(dialog.dialog)
         
         if dialog.result:
@@ -1550,12 +2275,7 @@ class FormulaManagementDialog:
         formula_id = self.formulas_tree.item(selected_items[0])['values'][0]
         
         # 获取公式详情
-        formulas = self.file_manager.get_all_formulas()
-        formula_data = None
-        for formula in formulas:
-            if formula.get('id') == formula_id:
-                formula_data = formula
-                break
+        formula_data = self.file_manager.get_formula_by_id(formula_id)
         
         if not formula_data:
             messagebox.showerror("错误", "找不到选中的公式")
@@ -1566,7 +2286,7 @@ class FormulaManagementDialog:
             messagebox.showwarning("提示", "预定义公式不能编辑")
             return
         
-        dialog = FormulaEditDialog(self.dialog, self.file_manager, formula_data)
+        dialog = FormulaEditDialog(self.dialog, self.file_manager, self.io, formula_data)
         self.dialog.wait_window(dialog.dialog)
         
         if dialog.result:
@@ -1584,12 +2304,8 @@ class FormulaManagementDialog:
         formula_name = self.formulas_tree.item(selected_items[0])['values'][1]
         
         # 检查是否为预定义公式
-        formulas = self.file_manager.get_all_formulas()
-        is_custom = False
-        for formula in formulas:
-            if formula.get('id') == formula_id:
-                is_custom = formula.get('is_custom', False)
-                break
+        formula = self.file_manager.get_formula_by_id(formula_id)
+        is_custom = bool(formula and formula.get('is_custom', False))
         
         if not is_custom:
             messagebox.showwarning("提示", "预定义公式不能删除")
@@ -1608,10 +2324,12 @@ class FormulaManagementDialog:
 
 class FormulaEditDialog:
     """公式编辑对话框"""
-    def __init__(self, parent, file_manager, formula_data=None):
+    def __init__(self, parent, file_manager, io, formula_data=None):
         self.file_manager = file_manager
+        self.io = io
         self.formula_data = formula_data  # 如果为None，则是新增；否则是编辑
         self.result = False
+        self.saving = False
         
         # 创建对话框
         self.dialog = tk.Toplevel(parent)
@@ -1619,6 +2337,7 @@ class FormulaEditDialog:
         self.dialog.geometry("500x400")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", lambda: close_dialog(self))
         
         # 创建界面
         self.create_interface()
@@ -1680,7 +2399,7 @@ class FormulaEditDialog:
         button_frame.grid(row=5, column=0, columnspan=2, pady=10)
         
         ttk.Button(button_frame, text="保存", command=self.save_formula).pack(side=tk.LEFT, padx=10)
-        ttk.Button(button_frame, text="取消", command=self.dialog.destroy).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="取消", command=lambda: close_dialog(self)).pack(side=tk.LEFT, padx=10)
         
         # 配置网格权重
         main_frame.columnconfigure(1, weight=1)
@@ -1717,6 +2436,11 @@ class FormulaEditDialog:
             params_str = self.params_var.get().strip()
             params = [p.strip() for p in params_str.split(',')] if params_str else []
             
+            # 校验表达式：只允许数学运算，且变量必须都在参数列表中声明
+            if not get_calculator().validate_formula_expression(expression, params):
+                messagebox.showwarning("提示", "表达式无效：只能使用数学运算和函数，且用到的变量必须在参数列表中声明")
+                return
+            
             description = self.desc_var.get().strip()
             
             formula_data = {
@@ -1726,21 +2450,32 @@ class FormulaEditDialog:
                 'description': description
             }
             
-            # 保存到文件管理器
+            # 保存到文件管理器（后台执行，修改公式时会重新计算相关费用记录）
             if self.formula_data:  # 编辑模式
-                # TODO: 实现更新公式的功能
-                messagebox.showinfo("提示", "更新功能将在后续版本中实现")
-                self.result = False
+                submit_dialog_save(self, self.file_manager.update_custom_formula, self.formula_data['id'],
+                                   formula_data, description="正在保存公式", on_done=self._on_updated)
             else:  # 新增模式
-                formula_id = self.file_manager.add_custom_formula(formula_data)
-                if formula_id:
-                    self.result = True
-                    self.dialog.destroy()
-                else:
-                    messagebox.showerror("错误", "保存失败")
+                submit_dialog_save(self, self.file_manager.add_custom_formula, formula_data,
+                                   description="正在保存公式", on_done=self._on_added)
         
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
+    
+    def _on_updated(self, recalculated):
+        if recalculated is None:
+            messagebox.showerror("错误", "保存失败", parent=self.dialog)
+            return
+        self.result = True
+        if recalculated:
+            messagebox.showinfo("提示", f"公式已更新，已重新计算 {recalculated} 条相关费用记录", parent=self.dialog)
+        self.dialog.destroy()
+    
+    def _on_added(self, formula_id):
+        if formula_id:
+            self.result = True
+            self.dialog.destroy()
+        else:
+            messagebox.showerror("错误", "保存失败", parent=self.dialog)
 
 def main():
     """主函数"""